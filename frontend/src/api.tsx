@@ -15,6 +15,7 @@ export interface PrintStatusAPIResponse {
   layer_count?: number;
   print_time_secs?: number;
   time_left_secs?: number;
+  status_age_secs?: number;
 }
 
 export interface DirectoryAPIResponse {
@@ -26,11 +27,16 @@ export interface FileAPIResponse {
   path: string;
   print_time_secs?: number;
   can_be_printed: boolean;
+  // set while the file is still waiting to be processed by the server
+  pending?: boolean;
 }
 
 export interface FileListAPIResponse {
-  directories: [DirectoryAPIResponse];
-  files: [FileAPIResponse];
+  directories: DirectoryAPIResponse[];
+  files: FileAPIResponse[];
+  total_files?: number;
+  // offset of the next page of files, or null if this is the last one
+  next_offset?: number | null;
 }
 
 export interface FileDetailsAPIResponse {
@@ -42,6 +48,7 @@ export interface FileDetailsAPIResponse {
   layer_height_mm: number;
   resolution: [number, number];
   print_time_secs: number;
+  preview_version: string;
 }
 
 function isAxiosError(error: Error): error is AxiosError {
@@ -62,10 +69,34 @@ export class API {
     }
   }
 
-  async listFiles(path: string): Promise<FileListAPIResponse | undefined> {
+  // Subscribes to print status updates pushed by the server. Returns a function
+  // which ends the subscription, or undefined if the browser doesn't support
+  // server-sent events. onError is called whenever the stream gets interrupted,
+  // so callers can fall back to polling until updates arrive again.
+  subscribeToPrintStatus(
+    onStatus: (status: PrintStatusAPIResponse) => void,
+    onError: () => void
+  ): (() => void) | undefined {
+    if (typeof EventSource === "undefined") {
+      return undefined;
+    }
+    const eventSource = new EventSource("api/print_status/stream");
+    eventSource.onmessage = (event: MessageEvent) => {
+      onStatus(JSON.parse(event.data));
+    };
+    eventSource.onerror = () => onError();
+    return () => eventSource.close();
+  }
+
+  async listFiles(
+    path: string,
+    offset?: number,
+    limit?: number
+  ): Promise<FileListAPIResponse | undefined> {
     try {
       const response: AxiosResponse<FileListAPIResponse> = await axios.get(
-        `api/list_files?path=${path}`
+        `api/list_files?path=${path}`,
+        { params: { offset, limit } }
       );
       return response.data;
     } catch (error) {
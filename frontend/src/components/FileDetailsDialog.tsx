@@ -71,7 +71,9 @@ class FileDetails extends React.Component<FileDetailsProps, FileDetailsState> {
     }
 
     const data = nullthrows(this.state.data);
-    const imgURL = `api/file_preview?filename=${data.path}`;
+    const imgURL = `api/file_preview?filename=${encodeURIComponent(
+      data.path
+    )}&v=${data.preview_version}`;
 
     return (
       <React.Fragment>
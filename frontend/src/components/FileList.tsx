@@ -62,6 +62,8 @@ function FileListItem({
 
   const printTime = file.print_time_secs
     ? renderTime(file.print_time_secs)
+    : file.pending
+    ? "Processing..."
     : null;
   const navigate = useNavigate();
   const api = useAPI();
@@ -96,6 +98,10 @@ function FileListItem({
   );
 }
 
+const PENDING_FILES_REFRESH_INTERVAL_MS = 2000;
+// directories with thousands of files are listed a page at a time
+const FILES_PAGE_SIZE = 50;
+
 export interface FileListState {
   isLoading: boolean;
   path: string;
@@ -119,18 +125,54 @@ class FileList extends React.Component<
     isLoading: true,
     path: "",
   };
+  pendingRefreshTimeoutID: number | undefined;
 
   async refresh(): Promise<void> {
+    window.clearTimeout(this.pendingRefreshTimeoutID);
+    this.pendingRefreshTimeoutID = undefined;
     // FIXME: this is kind of nasty, it's just here because FileList sometimes
     // fails to render on storybook, which makes the storyshot tests for this
     // component fail when they run
     await sleep(0);
-    const response = await this.props.api.listFiles(this.state.path);
-    if (response) {
+    const path = this.state.path;
+    // pages which were loaded already are refreshed as well
+    const limit = Math.max(
+      FILES_PAGE_SIZE,
+      this.state.data ? this.state.data.files.length : 0
+    );
+    const response = await this.props.api.listFiles(path, 0, limit);
+    if (response && path === this.state.path) {
       this.setState({
         isLoading: false,
         data: response,
       });
+      // some files are still being processed by the server, so we refresh the
+      // list again in a bit to get their details
+      if (response.files.some((file) => file.pending)) {
+        this.pendingRefreshTimeoutID = window.setTimeout(
+          async () => await this.refresh(),
+          PENDING_FILES_REFRESH_INTERVAL_MS
+        );
+      }
+    }
+  }
+
+  async loadMore(): Promise<void> {
+    const path = this.state.path;
+    const data = nullthrows(this.state.data);
+    const response = await this.props.api.listFiles(
+      path,
+      nullthrows(data.next_offset),
+      FILES_PAGE_SIZE
+    );
+    if (response && path === this.state.path) {
+      this.setState((state, _props) => ({
+        data: {
+          ...response,
+          directories: nullthrows(state.data).directories,
+          files: [...nullthrows(state.data).files, ...response.files],
+        },
+      }));
     }
   }
 
@@ -138,6 +180,10 @@ class FileList extends React.Component<
     await this.refresh();
   }
 
+  componentWillUnmount() {
+    window.clearTimeout(this.pendingRefreshTimeoutID);
+  }
+
   _renderContent(): React.ReactElement {
     if (this.state.isLoading) {
       return (
@@ -147,7 +193,9 @@ class FileList extends React.Component<
       );
     }
 
-    const { directories, files } = nullthrows(this.state.data);
+    const { directories, files, total_files, next_offset } = nullthrows(
+      this.state.data
+    );
     const directoryListItems = directories.map((directory) => (
       <DirectoryListItem
         directory={directory}
@@ -190,11 +238,22 @@ class FileList extends React.Component<
         />
       ) : null;
 
+    const loadMoreItem =
+      next_offset != null ? (
+        <ListItem button key="load-more" onClick={() => this.loadMore()}>
+          <ListItemText
+            primary="Load more files"
+            secondary={`${files.length} of ${total_files}`}
+          />
+        </ListItem>
+      ) : null;
+
     return (
       <List>
         {parentDirectoryItem}
         {directoryListItems}
         {fileListItems}
+        {loadMoreItem}
       </List>
     );
   }
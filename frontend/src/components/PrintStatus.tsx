@@ -16,7 +16,7 @@ import StopIcon from "@material-ui/icons/Stop";
 import nullthrows from "nullthrows";
 import React from "react";
 import { Link } from "react-router-dom";
-import { withAPI, WithAPIProps } from "../api";
+import { PrintStatusAPIResponse, withAPI, WithAPIProps } from "../api";
 import { getPrinterDisplayName, renderTime, sleep } from "../utils";
 
 const styles = () =>
@@ -70,12 +70,14 @@ export interface PrintStatusState {
 }
 
 const WAIT_BEFORE_REFRESHING_STATUS_MS = 250;
+const POLLING_INTERVAL_MS = 60 * 1000;
 
 class PrintStatus extends React.Component<
   WithStyles<typeof styles> & WithAPIProps,
   PrintStatusState
 > {
   intervalID: number | undefined;
+  unsubscribe: (() => void) | undefined;
 
   state: PrintStatusState = {
     isLoading: true,
@@ -87,31 +89,58 @@ class PrintStatus extends React.Component<
     await sleep(waitMs);
     const response = await this.props.api.printStatus();
     if (response) {
-      this.setState({
-        isLoading: false,
-        data: {
-          state: toPrinterState(response.state),
-          progress: response.progress,
-          selectedFile: response.selected_file,
-          currentLayer: response.current_layer,
-          layerCount: response.layer_count,
-          printTimeSecs: response.print_time_secs,
-          timeLeftSecs: response.time_left_secs,
-        },
-      });
+      this._setStatus(response);
     }
   }
 
-  async componentDidMount(): Promise<void> {
-    await this._refresh(0);
+  _setStatus(response: PrintStatusAPIResponse): void {
+    this.setState({
+      isLoading: false,
+      data: {
+        state: toPrinterState(response.state),
+        progress: response.progress,
+        selectedFile: response.selected_file,
+        currentLayer: response.current_layer,
+        layerCount: response.layer_count,
+        printTimeSecs: response.print_time_secs,
+        timeLeftSecs: response.time_left_secs,
+      },
+    });
+  }
+
+  _startPolling(): void {
+    if (this.intervalID !== undefined) {
+      return;
+    }
     this.intervalID = window.setInterval(
       async () => await this._refresh(0),
-      60 * 1000
+      POLLING_INTERVAL_MS
     );
   }
 
-  componentWillUnmount() {
+  _stopPolling(): void {
     window.clearInterval(this.intervalID);
+    this.intervalID = undefined;
+  }
+
+  async componentDidMount(): Promise<void> {
+    await this._refresh(0);
+    this.unsubscribe = this.props.api.subscribeToPrintStatus(
+      (response) => {
+        // updates are being pushed again, so there's no need to poll
+        this._stopPolling();
+        this._setStatus(response);
+      },
+      () => this._startPolling()
+    );
+    if (this.unsubscribe === undefined) {
+      this._startPolling();
+    }
+  }
+
+  componentWillUnmount() {
+    this.unsubscribe?.();
+    this._stopPolling();
   }
 
   _renderButtons(): React.ReactElement {
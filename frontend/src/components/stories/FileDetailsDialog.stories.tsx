@@ -21,6 +21,7 @@ const Template: Story = (_args) => {
     layer_height_mm: 0.05,
     resolution: [1440, 2560],
     print_time_secs: 5621,
+    preview_version: "da39a3ee5e6b4b0d3255bfef95601890afd80709",
   });
 
   const [open, setOpen] = React.useState(false);
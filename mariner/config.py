@@ -1,3 +1,4 @@
+import os
 from functools import lru_cache
 from pathlib import Path
 from typing import MutableMapping, Optional, Sequence
@@ -61,6 +62,14 @@ def get_printer_baudrate() -> int:
     return int(printer_config.get("baudrate", default_baudrate))
 
 
+def get_printer_status_poll_interval_secs() -> float:
+    default_interval_secs = 2.0
+    printer_config = _get_config().get("printer")
+    if not isinstance(printer_config, dict):
+        return default_interval_secs
+    return float(printer_config.get("status_poll_interval_secs", default_interval_secs))
+
+
 def get_http_host() -> str:
     default_host = "0.0.0.0"
     http_config = _get_config().get("http")
@@ -77,9 +86,33 @@ def get_http_port() -> int:
     return int(http_config.get("port", default_port))
 
 
+def get_http_threads() -> int:
+    default_threads = 16
+    http_config = _get_config().get("http")
+    if not isinstance(http_config, dict):
+        return default_threads
+    return int(http_config.get("threads", default_threads))
+
+
 def get_cache_directory() -> str:
     default_directory = "/tmp/mariner/"
     cache_config = _get_config().get("cache")
     if not isinstance(cache_config, dict):
         return default_directory
     return str(cache_config.get("directory", default_directory))
+
+
+def get_cache_bootstrapper_processes() -> int:
+    default_processes = os.cpu_count() or 1
+    cache_config = _get_config().get("cache")
+    if not isinstance(cache_config, dict):
+        return default_processes
+    return max(int(cache_config.get("bootstrapper_processes", default_processes)), 1)
+
+
+def get_cache_max_size_mb() -> int:
+    default_max_size_mb = 256
+    cache_config = _get_config().get("cache")
+    if not isinstance(cache_config, dict):
+        return default_max_size_mb
+    return int(cache_config.get("max_size_mb", default_max_size_mb))
@@ -26,5 +26,12 @@ class SlicedModelFile(ABC):
 
     @classmethod
     @abstractmethod
-    def read_preview(cls, path: pathlib.Path) -> png.Image:
+    def read_layer_table(cls, path: pathlib.Path) -> Sequence[int]:
+        ...
+
+    @classmethod
+    @abstractmethod
+    def read_preview(cls, path: pathlib.Path, low_res: bool = False) -> png.Image:
+        # sliced files carry a smaller preview as well, which is much cheaper to
+        # decode when only a thumbnail is needed
         ...
@@ -1,12 +1,17 @@
 import pathlib
-import struct
 from dataclasses import dataclass
-from typing import List
+from typing import Sequence
 
 import png
 from typedstruct import LittleEndianStruct, StructType
 
 from mariner.file_formats import SlicedModelFile
+from mariner.file_formats.layer_table import (
+    LazyLayerTable,
+    read_end_byte_offset_by_layer,
+)
+from mariner.file_formats.preview import read_rgb15_rle_image
+from mariner.file_formats.reader import SlicedFileReader
 
 
 @dataclass(frozen=True)
@@ -108,61 +113,18 @@ class CTBPreview(LittleEndianStruct):
     image_length: int = StructType.uint32()
 
 
-REPEAT_RGB15_MASK: int = 1 << 5
-
-
-def _read_image(width: int, height: int, data: bytes) -> png.Image:
-    array: List[List[int]] = [[]]
-
-    (i, x) = (0, 0)
-    while i < len(data):
-        color16 = int(struct.unpack_from("<H", data, i)[0])
-        i += 2
-        repeat = 1
-        if color16 & REPEAT_RGB15_MASK:
-            repeat += int(struct.unpack_from("<H", data, i)[0]) & 0xFFF
-            i += 2
-
-        (r, g, b) = (
-            (color16 >> 0) & 0x1F,
-            (color16 >> 6) & 0x1F,
-            (color16 >> 11) & 0x1F,
-        )
-
-        while repeat > 0:
-            array[-1] += [r, g, b]
-            repeat -= 1
-
-            x += 1
-            if x == width:
-                x = 0
-                array.append([])
-
-    array.pop()
-
-    return png.from_array(array, "RGB;5")
-
-
 @dataclass(frozen=True)
 class CTBFile(SlicedModelFile):
     @classmethod
-    def read(self, path: pathlib.Path) -> "CTBFile":
-        with open(str(path), "rb") as file:
-            ctb_header = CTBHeader.unpack(file.read(CTBHeader.get_size()))
-
-            file.seek(ctb_header.slicer_offset)
-            ctb_slicer = CTBSlicer.unpack(file.read(CTBSlicer.get_size()))
+    def read(cls, path: pathlib.Path) -> "CTBFile":
+        with SlicedFileReader.open(path) as reader:
+            ctb_header = reader.unpack(CTBHeader)
 
-            file.seek(ctb_slicer.machine_offset)
-            printer_name = file.read(ctb_slicer.machine_size).decode()
+            ctb_slicer = reader.unpack(CTBSlicer, ctb_header.slicer_offset)
 
-            end_byte_offset_by_layer = []
-            for layer in range(0, ctb_header.layer_count):
-                file.seek(ctb_header.layer_defs_offset + layer * CTBLayerDef.get_size())
-                layer_def = CTBLayerDef.unpack(file.read(CTBLayerDef.get_size()))
-                end_byte_offset_by_layer.append(
-                    layer_def.image_offset + layer_def.image_length
-                )
+            printer_name = reader.read_string(
+                ctb_slicer.machine_offset, ctb_slicer.machine_size
+            )
 
             return CTBFile(
                 filename=path.name,
@@ -176,7 +138,9 @@ class CTBFile(SlicedModelFile):
                 layer_count=ctb_header.layer_count,
                 resolution=(ctb_header.resolution_x, ctb_header.resolution_y),
                 print_time_secs=ctb_header.print_time,
-                end_byte_offset_by_layer=end_byte_offset_by_layer,
+                end_byte_offset_by_layer=LazyLayerTable(
+                    path, ctb_header.layer_count, cls
+                ),
                 slicer_version=".".join(
                     [
                         str(ctb_slicer.version_release),
@@ -189,14 +153,30 @@ class CTBFile(SlicedModelFile):
             )
 
     @classmethod
-    def read_preview(cls, path: pathlib.Path) -> png.Image:
-        with open(str(path), "rb") as file:
-            ctb_header = CTBHeader.unpack(file.read(CTBHeader.get_size()))
+    def read_layer_table(cls, path: pathlib.Path) -> Sequence[int]:
+        with SlicedFileReader.open(path) as reader:
+            ctb_header = reader.unpack(CTBHeader)
+            return read_end_byte_offset_by_layer(
+                reader,
+                CTBLayerDef,
+                ctb_header.layer_defs_offset,
+                ctb_header.layer_count,
+            )
 
-            file.seek(ctb_header.high_res_preview_offset)
-            preview = CTBPreview.unpack(file.read(CTBPreview.get_size()))
+    @classmethod
+    def read_preview(cls, path: pathlib.Path, low_res: bool = False) -> png.Image:
+        with SlicedFileReader.open(path) as reader:
+            ctb_header = reader.unpack(CTBHeader)
+
+            preview = reader.unpack(
+                CTBPreview,
+                ctb_header.low_res_preview_offset
+                if low_res
+                else ctb_header.high_res_preview_offset,
+            )
 
-            file.seek(preview.image_offset)
-            data = file.read(preview.image_length)
+            data = reader.read(preview.image_offset, preview.image_length)
 
-            return _read_image(preview.resolution_x, preview.resolution_y, data)
+            return read_rgb15_rle_image(
+                preview.resolution_x, preview.resolution_y, data
+            )
@@ -1,12 +1,17 @@
 import pathlib
-import struct
 from dataclasses import dataclass
-from typing import List
+from typing import Sequence
 
 import png
 from typedstruct import LittleEndianStruct, StructType
 
 from mariner.file_formats import SlicedModelFile
+from mariner.file_formats.layer_table import (
+    LazyLayerTable,
+    read_end_byte_offset_by_layer,
+)
+from mariner.file_formats.preview import read_rgb15_rle_image
+from mariner.file_formats.reader import SlicedFileReader
 
 
 @dataclass(frozen=True)
@@ -92,58 +97,16 @@ class FDGPreview(LittleEndianStruct):
     image_length: int = StructType.uint32()
 
 
-REPEAT_RGB15_MASK: int = 1 << 5
-
-
-def _read_image(width: int, height: int, data: bytes) -> png.Image:
-    array: List[List[int]] = [[]]
-
-    (i, x) = (0, 0)
-    while i < len(data):
-        color16 = int(struct.unpack_from("<H", data, i)[0])
-        i += 2
-        repeat = 1
-        if color16 & REPEAT_RGB15_MASK:
-            repeat += int(struct.unpack_from("<H", data, i)[0]) & 0xFFF
-            i += 2
-
-        (r, g, b) = (
-            (color16 >> 0) & 0x1F,
-            (color16 >> 6) & 0x1F,
-            (color16 >> 11) & 0x1F,
-        )
-
-        while repeat > 0:
-            array[-1] += [r, g, b]
-            repeat -= 1
-
-            x += 1
-            if x == width:
-                x = 0
-                array.append([])
-
-    array.pop()
-
-    return png.from_array(array, "RGB;5")
-
-
 @dataclass(frozen=True)
 class FDGFile(SlicedModelFile):
     @classmethod
-    def read(self, path: pathlib.Path) -> "FDGFile":
-        with open(str(path), "rb") as file:
-            fdg_header = FDGHeader.unpack(file.read(FDGHeader.get_size()))
-
-            file.seek(fdg_header.machine_offset)
-            printer_name = file.read(fdg_header.machine_size).decode()
+    def read(cls, path: pathlib.Path) -> "FDGFile":
+        with SlicedFileReader.open(path) as reader:
+            fdg_header = reader.unpack(FDGHeader)
 
-            end_byte_offset_by_layer = []
-            for layer in range(0, fdg_header.layer_count):
-                file.seek(fdg_header.layer_defs_offset + layer * FDGLayerDef.get_size())
-                layer_def = FDGLayerDef.unpack(file.read(FDGLayerDef.get_size()))
-                end_byte_offset_by_layer.append(
-                    layer_def.image_offset + layer_def.image_length
-                )
+            printer_name = reader.read_string(
+                fdg_header.machine_offset, fdg_header.machine_size
+            )
 
             return FDGFile(
                 filename=path.name,
@@ -157,7 +120,9 @@ class FDGFile(SlicedModelFile):
                 layer_count=fdg_header.layer_count,
                 resolution=(fdg_header.resolution_x, fdg_header.resolution_y),
                 print_time_secs=fdg_header.print_time,
-                end_byte_offset_by_layer=end_byte_offset_by_layer,
+                end_byte_offset_by_layer=LazyLayerTable(
+                    path, fdg_header.layer_count, cls
+                ),
                 slicer_version=".".join(
                     [
                         str(fdg_header.slicer_version_release),
@@ -170,14 +135,30 @@ class FDGFile(SlicedModelFile):
             )
 
     @classmethod
-    def read_preview(cls, path: pathlib.Path) -> png.Image:
-        with open(str(path), "rb") as file:
-            fdg_header = FDGHeader.unpack(file.read(FDGHeader.get_size()))
+    def read_layer_table(cls, path: pathlib.Path) -> Sequence[int]:
+        with SlicedFileReader.open(path) as reader:
+            fdg_header = reader.unpack(FDGHeader)
+            return read_end_byte_offset_by_layer(
+                reader,
+                FDGLayerDef,
+                fdg_header.layer_defs_offset,
+                fdg_header.layer_count,
+            )
 
-            file.seek(fdg_header.high_res_preview_offset)
-            preview = FDGPreview.unpack(file.read(FDGPreview.get_size()))
+    @classmethod
+    def read_preview(cls, path: pathlib.Path, low_res: bool = False) -> png.Image:
+        with SlicedFileReader.open(path) as reader:
+            fdg_header = reader.unpack(FDGHeader)
+
+            preview = reader.unpack(
+                FDGPreview,
+                fdg_header.low_res_preview_offset
+                if low_res
+                else fdg_header.high_res_preview_offset,
+            )
 
-            file.seek(preview.image_offset)
-            data = file.read(preview.image_length)
+            data = reader.read(preview.image_offset, preview.image_length)
 
-            return _read_image(preview.resolution_x, preview.resolution_y, data)
+            return read_rgb15_rle_image(
+                preview.resolution_x, preview.resolution_y, data
+            )
@@ -0,0 +1,120 @@
+import bisect
+import dataclasses
+import pathlib
+import struct
+from array import array
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+    overload,
+)
+
+from typedstruct import Struct
+
+from mariner.file_formats.reader import SlicedFileReader
+
+if TYPE_CHECKING:
+    from mariner.file_formats import SlicedModelFile
+
+
+def read_end_byte_offset_by_layer(
+    reader: SlicedFileReader,
+    layer_def_type: Type[Struct],
+    layer_defs_offset: int,
+    layer_count: int,
+) -> "array[int]":
+    # the layer definitions are stored contiguously, so we take the whole table at
+    # once and decode it in one pass instead of seeking and unpacking each layer
+    # definition separately
+    field_names = [field.name for field in dataclasses.fields(layer_def_type)]
+    image_offset_index = field_names.index("image_offset")
+    image_length_index = field_names.index("image_length")
+
+    data = reader.read(layer_defs_offset, layer_count * layer_def_type.get_size())
+    return array(
+        "I",
+        (
+            layer_def[image_offset_index] + layer_def[image_length_index]
+            for layer_def in struct.iter_unpack(layer_def_type.get_format(), data)
+        ),
+    )
+
+
+def get_layer_progress(
+    end_byte_offset_by_layer: Sequence[int],
+    current_byte: int,
+    total_bytes: int,
+) -> Tuple[int, float]:
+    # returns the layer being printed (starting at 1) and how many layers have been
+    # printed so far, including how far the printer is into the current layer. the
+    # printer doesn't always report a byte offset which is exactly at the end of a
+    # layer, so we find the layer with a binary search over the end byte offsets
+    layer_count = len(end_byte_offset_by_layer)
+    layer = bisect.bisect_right(end_byte_offset_by_layer, current_byte)
+    if layer == 0:
+        return (1, 0.0)
+
+    start_byte = end_byte_offset_by_layer[layer - 1]
+    if layer < layer_count:
+        end_byte = end_byte_offset_by_layer[layer]
+    else:
+        end_byte = total_bytes
+
+    layer_fraction = 0.0
+    if end_byte > start_byte:
+        layer_fraction = min(
+            max((current_byte - start_byte) / (end_byte - start_byte), 0.0), 1.0
+        )
+    return (layer, layer - 1 + layer_fraction)
+
+
+# stands in for end_byte_offset_by_layer and only reads the layer table from disk
+# the first time it is accessed. the table itself is never pickled, so cached sliced
+# model files stay small and the table gets read again after being unpickled.
+class LazyLayerTable(Sequence[int]):
+    def __init__(
+        self,
+        path: pathlib.Path,
+        layer_count: int,
+        file_format: Type["SlicedModelFile"],
+    ) -> None:
+        self._path = path
+        self._layer_count = layer_count
+        self._file_format = file_format
+        self._end_byte_offset_by_layer: Optional[Sequence[int]] = None
+
+    def _get_end_byte_offset_by_layer(self) -> Sequence[int]:
+        if self._end_byte_offset_by_layer is None:
+            self._end_byte_offset_by_layer = self._file_format.read_layer_table(
+                self._path
+            )
+        return self._end_byte_offset_by_layer
+
+    def is_loaded(self) -> bool:
+        return self._end_byte_offset_by_layer is not None
+
+    def __len__(self) -> int:
+        return self._layer_count
+
+    @overload
+    def __getitem__(self, index: int) -> int:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[int]:
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[int, Sequence[int]]:
+        return self._get_end_byte_offset_by_layer()[index]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._get_end_byte_offset_by_layer())
+
+    def __getstate__(self) -> Dict[str, object]:
+        return {**self.__dict__, "_end_byte_offset_by_layer": None}
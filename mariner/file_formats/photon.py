@@ -1,12 +1,17 @@
 import pathlib
-import struct
 from dataclasses import dataclass
-from typing import List
+from typing import Sequence
 
 import png
 from typedstruct import LittleEndianStruct, StructType
 
 from mariner.file_formats import SlicedModelFile
+from mariner.file_formats.layer_table import (
+    LazyLayerTable,
+    read_end_byte_offset_by_layer,
+)
+from mariner.file_formats.preview import read_rgb15_rle_image
+from mariner.file_formats.reader import SlicedFileReader
 
 
 @dataclass(frozen=True)
@@ -113,63 +118,18 @@ class PhotonPreview(LittleEndianStruct):
     unknown_04: int = StructType.uint32()
 
 
-REPEAT_RGB15_MASK: int = 1 << 5
-
-
-def _read_image(width: int, height: int, data: bytes) -> png.Image:
-    array: List[List[int]] = [[]]
-
-    (i, x) = (0, 0)
-    while i < len(data):
-        color16 = int(struct.unpack_from("<H", data, i)[0])
-        i += 2
-        repeat = 1
-        if color16 & REPEAT_RGB15_MASK:
-            repeat += int(struct.unpack_from("<H", data, i)[0]) & 0xFFF
-            i += 2
-
-        (r, g, b) = (
-            (color16 >> 0) & 0x1F,
-            (color16 >> 6) & 0x1F,
-            (color16 >> 11) & 0x1F,
-        )
-
-        while repeat > 0:
-            array[-1] += [r, g, b]
-            repeat -= 1
-
-            x += 1
-            if x == width:
-                x = 0
-                array.append([])
-
-    array.pop()
-
-    return png.from_array(array, "RGB;5")
-
-
 @dataclass(frozen=True)
 class PhotonFile(SlicedModelFile):
     @classmethod
-    def read(self, path: pathlib.Path) -> "PhotonFile":
-        with open(str(path), "rb") as file:
-            photon_header = PhotonHeader.unpack(file.read(PhotonHeader.get_size()))
-
-            file.seek(photon_header.slicer_offset)
-            photon_slicer = PhotonSlicer.unpack(file.read(PhotonSlicer.get_size()))
-
-            file.seek(photon_slicer.machine_offset)
-            printer_name = file.read(photon_slicer.machine_size).decode()
-
-            end_byte_offset_by_layer = []
-            for layer in range(0, photon_header.layer_count):
-                file.seek(
-                    photon_header.layer_defs_offset + layer * PhotonLayerDef.get_size()
-                )
-                layer_def = PhotonLayerDef.unpack(file.read(PhotonLayerDef.get_size()))
-                end_byte_offset_by_layer.append(
-                    layer_def.image_offset + layer_def.image_length
-                )
+    def read(cls, path: pathlib.Path) -> "PhotonFile":
+        with SlicedFileReader.open(path) as reader:
+            photon_header = reader.unpack(PhotonHeader)
+
+            photon_slicer = reader.unpack(PhotonSlicer, photon_header.slicer_offset)
+
+            printer_name = reader.read_string(
+                photon_slicer.machine_offset, photon_slicer.machine_size
+            )
 
             return PhotonFile(
                 filename=path.name,
@@ -183,7 +143,9 @@ class PhotonFile(SlicedModelFile):
                 layer_count=photon_header.layer_count,
                 resolution=(photon_header.resolution_x, photon_header.resolution_y),
                 print_time_secs=photon_header.print_time,
-                end_byte_offset_by_layer=end_byte_offset_by_layer,
+                end_byte_offset_by_layer=LazyLayerTable(
+                    path, photon_header.layer_count, cls
+                ),
                 slicer_version=".".join(
                     [
                         str(photon_slicer.version_release),
@@ -196,14 +158,30 @@ class PhotonFile(SlicedModelFile):
             )
 
     @classmethod
-    def read_preview(cls, path: pathlib.Path) -> png.Image:
-        with open(str(path), "rb") as file:
-            photon_header = PhotonHeader.unpack(file.read(PhotonHeader.get_size()))
+    def read_layer_table(cls, path: pathlib.Path) -> Sequence[int]:
+        with SlicedFileReader.open(path) as reader:
+            photon_header = reader.unpack(PhotonHeader)
+            return read_end_byte_offset_by_layer(
+                reader,
+                PhotonLayerDef,
+                photon_header.layer_defs_offset,
+                photon_header.layer_count,
+            )
 
-            file.seek(photon_header.high_res_preview_offset)
-            preview = PhotonPreview.unpack(file.read(PhotonPreview.get_size()))
+    @classmethod
+    def read_preview(cls, path: pathlib.Path, low_res: bool = False) -> png.Image:
+        with SlicedFileReader.open(path) as reader:
+            photon_header = reader.unpack(PhotonHeader)
+
+            preview = reader.unpack(
+                PhotonPreview,
+                photon_header.low_res_preview_offset
+                if low_res
+                else photon_header.high_res_preview_offset,
+            )
 
-            file.seek(preview.image_offset)
-            data = file.read(preview.image_length)
+            data = reader.read(preview.image_offset, preview.image_length)
 
-            return _read_image(preview.resolution_x, preview.resolution_y, data)
+            return read_rgb15_rle_image(
+                preview.resolution_x, preview.resolution_y, data
+            )
@@ -0,0 +1,157 @@
+import itertools
+import sys
+from array import array
+from typing import BinaryIO, Iterable, Iterator, List, Sequence
+
+import png
+
+try:
+    # pyre-fixme[21]: numpy is an optional dependency
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+REPEAT_RGB15_MASK: int = 1 << 5
+
+# the 8-bit sample each 5-bit sample maps to, the same way pypng would scale
+# them. pypng does that one sample at a time in python when writing images with
+# less than 8 bits per sample, which takes far longer than decoding them does,
+# so samples get expanded while they're decoded instead.
+RGB5_TO_RGB8: bytes = bytes(int(round(255.0 / 31.0 * value)) for value in range(32))
+
+# how many bytes of rows get buffered before they're compressed when writing
+# images out
+PNG_CHUNK_LIMIT_BYTES: int = 16 * 1024
+
+
+def _get_rgb15_words(data: bytes) -> Sequence[int]:
+    end = len(data) - len(data) % 2
+    if sys.byteorder == "little":
+        # the words are read straight out of the data, without copying it. data
+        # is always bytes of its own rather than a view into a mapped file, so
+        # rows can still be decoded after the file is closed or truncated.
+        return memoryview(data)[:end].cast("B").cast("H")
+    words = array("H")
+    words.frombytes(data[:end])
+    words.byteswap()
+    return words
+
+
+def iter_rgb15_rle_rows(width: int, height: int, data: bytes) -> Iterator[bytes]:
+    # expands the run-length encoded data one row of 8-bit RGB samples at a
+    # time, so only about a row of pixels is held in memory no matter how large
+    # the image is. runs can carry over from one row to the next. rows missing
+    # from the data are left black, and anything past the last row is ignored.
+    words = _get_rgb15_words(data)
+    row_size = width * 3
+    row = bytearray()
+    rows_left = height
+    (i, num_words) = (0, len(words))
+    while i < num_words and rows_left > 0:
+        color16 = words[i]
+        i += 1
+        repeat = 1
+        if color16 & REPEAT_RGB15_MASK and i < num_words:
+            repeat += words[i] & 0xFFF
+            i += 1
+
+        pixel = bytes(
+            (
+                RGB5_TO_RGB8[(color16 >> 0) & 0x1F],
+                RGB5_TO_RGB8[(color16 >> 6) & 0x1F],
+                RGB5_TO_RGB8[(color16 >> 11) & 0x1F],
+            )
+        )
+        row += pixel * repeat
+        while len(row) >= row_size and rows_left > 0:
+            yield bytes(row[:row_size])
+            del row[:row_size]
+            rows_left -= 1
+
+    for _ in range(rows_left):
+        yield bytes(row_size)
+
+
+def read_rgb15_rle_image(width: int, height: int, data: bytes) -> png.Image:
+    # rows are only decoded as the image gets written out
+    return png.from_array(
+        iter_rgb15_rle_rows(width, height, data),
+        "RGB;8",
+        info={"width": width, "height": height},
+    )
+
+
+def write_image(image: png.Image, file: BinaryIO) -> None:
+    # pypng buffers up to a megabyte of rows by default before compressing
+    # them, which is more than most previews take uncompressed. rows get
+    # compressed in much smaller chunks here instead, so writing an image whose
+    # rows are generated on the fly only ever holds a few of them in memory.
+    writer = png.Writer(**image.info, chunk_limit=PNG_CHUNK_LIMIT_BYTES)
+    writer.write(file, image.rows)
+
+
+def _get_box_starts(size: int, new_size: int) -> List[int]:
+    # where each box of source pixels that gets averaged into a single pixel
+    # starts, followed by where the last box ends
+    return [i * size // new_size for i in range(new_size)] + [size]
+
+
+def _downscale_box_with_numpy(rows: Sequence[bytes], x_starts: List[int]) -> bytes:
+    samples = numpy.frombuffer(b"".join(rows), dtype=numpy.uint8)
+    column_sums = samples.reshape(len(rows), -1, 3).sum(axis=0, dtype=numpy.uint32)
+    sums = numpy.add.reduceat(column_sums, x_starts[:-1], axis=0)
+    counts = (len(rows) * numpy.diff(x_starts))[:, None]
+    return ((sums + counts // 2) // counts).astype(numpy.uint8).tobytes()
+
+
+def _downscale_box_with_python(rows: Sequence[bytes], x_starts: List[int]) -> bytes:
+    # the rows are added up first, so every source sample is only looked at once
+    column_sums = [sum(samples) for samples in zip(*rows)]
+    downscaled = bytearray()
+    for x in range(len(x_starts) - 1):
+        count = len(rows) * (x_starts[x + 1] - x_starts[x])
+        totals = [0, 0, 0]
+        for i in range(x_starts[x] * 3, x_starts[x + 1] * 3):
+            totals[i % 3] += column_sums[i]
+        downscaled += bytes((total + count // 2) // count for total in totals)
+    return bytes(downscaled)
+
+
+def _iter_downscaled_rows(
+    rows: Iterable[Sequence[int]],
+    width: int,
+    height: int,
+    new_width: int,
+    new_height: int,
+) -> Iterator[bytes]:
+    # each row of the downscaled image only needs the rows of the source image
+    # which it covers, so those are all that's kept around
+    x_starts = _get_box_starts(width, new_width)
+    y_starts = _get_box_starts(height, new_height)
+    rows_iterator = iter(rows)
+    for y in range(new_height):
+        box_height = y_starts[y + 1] - y_starts[y]
+        box_rows = [bytes(row) for row in itertools.islice(rows_iterator, box_height)]
+        if numpy is not None:
+            yield _downscale_box_with_numpy(box_rows, x_starts)
+        else:
+            yield _downscale_box_with_python(box_rows, x_starts)
+
+
+def downscale_image(image: png.Image, max_size: int) -> png.Image:
+    # shrinks an RGB image so it fits within a max_size x max_size box, keeping
+    # its aspect ratio. each pixel is the average of the ones it covers, which
+    # looks a lot better on small thumbnails than just picking one of them.
+    info = image.info
+    assert not info["greyscale"] and not info["alpha"]
+    (width, height) = (info["width"], info["height"])
+    if max(width, height) <= max_size:
+        return image
+    new_width = max(1, round(width * max_size / max(width, height)))
+    new_height = max(1, round(height * max_size / max(width, height)))
+    return png.from_array(
+        _iter_downscaled_rows(image.rows, width, height, new_width, new_height),
+        f"RGB;{info['bitdepth']}",
+        info={"width": new_width, "height": new_height},
+    )
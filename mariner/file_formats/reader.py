@@ -0,0 +1,69 @@
+import io
+import mmap
+import pathlib
+from types import TracebackType
+from typing import BinaryIO, Optional, Type, TypeVar
+
+from typedstruct import Struct
+
+
+TStruct = TypeVar("TStruct", bound=Struct)
+
+
+class SlicedFileReader:
+    # sliced files are read through a read-only memory mapping whenever
+    # possible, so headers, layer tables and previews can be sliced out of it
+    # without any extra syscalls. files which can't be mapped (empty files or
+    # in-memory files, for example) fall back to regular seeks and reads.
+    #
+    # whatever gets read is copied out of the mapping. files can be rewritten in
+    # place while we're reading them (by the usb host, for example), and touching
+    # a mapping past the end of a file which shrank kills the whole process with
+    # SIGBUS. copies are safe to hold on to after the reader is closed, and they
+    # are small: headers, layer tables and previews take a few KB at most.
+    _file: BinaryIO
+    _mmap: Optional[mmap.mmap]
+
+    def __init__(self, file: BinaryIO) -> None:
+        self._file = file
+        try:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, io.UnsupportedOperation):
+            self._mmap = None
+
+    @classmethod
+    def open(cls, path: pathlib.Path) -> "SlicedFileReader":
+        return cls(open(str(path), "rb"))
+
+    def is_memory_mapped(self) -> bool:
+        return self._mmap is not None
+
+    def read(self, offset: int, length: int) -> bytes:
+        if self._mmap is not None:
+            end = offset + length
+            return self._mmap[offset:end]
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def unpack(self, struct_type: Type[TStruct], offset: int = 0) -> TStruct:
+        return struct_type.unpack(self.read(offset, struct_type.get_size()))
+
+    def read_string(self, offset: int, length: int) -> str:
+        return self.read(offset, length).decode()
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> "SlicedFileReader":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> bool:
+        self.close()
+        return False
@@ -0,0 +1,170 @@
+"""
+Compares the preview decoders against the original pixel-by-pixel implementation
+on the sliced files bundled with the tests, both in how long it takes to read
+each preview and write it out as a png, and in how much memory that takes at
+its peak. Run it with:
+
+    poetry run python -m mariner.file_formats.tests.benchmark_preview
+"""
+import io
+import pathlib
+import sys
+import timeit
+import tracemalloc
+from array import array
+from typing import Callable, Dict, Iterator
+from unittest.mock import patch
+
+from mariner.file_formats import preview
+from mariner.file_formats.tests.reference_preview import decode_pixel_by_pixel
+from mariner.file_formats.utils import get_file_format, get_supported_extensions
+
+try:
+    # pyre-fixme[21]: numpy is an optional dependency
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+NUM_RUNS: int = 3
+
+RGB5_TO_RGB8_TABLE: bytes = preview.RGB5_TO_RGB8 + bytes(256 - 32)
+
+
+def _decode_rgb15_rle_with_numpy(width: int, data: bytes) -> bytes:
+    # expands the whole image at once into rows of 5-bit samples. trailing
+    # pixels that don't fill a whole row are dropped.
+    words = numpy.frombuffer(data, dtype="<u2", count=len(data) // 2)
+    if len(words) == 0:
+        return b""
+
+    # a word is a color unless it is the repeat count of the color before it.
+    # whenever a word doesn't have the repeat bit set, the next word is a color
+    # again, so within each stretch of flagged words colors and repeat counts
+    # simply alternate, starting with a color.
+    index = numpy.arange(len(words))
+    is_flagged = (words & preview.REPEAT_RGB15_MASK) != 0
+    is_stretch_start = numpy.empty(len(words), dtype=bool)
+    is_stretch_start[0] = True
+    is_stretch_start[1:] = ~is_flagged[:-1]
+    stretch_start = numpy.maximum.accumulate(numpy.where(is_stretch_start, index, 0))
+    color_index = numpy.flatnonzero((index - stretch_start) % 2 == 0)
+
+    colors = words[color_index]
+    repeats = numpy.ones(len(colors), dtype=numpy.int64)
+    has_repeat = is_flagged[color_index] & (color_index + 1 < len(words))
+    repeats[has_repeat] += words[color_index[has_repeat] + 1] & 0xFFF
+
+    rgb = numpy.stack(
+        [colors & 0x1F, (colors >> 6) & 0x1F, (colors >> 11) & 0x1F],
+        axis=1,
+    ).astype(numpy.uint8)
+    pixels = numpy.repeat(rgb, repeats, axis=0)
+    height = len(pixels) // width
+    return pixels[: height * width].tobytes()
+
+
+def _decode_rgb15_rle_with_python(width: int, data: bytes) -> bytes:
+    # same as above, without numpy
+    words = array("H")
+    words.frombytes(data[: len(data) - len(data) % 2])
+    if sys.byteorder == "big":
+        words.byteswap()
+
+    pixels = bytearray()
+    (i, num_words) = (0, len(words))
+    while i < num_words:
+        color16 = words[i]
+        i += 1
+        repeat = 1
+        if color16 & preview.REPEAT_RGB15_MASK and i < num_words:
+            repeat += words[i] & 0xFFF
+            i += 1
+
+        pixel = bytes(
+            (
+                (color16 >> 0) & 0x1F,
+                (color16 >> 6) & 0x1F,
+                (color16 >> 11) & 0x1F,
+            )
+        )
+        pixels += pixel * repeat
+
+    height = len(pixels) // (width * 3)
+    return bytes(pixels[: height * width * 3])
+
+
+def _iter_rows_of(
+    decode: Callable[[int, bytes], bytes]
+) -> Callable[[int, int, bytes], Iterator[bytes]]:
+    # turns a decoder which expands the whole image at once into 5-bit samples
+    # into one which yields rows of 8-bit samples, so it can stand in for the
+    # streaming decoder
+    def iter_rows(width: int, height: int, data: bytes) -> Iterator[bytes]:
+        pixels = decode(width, data).translate(RGB5_TO_RGB8_TABLE)
+        row_size = width * 3
+        for start in range(0, height * row_size, row_size):
+            end = start + row_size
+            yield pixels[start:end]
+
+    return iter_rows
+
+
+def _render_preview(path: pathlib.Path) -> bytes:
+    png_bytes = io.BytesIO()
+    preview.write_image(get_file_format(path.name).read_preview(path), png_bytes)
+    return png_bytes.getvalue()
+
+
+def _get_peak_memory_bytes(path: pathlib.Path) -> int:
+    tracemalloc.start()
+    try:
+        _render_preview(path)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> None:
+    decoders: Dict[str, Callable[[int, int, bytes], Iterator[bytes]]] = {
+        "pixel by pixel": _iter_rows_of(decode_pixel_by_pixel),
+        "python": _iter_rows_of(_decode_rgb15_rle_with_python),
+    }
+    if numpy is not None:
+        decoders["numpy"] = _iter_rows_of(_decode_rgb15_rle_with_numpy)
+    decoders["streaming"] = preview.iter_rgb15_rle_rows
+
+    tests_directory = pathlib.Path(__file__).parent.absolute()
+    paths = sorted(
+        path
+        for extension in get_supported_extensions()
+        for path in tests_directory.glob(f"*{extension}")
+        if not path.name.startswith("._")
+    )
+
+    for path in paths:
+        baseline_secs = None
+        baseline_png = None
+        for (name, decoder) in decoders.items():
+            with patch("mariner.file_formats.preview.iter_rgb15_rle_rows", decoder):
+                png_bytes = _render_preview(path)
+                secs = min(
+                    timeit.repeat(
+                        lambda: _render_preview(path),
+                        number=1,
+                        repeat=NUM_RUNS,
+                    )
+                )
+                peak_memory_bytes = _get_peak_memory_bytes(path)
+            if baseline_secs is None or baseline_png is None:
+                (baseline_secs, baseline_png) = (secs, png_bytes)
+            assert png_bytes == baseline_png, f"{name} decoded {path.name} differently"
+            print(
+                f"{path.name:>20} {name:>15}: {secs * 1000.0:9.2f} ms"
+                + f" ({baseline_secs / secs:6.1f}x),"
+                + f" {peak_memory_bytes / 1024.0:9.1f} KiB peak"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import struct
+from typing import List
+
+from mariner.file_formats import preview
+
+
+def decode_pixel_by_pixel(width: int, data: bytes) -> bytes:
+    # this is how previews used to be decoded before runs were expanded in bulk
+    rows: List[List[int]] = [[]]
+
+    (i, x) = (0, 0)
+    while i < len(data):
+        color16 = int(struct.unpack_from("<H", data, i)[0])
+        i += 2
+        repeat = 1
+        if color16 & preview.REPEAT_RGB15_MASK:
+            repeat += int(struct.unpack_from("<H", data, i)[0]) & 0xFFF
+            i += 2
+
+        (r, g, b) = (
+            (color16 >> 0) & 0x1F,
+            (color16 >> 6) & 0x1F,
+            (color16 >> 11) & 0x1F,
+        )
+
+        while repeat > 0:
+            rows[-1] += [r, g, b]
+            repeat -= 1
+
+            x += 1
+            if x == width:
+                x = 0
+                rows.append([])
+
+    rows.pop()
+
+    return bytes(value for row in rows for value in row)
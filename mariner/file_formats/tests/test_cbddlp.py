@@ -20,10 +20,10 @@ class CBDDLPFileTest(TestCase):
         expect(cbddlp_file.layer_count).to_equal(50)
         expect(cbddlp_file.resolution).to_equal((1440, 2560))
         expect(cbddlp_file.print_time_secs).to_equal(931)
-        expect(cbddlp_file.end_byte_offset_by_layer[:5]).to_equal(
+        expect(list(cbddlp_file.end_byte_offset_by_layer[:5])).to_equal(
             [42047, 161261, 280467, 399665, 518853]
         )
-        expect(cbddlp_file.end_byte_offset_by_layer[-5:]).to_equal(
+        expect(list(cbddlp_file.end_byte_offset_by_layer[-5:])).to_equal(
             [5389468, 5507868, 5626244, 5744596, 5862924]
         )
         expect(cbddlp_file.slicer_version).to_equal("1.7.0.0")
@@ -20,10 +20,10 @@ class CTBFileTest(TestCase):
         expect(ctb_file.layer_count).to_equal(400)
         expect(ctb_file.resolution).to_equal((1440, 2560))
         expect(ctb_file.print_time_secs).to_equal(5621)
-        expect(ctb_file.end_byte_offset_by_layer[:5]).to_equal(
+        expect(list(ctb_file.end_byte_offset_by_layer[:5])).to_equal(
             [26272, 28057, 29842, 31627, 33412]
         )
-        expect(ctb_file.end_byte_offset_by_layer[-5:]).to_equal(
+        expect(list(ctb_file.end_byte_offset_by_layer[-5:])).to_equal(
             [822027, 824704, 827383, 830061, 832745]
         )
         expect(ctb_file.slicer_version).to_equal("1.6.5.1")
@@ -36,8 +36,16 @@ class CTBFileTest(TestCase):
         preview_image.write(bytes)
         expect(preview_image.info["width"]).to_equal(400)
         expect(preview_image.info["height"]).to_equal(300)
-        expect(preview_image.info["bitdepth"]).to_equal(5)
+        expect(preview_image.info["bitdepth"]).to_equal(8)
         expect(preview_image.info["alpha"]).is_false()
         expect(hashlib.md5(bytes.getvalue()).hexdigest()).to_equal(
-            "ca98c806d42898ba70626e556f714928"
+            "66cad05dfc0d9e53fe8e84eb6d5b5364"
         )
+
+    def test_low_res_preview_rendering(self) -> None:
+        path = pathlib.Path(__file__).parent.absolute() / "stairs.ctb"
+        preview_image: png.Image = CTBFile.read_preview(path, low_res=True)
+        expect(preview_image.info["width"]).to_equal(200)
+        expect(preview_image.info["height"]).to_equal(125)
+        expect(preview_image.info["bitdepth"]).to_equal(8)
+        expect(len(list(preview_image.rows))).to_equal(125)
@@ -20,10 +20,10 @@ class FDGFileTest(TestCase):
         expect(fdg_file.layer_count).to_equal(400)
         expect(fdg_file.resolution).to_equal((1620, 2560))
         expect(fdg_file.print_time_secs).to_equal(4243)
-        expect(fdg_file.end_byte_offset_by_layer[:5]).to_equal(
+        expect(list(fdg_file.end_byte_offset_by_layer[:5])).to_equal(
             [78407, 120241, 162075, 203909, 245743]
         )
-        expect(fdg_file.end_byte_offset_by_layer[-5:]).to_equal(
+        expect(list(fdg_file.end_byte_offset_by_layer[-5:])).to_equal(
             [16704074, 16747148, 16790222, 16833296, 16876370]
         )
         expect(fdg_file.slicer_version).to_equal("1.8.1.0")
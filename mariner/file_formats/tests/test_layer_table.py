@@ -0,0 +1,133 @@
+import io
+import pathlib
+import pickle
+import struct
+from array import array
+from unittest import TestCase
+
+from pyexpect import expect
+
+from mariner.file_formats.ctb import CTBFile, CTBHeader, CTBLayerDef
+from mariner.file_formats.layer_table import (
+    LazyLayerTable,
+    get_layer_progress,
+    read_end_byte_offset_by_layer,
+)
+from mariner.file_formats.reader import SlicedFileReader
+
+
+class LayerTableTest(TestCase):
+    def test_reading_layer_table(self) -> None:
+        layer_defs = b"".join(
+            [
+                struct.pack(
+                    CTBLayerDef.get_format(),
+                    0.05,
+                    8.0,
+                    1.0,
+                    100 + i * 10,
+                    10,
+                    0,
+                    0,
+                    0,
+                    0,
+                )
+                for i in range(0, 3)
+            ]
+        )
+        reader = SlicedFileReader(io.BytesIO(b"\x00" * 16 + layer_defs))
+        expect(read_end_byte_offset_by_layer(reader, CTBLayerDef, 16, 3)).to_equal(
+            array("I", [110, 120, 130])
+        )
+
+    def test_reading_empty_layer_table(self) -> None:
+        reader = SlicedFileReader(io.BytesIO(b"\x00" * 16))
+        expect(read_end_byte_offset_by_layer(reader, CTBLayerDef, 16, 0)).to_equal(
+            array("I")
+        )
+
+    def test_matches_layer_by_layer_reads(self) -> None:
+        path = pathlib.Path(__file__).parent.absolute() / "stairs.ctb"
+        with open(str(path), "rb") as file:
+            header = CTBHeader.unpack(file.read(CTBHeader.get_size()))
+            expected = []
+            for layer in range(0, header.layer_count):
+                file.seek(header.layer_defs_offset + layer * CTBLayerDef.get_size())
+                layer_def = CTBLayerDef.unpack(file.read(CTBLayerDef.get_size()))
+                expected.append(layer_def.image_offset + layer_def.image_length)
+
+        with SlicedFileReader.open(path) as reader:
+            expect(
+                read_end_byte_offset_by_layer(
+                    reader, CTBLayerDef, header.layer_defs_offset, header.layer_count
+                )
+            ).to_equal(array("I", expected))
+
+
+class LazyLayerTableTest(TestCase):
+    def setUp(self) -> None:
+        self.path = pathlib.Path(__file__).parent.absolute() / "stairs.ctb"
+
+    def test_layer_table_is_read_on_first_access(self) -> None:
+        ctb_file = CTBFile.read(self.path)
+        layer_table = ctb_file.end_byte_offset_by_layer
+        assert isinstance(layer_table, LazyLayerTable)
+        expect(layer_table.is_loaded()).to_equal(False)
+        expect(len(layer_table)).to_equal(400)
+        expect(layer_table.is_loaded()).to_equal(False)
+
+        expect(layer_table[0]).to_equal(26272)
+        expect(layer_table.is_loaded()).to_equal(True)
+        expect(list(layer_table)).to_equal(list(CTBFile.read_layer_table(self.path)))
+
+    def test_layer_table_is_not_pickled(self) -> None:
+        ctb_file = CTBFile.read(self.path)
+        layer_table = ctb_file.end_byte_offset_by_layer
+        assert isinstance(layer_table, LazyLayerTable)
+        expect(layer_table[-1]).to_equal(832745)
+
+        unpickled_layer_table = pickle.loads(pickle.dumps(layer_table))
+        expect(unpickled_layer_table.is_loaded()).to_equal(False)
+        expect(unpickled_layer_table[-1]).to_equal(832745)
+
+
+class LayerProgressTest(TestCase):
+    end_byte_offset_by_layer: "array[int]" = array("I", [100, 200, 400])
+
+    def test_before_first_layer(self) -> None:
+        expect(get_layer_progress(self.end_byte_offset_by_layer, 0, 400)).to_equal(
+            (1, 0.0)
+        )
+        expect(get_layer_progress(self.end_byte_offset_by_layer, 50, 400)).to_equal(
+            (1, 0.0)
+        )
+
+    def test_at_layer_boundaries(self) -> None:
+        expect(get_layer_progress(self.end_byte_offset_by_layer, 100, 400)).to_equal(
+            (1, 0.0)
+        )
+        expect(get_layer_progress(self.end_byte_offset_by_layer, 200, 400)).to_equal(
+            (2, 1.0)
+        )
+        expect(get_layer_progress(self.end_byte_offset_by_layer, 400, 400)).to_equal(
+            (3, 2.0)
+        )
+
+    def test_interpolates_within_layer(self) -> None:
+        expect(get_layer_progress(self.end_byte_offset_by_layer, 150, 400)).to_equal(
+            (1, 0.5)
+        )
+        expect(get_layer_progress(self.end_byte_offset_by_layer, 250, 400)).to_equal(
+            (2, 1.25)
+        )
+
+    def test_past_last_layer(self) -> None:
+        expect(get_layer_progress(self.end_byte_offset_by_layer, 450, 500)).to_equal(
+            (3, 2.5)
+        )
+        expect(get_layer_progress(self.end_byte_offset_by_layer, 900, 400)).to_equal(
+            (3, 2.0)
+        )
+
+    def test_empty_layer_table(self) -> None:
+        expect(get_layer_progress(array("I"), 123, 400)).to_equal((1, 0.0))
@@ -20,10 +20,10 @@ class PhotonFileTest(TestCase):
         expect(photon_file.layer_count).to_equal(340)
         expect(photon_file.resolution).to_equal((1440, 2560))
         expect(photon_file.print_time_secs).to_equal(5171)
-        expect(photon_file.end_byte_offset_by_layer[:5]).to_equal(
+        expect(list(photon_file.end_byte_offset_by_layer[:5])).to_equal(
             [54492, 85084, 115763, 146232, 176680]
         )
-        expect(photon_file.end_byte_offset_by_layer[-5:]).to_equal(
+        expect(list(photon_file.end_byte_offset_by_layer[-5:])).to_equal(
             [10132550, 10162753, 10192956, 10223159, 10253362]
         )
 
@@ -0,0 +1,152 @@
+import io
+import pathlib
+import shutil
+import struct
+import tempfile
+from unittest import TestCase, skipIf
+from unittest.mock import patch
+
+import png
+from pyexpect import expect
+
+from mariner.file_formats import preview
+from mariner.file_formats.ctb import CTBFile, CTBHeader, CTBPreview
+from mariner.file_formats.tests.reference_preview import decode_pixel_by_pixel
+
+
+def _rgb15(r: int, g: int, b: int, repeat: bool = False) -> int:
+    return r | (g << 6) | (b << 11) | (preview.REPEAT_RGB15_MASK if repeat else 0)
+
+
+def _rgb8(*samples: int) -> bytes:
+    return bytes(preview.RGB5_TO_RGB8[sample] for sample in samples)
+
+
+class StreamingRGB15RLEDecoderTest(TestCase):
+    def setUp(self) -> None:
+        self.data = struct.pack(
+            "<HHHHH",
+            _rgb15(1, 2, 3),
+            _rgb15(4, 5, 6, repeat=True),
+            0x3000 | 1,
+            _rgb15(31, 31, 31, repeat=True),
+            0x3000,
+        )
+
+    def test_rows(self) -> None:
+        expect(list(preview.iter_rgb15_rle_rows(2, 2, self.data))).to_equal(
+            [_rgb8(1, 2, 3, 4, 5, 6), _rgb8(4, 5, 6, 31, 31, 31)]
+        )
+
+    def test_missing_rows_are_left_black(self) -> None:
+        expect(list(preview.iter_rgb15_rle_rows(3, 2, self.data))).to_equal(
+            [_rgb8(1, 2, 3, 4, 5, 6, 4, 5, 6), bytes(9)]
+        )
+
+    def test_extra_rows_are_ignored(self) -> None:
+        expect(list(preview.iter_rgb15_rle_rows(1, 2, self.data))).to_equal(
+            [_rgb8(1, 2, 3), _rgb8(4, 5, 6)]
+        )
+
+    def test_agrees_with_original_decoder_on_ctb_preview(self) -> None:
+        path = pathlib.Path(__file__).parent.absolute() / "stairs.ctb"
+        with open(str(path), "rb") as file:
+            header = CTBHeader.unpack(file.read(CTBHeader.get_size()))
+            file.seek(header.high_res_preview_offset)
+            ctb_preview = CTBPreview.unpack(file.read(CTBPreview.get_size()))
+            file.seek(ctb_preview.image_offset)
+            data = file.read(ctb_preview.image_length)
+
+        rows = preview.iter_rgb15_rle_rows(
+            ctb_preview.resolution_x, ctb_preview.resolution_y, data
+        )
+        expect(b"".join(rows)).to_equal(
+            _rgb8(*decode_pixel_by_pixel(ctb_preview.resolution_x, data))
+        )
+
+    def test_samples_are_scaled_like_pypng_does(self) -> None:
+        written = io.BytesIO()
+        png.from_array([list(range(30)), list(range(2, 32))], "RGB;5").write(written)
+        (_, _, rows, _) = png.Reader(bytes=written.getvalue()).asRGB8()
+        expect([bytes(row) for row in rows]).to_equal(
+            [_rgb8(*range(30)), _rgb8(*range(2, 32))]
+        )
+
+    def test_rows_decode_after_the_file_is_truncated(self) -> None:
+        path = pathlib.Path(__file__).parent.absolute() / "stairs.ctb"
+        expected_rows = [bytes(row) for row in CTBFile.read_preview(path).rows]
+        with tempfile.TemporaryDirectory() as directory:
+            copy_path = pathlib.Path(directory) / "stairs.ctb"
+            shutil.copy(path, copy_path)
+            # rows are only decoded once they're asked for, which can happen
+            # after the file was replaced with a shorter one
+            image = CTBFile.read_preview(copy_path)
+            with open(copy_path, "wb"):
+                pass
+            expect([bytes(row) for row in image.rows]).to_equal(expected_rows)
+
+    def test_write_image(self) -> None:
+        path = pathlib.Path(__file__).parent.absolute() / "stairs.ctb"
+        written = io.BytesIO()
+        preview.write_image(CTBFile.read_preview(path), written)
+        expected = io.BytesIO()
+        CTBFile.read_preview(path).write(expected)
+
+        (width, height, rows, _) = png.Reader(bytes=written.getvalue()).read()
+        (expected_width, expected_height, expected_rows, _) = png.Reader(
+            bytes=expected.getvalue()
+        ).read()
+        expect((width, height)).to_equal((expected_width, expected_height))
+        expect([bytes(row) for row in rows]).to_equal(
+            [bytes(row) for row in expected_rows]
+        )
+
+
+class DownscaleTest(TestCase):
+    def setUp(self) -> None:
+        # a 3x2 image. when scaled down to 2x1, the first column gets averaged
+        # into one pixel and the other two columns into the other one.
+        self.rows = [
+            bytes([0, 0, 0, 10, 20, 30, 20, 10, 0]),
+            bytes([2, 2, 2, 10, 20, 30, 0, 10, 31]),
+        ]
+        self.x_starts = [0, 1, 3]
+        self.expected = bytes([1, 1, 1, 10, 15, 23])
+
+    def test_python_downscaler(self) -> None:
+        expect(preview._downscale_box_with_python(self.rows, self.x_starts)).to_equal(
+            self.expected
+        )
+
+    @skipIf(preview.numpy is None, "numpy is not available")
+    def test_numpy_downscaler(self) -> None:
+        expect(preview._downscale_box_with_numpy(self.rows, self.x_starts)).to_equal(
+            self.expected
+        )
+
+    @skipIf(preview.numpy is None, "numpy is not available")
+    def test_downscalers_agree_on_ctb_preview(self) -> None:
+        path = pathlib.Path(__file__).parent.absolute() / "stairs.ctb"
+        for (width, height) in [(256, 192), (133, 100), (7, 5)]:
+            rows = preview._iter_downscaled_rows(
+                CTBFile.read_preview(path).rows, 400, 300, width, height
+            )
+            with patch.object(preview, "numpy", None):
+                python_rows = list(
+                    preview._iter_downscaled_rows(
+                        CTBFile.read_preview(path).rows, 400, 300, width, height
+                    )
+                )
+            expect(list(rows)).to_equal(python_rows)
+
+    def test_downscale_image(self) -> None:
+        path = pathlib.Path(__file__).parent.absolute() / "stairs.ctb"
+        image = preview.downscale_image(CTBFile.read_preview(path), 128)
+        expect(image.info["width"]).to_equal(128)
+        expect(image.info["height"]).to_equal(96)
+        expect(image.info["bitdepth"]).to_equal(8)
+        expect(len(list(image.rows))).to_equal(96)
+
+        # images which fit already are left alone
+        image = CTBFile.read_preview(path)
+        expect(preview.downscale_image(image, 512)).to_be(image)
@@ -0,0 +1,52 @@
+import io
+import pathlib
+import shutil
+import struct
+import tempfile
+from unittest import TestCase
+
+from pyexpect import expect
+
+from mariner.file_formats.ctb import CTBHeader, CTBPreview
+from mariner.file_formats.reader import SlicedFileReader
+
+
+class SlicedFileReaderTest(TestCase):
+    def test_reading_memory_mapped_file(self) -> None:
+        path = pathlib.Path(__file__).parent.absolute() / "stairs.ctb"
+        with SlicedFileReader.open(path) as reader:
+            expect(reader.is_memory_mapped()).to_equal(True)
+            header = reader.unpack(CTBHeader)
+            expect(header.layer_count).to_equal(400)
+            preview = reader.unpack(CTBPreview, header.high_res_preview_offset)
+            expect((preview.resolution_x, preview.resolution_y)).to_equal((400, 300))
+            data = reader.read(preview.image_offset, preview.image_length)
+            expect(len(data)).to_equal(preview.image_length)
+
+        with open(str(path), "rb") as file:
+            file.seek(preview.image_offset)
+            expect(data).to_equal(file.read(preview.image_length))
+
+    def test_reads_outlive_the_file_being_truncated(self) -> None:
+        path = pathlib.Path(__file__).parent.absolute() / "stairs.ctb"
+        with tempfile.TemporaryDirectory() as directory:
+            copy_path = pathlib.Path(directory) / "stairs.ctb"
+            shutil.copy(path, copy_path)
+            with SlicedFileReader.open(copy_path) as reader:
+                expect(reader.is_memory_mapped()).to_equal(True)
+                header = reader.unpack(CTBHeader)
+                preview = reader.unpack(CTBPreview, header.high_res_preview_offset)
+                data = reader.read(preview.image_offset, preview.image_length)
+                # such as when the file gets re-uploaded under the same name
+                with open(copy_path, "wb"):
+                    pass
+            expect(len(data)).to_equal(preview.image_length)
+            expect(sum(data)).not_to_equal(0)
+
+    def test_falls_back_to_reads_when_file_cannot_be_mapped(self) -> None:
+        file = io.BytesIO(struct.pack("<II", 42, 3) + b"foo")
+        with SlicedFileReader(file) as reader:
+            expect(reader.is_memory_mapped()).to_equal(False)
+            expect(reader.read(0, 4)).to_equal(struct.pack("<I", 42))
+            expect(reader.read_string(8, 3)).to_equal("foo")
+        expect(file.closed).to_equal(True)
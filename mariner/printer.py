@@ -1,9 +1,11 @@
+import collections
 import os
 import re
+import time
 from dataclasses import dataclass
 from enum import Enum
 from types import TracebackType
-from typing import Match, Optional, Type
+from typing import Deque, List, Match, Optional, Pattern, Type
 
 import serial
 
@@ -25,8 +27,31 @@ class PrintStatus:
     total_bytes: Optional[int] = None
 
 
+# every response from the printer ends with a line starting with "ok". the printer
+# also sends "ok" lines on its own every now and then, so commands which reply with
+# a specific "ok" line use a more specific terminator, which allows us to tell their
+# response apart from these unsolicited lines.
+OK_TERMINATOR: Pattern[str] = re.compile("^ok\\b")
+FIRMWARE_VERSION_TERMINATOR: Pattern[str] = re.compile("^ok [a-zA-Z0-9_.]+\\s*$")
+PRINT_STATUS_TERMINATOR: Pattern[str] = re.compile("^ok .*D:[0-9]+/[0-9]+/[0-9]+")
+Z_POS_TERMINATOR: Pattern[str] = re.compile("^ok .*Z:[0-9.]+")
+SELECTED_FILE_TERMINATOR: Pattern[str] = re.compile("^ok '")
+
+# how many unsolicited lines we hold on to before dropping the oldest ones
+MAX_UNSOLICITED_LINES = 100
+
+# a printer which keeps sending lines without ever sending the one we're waiting
+# for would otherwise keep us reading forever, and every other command would be
+# stuck waiting for its turn behind us. responses are a handful of lines long and
+# take a fraction of a second, so these are far beyond what a healthy printer
+# ever needs.
+MAX_RESPONSE_LINES = 100
+RESPONSE_DEADLINE_SECS = 10.0
+
+
 class ChiTuPrinter:
     _serial_port: serial.Serial
+    _unsolicited_lines: Deque[str]
 
     def __init__(self) -> None:
         # pyre-fixme[16]: pyserial stubs aren't working
@@ -34,6 +59,7 @@ class ChiTuPrinter:
             baudrate=config.get_printer_baudrate(),
             timeout=0.1,
         )
+        self._unsolicited_lines = collections.deque(maxlen=MAX_UNSOLICITED_LINES)
 
     def _extract_response_with_regex(self, regex: str, data: str) -> Match[str]:
         match = re.search(regex, data)
@@ -62,16 +88,16 @@ class ChiTuPrinter:
         return False
 
     def get_firmware_version(self) -> str:
-        data = self._send_and_read(b"M4002")
+        data = self._send_and_read(b"M4002", terminator=FIRMWARE_VERSION_TERMINATOR)
         return self._extract_response_with_regex("^ok ([a-zA-Z0-9_.]+)\n$", data).group(
             1
         )
 
     def get_state(self) -> str:
-        return self._send_and_read(b"M4000")
+        return self._send_and_read(b"M4000", terminator=PRINT_STATUS_TERMINATOR)
 
     def get_print_status(self) -> PrintStatus:
-        data = self._send_and_read(b"M4000")
+        data = self._send_and_read(b"M4000", terminator=PRINT_STATUS_TERMINATOR)
         match = self._extract_response_with_regex("D:([0-9]+)/([0-9]+)/([0-9]+)", data)
 
         current_byte = int(match.group(1))
@@ -95,11 +121,11 @@ class ChiTuPrinter:
         )
 
     def get_z_pos(self) -> float:
-        data = self._send_and_read(b"M114")
+        data = self._send_and_read(b"M114", terminator=Z_POS_TERMINATOR)
         return float(self._extract_response_with_regex("Z:([0-9.]+)", data).group(1))
 
     def get_selected_file(self) -> str:
-        data = self._send_and_read(b"M4006")
+        data = self._send_and_read(b"M4006", terminator=SELECTED_FILE_TERMINATOR)
         selected_file = str(
             self._extract_response_with_regex("ok '([^']+)'\r\n", data).group(1)
         )
@@ -164,7 +190,19 @@ class ChiTuPrinter:
     def reboot(self, delay_in_ms: int = 0) -> None:
         self._send((f"M6040 I{delay_in_ms}").encode())
 
-    def _send_and_read(self, data: bytes, timeout_secs: Optional[float] = None) -> str:
+    def pop_unsolicited_lines(self) -> List[str]:
+        # returns the lines the printer sent which weren't part of the response to
+        # any command, oldest first
+        lines = list(self._unsolicited_lines)
+        self._unsolicited_lines.clear()
+        return lines
+
+    def _send_and_read(
+        self,
+        data: bytes,
+        timeout_secs: Optional[float] = None,
+        terminator: Pattern[str] = OK_TERMINATOR,
+    ) -> str:
         self._serial_port.reset_input_buffer()
         self._serial_port.reset_output_buffer()
 
@@ -173,13 +211,31 @@ class ChiTuPrinter:
         original_timeout = self._serial_port.timeout
         if timeout_secs is not None:
             self._serial_port.timeout = timeout_secs
-        response = self._serial_port.readline().decode("utf-8")
-        if timeout_secs is not None:
-            self._serial_port.timeout = original_timeout
-        # TODO actually read the rest of the response instead of just
-        # flushing it like this
-        self._serial_port.read(size=1024)
-        return response
+        deadline = time.monotonic() + max(RESPONSE_DEADLINE_SECS, timeout_secs or 0.0)
+        try:
+            return self._read_response(terminator, deadline)
+        finally:
+            if timeout_secs is not None:
+                self._serial_port.timeout = original_timeout
+
+    def _read_response(self, terminator: Pattern[str], deadline: float) -> str:
+        # reads line by line until we get the line which terminates the response, so
+        # we can return as soon as the printer is done replying. if the printer stops
+        # sending data before that, readline times out and we return whatever we got.
+        response = ""
+        for _ in range(MAX_RESPONSE_LINES):
+            if time.monotonic() >= deadline:
+                break
+            line = self._serial_port.readline().decode("utf-8")
+            if terminator.search(line):
+                return response + line
+            if terminator is not OK_TERMINATOR and OK_TERMINATOR.search(line):
+                self._unsolicited_lines.append(line)
+            else:
+                response += line
+            if not line.endswith("\n"):
+                return response
+        raise UnexpectedPrinterResponse(response)
 
     def _send(self, data: bytes) -> None:
         self._serial_port.write(data)
@@ -1,7 +1,9 @@
 import logging
 import multiprocessing
 import os
-from typing import Dict
+import threading
+import time
+from typing import Dict, List, Mapping, Optional
 
 from flask import render_template
 from waitress import serve
@@ -10,13 +12,17 @@ from mariner import config
 from mariner.file_formats.utils import get_supported_extensions
 from mariner.server.api import api as api_blueprint
 from mariner.server.app import app as flask_app
+from mariner.server.cache_work_queue import HEARTBEAT_INTERVAL_SECS, cache_work_queue
+from mariner.server.file_watcher import FileChanges, create_file_watcher, scan_directory
 from mariner.server.utils import (
-    read_cached_preview,
+    FileFingerprint,
+    collect_cache_garbage,
+    get_cached_preview_path,
+    get_indexed_fingerprints,
     read_cached_sliced_model_file,
+    remove_indexed_files,
 )
 
-from itertools import chain
-
 
 flask_app.register_blueprint(api_blueprint)
 
@@ -32,16 +38,188 @@ def index() -> str:
     return render_template("index.html", **template_vars)
 
 
+# how long idle workers wait before checking the queue for new files again
+WORK_QUEUE_POLL_INTERVAL_SECS = 0.5
+
+# how often the bootstrapper checks on its workers, and replaces the ones which
+# died (such as when a file crashes the parser, or when they run out of memory)
+WORKER_CHECK_INTERVAL_SECS = 30.0
+
+# how often cached previews of deleted files get cleaned up, and the cache gets
+# trimmed down to its size limit
+CACHE_GARBAGE_COLLECTION_INTERVAL_SECS = 10 * 60
+
+
+def _cache_file(relative_path: str) -> None:
+    path = config.get_files_directory() / relative_path
+    started_at = time.perf_counter()
+    error: Optional[str] = None
+    try:
+        fingerprint = FileFingerprint.from_path(path)
+        read_cached_sliced_model_file(path, fingerprint)
+        get_cached_preview_path(path, fingerprint)
+        # thumbnails which request handlers are waiting for
+        for size in cache_work_queue.take_preview_sizes(relative_path):
+            get_cached_preview_path(path, fingerprint, size)
+    except Exception as exception:
+        # a single broken file shouldn't keep the rest of them from being cached
+        logging.getLogger(__name__).exception(f"Failed to cache {path}")
+        error = repr(exception)
+    cache_work_queue.finish(relative_path, time.perf_counter() - started_at, error)
+
+
+def _send_heartbeats(stopped: threading.Event) -> None:
+    while True:
+        cache_work_queue.beat()
+        if stopped.wait(HEARTBEAT_INTERVAL_SECS):
+            return
+
+
+def _process_cache_work_queue(keep_running: bool) -> None:
+    # takes files off the shared work queue until it's empty, or forever if
+    # keep_running is set, in which case files queued later on by request
+    # handlers get picked up as well
+    stopped = threading.Event()
+    heartbeat_thread = threading.Thread(
+        target=_send_heartbeats,
+        args=(stopped,),
+        name="cache-worker-heartbeat",
+        daemon=True,
+    )
+    heartbeat_thread.start()
+    try:
+        while True:
+            relative_path = cache_work_queue.claim()
+            if relative_path is not None:
+                _cache_file(relative_path)
+            elif keep_running:
+                time.sleep(WORK_QUEUE_POLL_INTERVAL_SECS)
+            else:
+                return
+    finally:
+        stopped.set()
+        heartbeat_thread.join()
+
+
+def _apply_file_changes(changes: FileChanges) -> None:
+    files_directory = config.get_files_directory()
+    if changes.deleted:
+        remove_indexed_files(
+            [files_directory / relative_path for relative_path in changes.deleted]
+        )
+        cache_work_queue.remove(changes.deleted)
+    if changes.changed:
+        # files might have been caught half-written before, so they get another
+        # chance now
+        cache_work_queue.push(changes.changed, retry_failed=True)
+
+
+def _collect_cache_garbage(files: Mapping[str, FileFingerprint]) -> None:
+    files_directory = config.get_files_directory()
+    num_removed = collect_cache_garbage(
+        {
+            str(files_directory / relative_path): fingerprint
+            for (relative_path, fingerprint) in files.items()
+        }
+    )
+    if num_removed > 0:
+        logging.getLogger(__name__).info(
+            f"Removed {num_removed} previews from the cache"
+        )
+
+
 class CacheBootstrapper(multiprocessing.Process):
+    _num_processes: int
+    _keep_running: bool
+
+    def __init__(
+        self, num_processes: Optional[int] = None, keep_running: bool = True
+    ) -> None:
+        super().__init__()
+        self._num_processes = (
+            num_processes
+            if num_processes is not None
+            else config.get_cache_bootstrapper_processes()
+        )
+        self._keep_running = keep_running
+
+    def _start_run(self, files: Dict[str, FileFingerprint]) -> None:
+        # only the files which changed since they were indexed get queued up, so
+        # restarting doesn't mean going through every file again
+        files_directory = config.get_files_directory()
+        indexed_fingerprints = get_indexed_fingerprints()
+        fingerprint_by_path = {
+            str(files_directory / relative_path): fingerprint
+            for (relative_path, fingerprint) in files.items()
+        }
+        # files which were deleted while we weren't running
+        remove_indexed_files(
+            [path for path in indexed_fingerprints if path not in fingerprint_by_path]
+        )
+        uncached_files = [
+            relative_path
+            for (relative_path, fingerprint) in files.items()
+            if indexed_fingerprints.get(str(files_directory / relative_path))
+            != fingerprint
+        ]
+        # the most recently modified files come first, since those are the ones
+        # users are most likely to open next
+        uncached_files.sort(key=lambda path: files[path].mtime_ns, reverse=True)
+        cache_work_queue.start_run(
+            uncached_files, skipped_count=len(files) - len(uncached_files)
+        )
+
+    def _start_worker(self, index: int) -> multiprocessing.Process:
+        worker = multiprocessing.Process(
+            target=_process_cache_work_queue,
+            args=(self._keep_running,),
+            name=f"cache-worker-{index}",
+            daemon=True,
+        )
+        worker.start()
+        return worker
+
+    def _restart_dead_workers(self, workers: List[multiprocessing.Process]) -> None:
+        # the files dead workers were in the middle of get queued up again once
+        # their lease expires
+        for (index, worker) in enumerate(workers):
+            if worker.is_alive():
+                continue
+            logging.getLogger(__name__).warning(
+                f"{worker.name} exited with code {worker.exitcode}, restarting it"
+            )
+            workers[index] = self._start_worker(index)
+
     def run(self) -> None:
         os.nice(5)
-        globs = [
-            config.get_files_directory().rglob(f"*{extension}")
-            for extension in get_supported_extensions()
-        ]
-        for file in chain.from_iterable(globs):
-            read_cached_sliced_model_file(file.absolute())
-            read_cached_preview(file.absolute())
+        files_directory = config.get_files_directory()
+        files = scan_directory(files_directory)
+        self._start_run(files)
+        _collect_cache_garbage(files)
+        if self._num_processes == 1 and not self._keep_running:
+            _process_cache_work_queue(keep_running=False)
+            return
+        workers = [self._start_worker(i) for i in range(self._num_processes)]
+        if not self._keep_running:
+            for worker in workers:
+                worker.join()
+            return
+        # workers take care of the files, while we keep an eye on the files
+        # directory and queue up whatever changes from now on, as well as on the
+        # workers themselves
+        file_watcher = create_file_watcher(files_directory, files)
+        last_collected_at = time.monotonic()
+        while True:
+            _apply_file_changes(
+                file_watcher.wait_for_changes(timeout_secs=WORKER_CHECK_INTERVAL_SECS)
+            )
+            self._restart_dead_workers(workers)
+            if (
+                time.monotonic() - last_collected_at
+                >= CACHE_GARBAGE_COLLECTION_INTERVAL_SECS
+            ):
+                _collect_cache_garbage(file_watcher.files)
+                last_collected_at = time.monotonic()
 
 
 def main() -> None:
@@ -49,4 +227,9 @@ def main() -> None:
 
     logger = logging.getLogger("waitress")
     logger.setLevel(logging.INFO)
-    serve(flask_app, host=config.get_http_host(), port=config.get_http_port())
+    serve(
+        flask_app,
+        host=config.get_http_host(),
+        port=config.get_http_port(),
+        threads=config.get_http_threads(),
+    )
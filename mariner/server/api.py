@@ -1,33 +1,73 @@
+import base64
+import datetime
+import hashlib
+import json
+import logging
 import os
+import pathlib
+import stat
+import tempfile
+import time
 import traceback
 from enum import Enum
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 from flask import (
     Blueprint,
     Response,
     abort,
     jsonify,
-    make_response,
     request,
+    send_file,
 )
 from pyre_extensions import none_throws
 from werkzeug.utils import secure_filename
 
 from mariner import config
-from mariner.exceptions import MarinerException, UnexpectedPrinterResponse
+from mariner.exceptions import MarinerException
 from mariner.file_formats import SlicedModelFile
+from mariner.file_formats.layer_table import get_layer_progress
 from mariner.file_formats.utils import get_file_extension, get_supported_extensions
-from mariner.printer import ChiTuPrinter, PrinterState
+from mariner.printer import PrinterState
+from mariner.server.cache_work_queue import cache_work_queue
+from mariner.server.print_status_poller import (
+    PrintStatusSnapshot,
+    print_status_poller,
+)
+from mariner.server.printer_connection import printer_connection
 from mariner.server.utils import (
-    read_cached_preview,
+    TEMPORARY_UPLOAD_PREFIX,
+    TEMPORARY_UPLOAD_SUFFIX,
+    FileFingerprint,
+    get_cached_preview_path,
+    get_cached_preview_paths,
+    get_preview_thumbnail_size,
+    get_preview_version,
+    invalidate_cached_file,
+    is_temporary_upload,
     read_cached_sliced_model_file,
-    retry,
+    read_cached_sliced_model_files,
+    read_indexed_sliced_model_files,
+    search_indexed_sliced_model_files,
+    sliced_model_file_memory_cache,
 )
 
 
 api = Blueprint("api", __name__, url_prefix="/api")
 
+PRINT_STATUS_STREAM_KEEPALIVE_SECS: float = 15.0
+
+# how long browsers get to keep previews requested through their versioned url
+PREVIEW_MAX_AGE_SECS: int = 365 * 24 * 60 * 60
+
+# mkstemp only lets the owner read the files it creates. this only matters on
+# filesystems which keep track of permissions, unlike the vfat one the files
+# directory usually is on.
+UPLOADED_FILE_MODE: int = 0o644
+
+# how many previews can be asked for at once through file_previews
+MAX_BATCH_PREVIEWS: int = 100
+
 
 @api.errorhandler(MarinerException)
 def handle_mariner_exception(exception: MarinerException) -> Tuple[str, int]:
@@ -44,69 +84,168 @@ def handle_mariner_exception(exception: MarinerException) -> Tuple[str, int]:
     )
 
 
-@api.route("/print_status", methods=["GET"])
-def print_status() -> str:
-    with ChiTuPrinter() as printer:
-        # the printer sends periodic "ok" responses over serial. this means that
-        # sometimes we get an unexpected response from the printer (an "ok" instead of
-        # the print status we expected). due to this, we retry at most 3 times here
-        # until we have a successful response. see issue #180
-        selected_file = retry(
-            printer.get_selected_file,
-            UnexpectedPrinterResponse,
-            num_retries=3,
+def _get_etag(*parts: object) -> str:
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+def _is_not_modified(
+    etag: str, last_modified: Optional[datetime.datetime] = None
+) -> bool:
+    # conditional requests get answered before doing any actual work, such as
+    # parsing files
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def _with_validators(
+    response: Response,
+    etag: str,
+    *,
+    weak: bool = False,
+    last_modified: Optional[datetime.datetime] = None,
+) -> Response:
+    response.set_etag(etag, weak=weak)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # browsers may keep responses around, but need to check with us whether
+    # they're still up to date before using them again
+    response.headers.set("Cache-Control", "no-cache")
+    return response
+
+
+def _get_print_status_data(snapshot: PrintStatusSnapshot) -> Dict[str, Any]:
+    (selected_file, print_status) = (snapshot.selected_file, snapshot.print_status)
+
+    if print_status.state == PrinterState.IDLE:
+        progress = 0.0
+        print_details = {}
+    else:
+        sliced_model_file = read_cached_sliced_model_file(
+            config.get_files_directory() / selected_file
         )
-        print_status = retry(
-            printer.get_print_status,
-            UnexpectedPrinterResponse,
-            num_retries=3,
+
+        (current_layer, layers_printed) = get_layer_progress(
+            sliced_model_file.end_byte_offset_by_layer,
+            none_throws(print_status.current_byte),
+            none_throws(print_status.total_bytes),
         )
+        progress = 100.0 * layers_printed / max(sliced_model_file.layer_count, 1)
 
-        if print_status.state == PrinterState.IDLE:
-            progress = 0.0
-            print_details = {}
-        else:
-            sliced_model_file = read_cached_sliced_model_file(
-                config.get_files_directory() / selected_file
-            )
+        print_details = {
+            "current_layer": current_layer,
+            "layer_count": sliced_model_file.layer_count,
+            "print_time_secs": sliced_model_file.print_time_secs,
+            "time_left_secs": round(
+                sliced_model_file.print_time_secs * (100.0 - progress) / 100.0
+            ),
+        }
 
-            if print_status.current_byte == 0:
-                current_layer = 1
-            else:
-                current_layer = (
-                    sliced_model_file.end_byte_offset_by_layer.index(
-                        print_status.current_byte
-                    )
-                    + 1
-                )
-
-            progress = (
-                100.0
-                * none_throws(current_layer - 1)
-                / none_throws(sliced_model_file.layer_count)
-            )
+    return {
+        "state": print_status.state.value,
+        "selected_file": selected_file,
+        "progress": progress,
+        "status_age_secs": round(snapshot.get_age_secs(), 3),
+        **print_details,
+    }
 
-            print_details = {
-                "current_layer": current_layer,
-                "layer_count": sliced_model_file.layer_count,
-                "print_time_secs": sliced_model_file.print_time_secs,
-                "time_left_secs": round(
-                    sliced_model_file.print_time_secs * (100.0 - progress) / 100.0
-                ),
-            }
 
-        return jsonify(
-            {
-                "state": print_status.state.value,
-                "selected_file": selected_file,
-                "progress": progress,
-                **print_details,
-            }
+@api.route("/print_status", methods=["GET"])
+def print_status() -> Response:
+    snapshot = print_status_poller.get_snapshot()
+    # the age of the snapshot isn't taken into account, so the etag is weak: a
+    # status which didn't change is considered the same regardless of its age
+    etag = _get_etag(snapshot.selected_file, snapshot.print_status)
+    if _is_not_modified(etag):
+        return _with_validators(Response(status=304), etag, weak=True)
+    return _with_validators(jsonify(_get_print_status_data(snapshot)), etag, weak=True)
+
+
+def _generate_print_status_events() -> Iterator[str]:
+    snapshot = print_status_poller.get_snapshot()
+    last_sent_data: Optional[Dict[str, Any]] = None
+    last_sent_at = time.monotonic()
+    while True:
+        data = _get_print_status_data(snapshot)
+        # the age of the snapshot changes all the time, so it's not taken into
+        # account when deciding whether the status changed
+        comparable_data = {
+            key: value for (key, value) in data.items() if key != "status_age_secs"
+        }
+        if comparable_data != last_sent_data:
+            yield f"data: {json.dumps(data)}\n\n"
+            (last_sent_data, last_sent_at) = (comparable_data, time.monotonic())
+        elif time.monotonic() - last_sent_at >= PRINT_STATUS_STREAM_KEEPALIVE_SECS:
+            # comments are ignored by clients, but keep proxies from timing out
+            # the connection and let us find out when the client goes away
+            yield ": keepalive\n\n"
+            last_sent_at = time.monotonic()
+        snapshot = print_status_poller.wait_for_next_snapshot(
+            snapshot, timeout_secs=PRINT_STATUS_STREAM_KEEPALIVE_SECS
         )
 
 
+@api.route("/print_status/stream", methods=["GET"])
+def print_status_stream() -> Response:
+    response = Response(
+        _generate_print_status_events(),
+        mimetype="text/event-stream",
+    )
+    response.headers.set("Cache-Control", "no-cache")
+    return response
+
+
+class FileListSortKey(Enum):
+    MTIME = "mtime"
+    NAME = "name"
+    PRINT_TIME = "print_time"
+    SIZE = "size"
+
+
+# the most recent, longest and largest files come first unless asked otherwise
+DESCENDING_FILE_LIST_SORT_KEYS: Set[FileListSortKey] = {
+    FileListSortKey.MTIME,
+    FileListSortKey.PRINT_TIME,
+    FileListSortKey.SIZE,
+}
+
+
+def _get_non_negative_int_arg(name: str) -> Optional[int]:
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        parsed_value = int(value)
+    except ValueError:
+        abort(400)
+    if parsed_value < 0:
+        abort(400)
+    return parsed_value
+
+
+def _get_float_arg(name: str) -> Optional[float]:
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        abort(400)
+
+
+def _is_apple_double_file(dir_entry: "os.DirEntry[str]") -> bool:
+    # macOS leaves these behind when copying files over, and they share the name
+    # and extension of the file they belong to
+    if not dir_entry.name.startswith("._"):
+        return False
+    with open(dir_entry, "rb") as file:
+        return b"Mac OS X" in file.read(32)
+
+
 @api.route("/list_files", methods=["GET"])
-def list_files() -> str:
+def list_files() -> Response:
     path_parameter = str(request.args.get("path", "."))
     path = (config.get_files_directory() / path_parameter).resolve()
     if (
@@ -114,65 +253,276 @@ def list_files() -> str:
         and path != config.get_files_directory()
     ):
         abort(400)
+    try:
+        sort_key = FileListSortKey(request.args.get("sort_by", "mtime"))
+    except ValueError:
+        abort(400)
+    order = request.args.get(
+        "order", "desc" if sort_key in DESCENDING_FILE_LIST_SORT_KEYS else "asc"
+    )
+    if order not in ("asc", "desc"):
+        abort(400)
+    extensions_parameter = request.args.get("extensions")
+    extensions: Optional[Set[str]] = None
+    if extensions_parameter is not None:
+        extensions = {
+            get_file_extension(f"file.{extension.lstrip('.')}")
+            for extension in extensions_parameter.split(",")
+            if extension != ""
+        }
+    offset = _get_non_negative_int_arg("offset") or 0
+    limit = _get_non_negative_int_arg("limit")
+
+    # every entry gets stat'ed exactly once, and everything below works off of
+    # that (including sorting)
+    entries: List[Tuple["os.DirEntry[str]", os.stat_result]] = []
     with os.scandir(path) as dir_entries:
-        files = []
-        directories = []
-        for dir_entry in sorted(
-            dir_entries, key=lambda t: t.stat().st_mtime, reverse=True
-        ):
-            if dir_entry.is_file():
-                sliced_model_file: Optional[SlicedModelFile] = None
-                if get_file_extension(dir_entry.name) in get_supported_extensions():
-                    if dir_entry.name.startswith("._"):
-                        if b"Mac OS X" not in open(dir_entry, "rb").read(32):
-                            sliced_model_file = read_cached_sliced_model_file(
-                                path / dir_entry.name
-                            )
-                    else:
-                        sliced_model_file = read_cached_sliced_model_file(
-                            path / dir_entry.name
-                        )
-
-                file_data: Dict[str, Any] = {
-                    "filename": dir_entry.name,
+        for dir_entry in dir_entries:
+            if is_temporary_upload(dir_entry.name):
+                # uploads still in progress aren't files one can print yet
+                continue
+            try:
+                entries.append((dir_entry, dir_entry.stat()))
+            except FileNotFoundError:
+                # deleted while we were listing the directory, or a broken link
+                continue
+    # the listing only changes when an entry is added, removed or modified, so
+    # that's what the etag is made out of
+    etag = _get_etag(
+        str(path),
+        sort_key,
+        order,
+        sorted(extensions) if extensions is not None else None,
+        offset,
+        limit,
+        sorted(
+            (
+                dir_entry.name,
+                stat_result.st_mode,
+                stat_result.st_size,
+                stat_result.st_mtime_ns,
+                stat_result.st_ino,
+            )
+            for (dir_entry, stat_result) in entries
+        ),
+    )
+    if _is_not_modified(etag):
+        return _with_validators(Response(status=304), etag)
+    # ties are broken by name
+    entries.sort(key=lambda entry: entry[0].name)
+    directory_entries = [
+        (dir_entry, stat_result)
+        for (dir_entry, stat_result) in entries
+        if stat.S_ISDIR(stat_result.st_mode)
+    ]
+    file_entries = [
+        (dir_entry, stat_result)
+        for (dir_entry, stat_result) in entries
+        if stat.S_ISREG(stat_result.st_mode)
+        and (extensions is None or get_file_extension(dir_entry.name) in extensions)
+    ]
+    sliced_file_names = {
+        dir_entry.name
+        for (dir_entry, _) in file_entries
+        if get_file_extension(dir_entry.name) in get_supported_extensions()
+        and not _is_apple_double_file(dir_entry)
+    }
+
+    sliced_model_file_by_path: Dict[str, SlicedModelFile] = {}
+    reverse = order == "desc"
+    # whether files which are still waiting to be parsed could end up in a
+    # different place once they are
+    is_order_pending = False
+    if sort_key == FileListSortKey.PRINT_TIME:
+        # print times come from the metadata index, so every file needs to be
+        # looked up before we can tell which ones go in the requested page. files
+        # which haven't been parsed yet go last.
+        sliced_model_file_by_path = read_indexed_sliced_model_files(
+            [
+                (path / dir_entry.name, FileFingerprint.from_stat(stat_result))
+                for (dir_entry, stat_result) in file_entries
+                if dir_entry.name in sliced_file_names
+            ]
+        )
+        print_time_by_name = {
+            dir_entry.name: sliced_model_file_by_path[
+                str(path / dir_entry.name)
+            ].print_time_secs
+            for (dir_entry, _) in file_entries
+            if str(path / dir_entry.name) in sliced_model_file_by_path
+        }
+        file_entries.sort(
+            key=lambda entry: print_time_by_name.get(entry[0].name, 0), reverse=reverse
+        )
+        file_entries.sort(key=lambda entry: entry[0].name not in print_time_by_name)
+        is_order_pending = len(print_time_by_name) < len(sliced_file_names)
+    elif sort_key == FileListSortKey.NAME:
+        file_entries.sort(key=lambda entry: entry[0].name.lower(), reverse=reverse)
+    elif sort_key == FileListSortKey.SIZE:
+        file_entries.sort(key=lambda entry: entry[1].st_size, reverse=reverse)
+    else:
+        file_entries.sort(key=lambda entry: entry[1].st_mtime_ns, reverse=reverse)
+    if sort_key == FileListSortKey.MTIME:
+        directory_entries.sort(key=lambda entry: entry[1].st_mtime_ns, reverse=reverse)
+
+    end = len(file_entries) if limit is None else min(offset + limit, len(file_entries))
+    page_entries = file_entries[offset:end]
+
+    # only the sliced files in the requested page get their metadata, which is
+    # looked up in the metadata index all at once rather than one by one
+    sliced_files: List[Tuple[pathlib.Path, FileFingerprint]] = [
+        (path / dir_entry.name, FileFingerprint.from_stat(stat_result))
+        for (dir_entry, stat_result) in page_entries
+        if dir_entry.name in sliced_file_names
+        and str(path / dir_entry.name) not in sliced_model_file_by_path
+    ]
+    sliced_model_file_by_path.update(read_indexed_sliced_model_files(sliced_files))
+
+    uncached_files = [
+        (file_path, fingerprint)
+        for (file_path, fingerprint) in sliced_files
+        if str(file_path) not in sliced_model_file_by_path
+    ]
+    pending_paths: Set[str] = set()
+    if uncached_files and cache_work_queue.has_live_workers():
+        # rather than parsing the files ourselves, we move them to the front of
+        # the cache workers' queue and list them as pending for now
+        relative_path_by_path = {
+            str(file_path): str(file_path.relative_to(config.get_files_directory()))
+            for (file_path, _) in uncached_files
+        }
+        failed_relative_paths = cache_work_queue.push(
+            list(relative_path_by_path.values())
+        )
+        pending_paths = {
+            file_path
+            for (file_path, relative_path) in relative_path_by_path.items()
+            if relative_path not in failed_relative_paths
+        }
+    elif uncached_files:
+        sliced_model_file_by_path.update(
+            zip(
+                (str(file_path) for (file_path, _) in uncached_files),
+                read_cached_sliced_model_files(uncached_files),
+            )
+        )
+
+    files = []
+    for (dir_entry, _) in page_entries:
+        sliced_model_file = (
+            sliced_model_file_by_path.get(str(path / dir_entry.name))
+            if dir_entry.name in sliced_file_names
+            else None
+        )
+
+        file_data: Dict[str, Any] = {
+            "filename": dir_entry.name,
+            "path": str(
+                (path / dir_entry.name).relative_to(config.get_files_directory())
+            ),
+        }
+
+        if sliced_model_file:
+            file_data = {
+                "print_time_secs": sliced_model_file.print_time_secs,
+                "can_be_printed": True,
+                **file_data,
+            }
+        elif str(path / dir_entry.name) in pending_paths:
+            file_data = {
+                "can_be_printed": True,
+                "pending": True,
+                **file_data,
+            }
+        else:
+            file_data = {
+                "can_be_printed": False,
+                **file_data,
+            }
+
+        files.append(file_data)
+    response = jsonify(
+        {
+            # directories are only listed along with the first page of files
+            "directories": (
+                [{"dirname": dir_entry.name} for (dir_entry, _) in directory_entries]
+                if offset == 0
+                else []
+            ),
+            "files": files,
+            "total_files": len(file_entries),
+            "next_offset": end if end < len(file_entries) else None,
+        }
+    )
+    if pending_paths or is_order_pending:
+        # this listing is going to change as soon as the pending files are
+        # parsed, even though the directory won't
+        return response
+    return _with_validators(response, etag)
+
+
+# how many files /search returns at most, unless asked for fewer
+MAX_SEARCH_RESULTS = 100
+
+
+@api.route("/search", methods=["GET"])
+def search() -> str:
+    # searches through every sliced file under the files directory, including
+    # subdirectories. this is answered entirely from the metadata index, so files
+    # which haven't been parsed yet don't show up.
+    offset = _get_non_negative_int_arg("offset") or 0
+    limit = min(
+        _get_non_negative_int_arg("limit") or MAX_SEARCH_RESULTS, MAX_SEARCH_RESULTS
+    )
+    (results, total_files) = search_indexed_sliced_model_files(
+        config.get_files_directory(),
+        name=request.args.get("name"),
+        printer_name=request.args.get("printer_name"),
+        slicer_version=request.args.get("slicer_version"),
+        layer_height_mm=_get_float_arg("layer_height_mm"),
+        min_print_time_secs=_get_non_negative_int_arg("min_print_time_secs"),
+        max_print_time_secs=_get_non_negative_int_arg("max_print_time_secs"),
+        limit=limit,
+        offset=offset,
+    )
+    end = offset + len(results)
+    return jsonify(
+        {
+            "files": [
+                {
+                    "filename": sliced_model_file.filename,
                     "path": str(
-                        (path / dir_entry.name).relative_to(
-                            config.get_files_directory()
-                        )
+                        pathlib.Path(path).relative_to(config.get_files_directory())
                     ),
+                    "print_time_secs": sliced_model_file.print_time_secs,
+                    "layer_height_mm": round(sliced_model_file.layer_height_mm, 4),
+                    "printer_name": sliced_model_file.printer_name,
+                    "slicer_version": sliced_model_file.slicer_version,
+                    "can_be_printed": True,
                 }
-
-                if sliced_model_file:
-                    file_data = {
-                        "print_time_secs": sliced_model_file.print_time_secs,
-                        "can_be_printed": True,
-                        **file_data,
-                    }
-                else:
-                    file_data = {
-                        "can_be_printed": False,
-                        **file_data,
-                    }
-
-                files.append(file_data)
-            else:
-                directories.append({"dirname": dir_entry.name})
-        return jsonify(
-            {
-                "directories": directories,
-                "files": files,
-            }
-        )
+                for (path, sliced_model_file) in results
+            ],
+            "total_files": total_files,
+            "next_offset": end if end < total_files else None,
+        }
+    )
 
 
 @api.route("/file_details", methods=["GET"])
-def file_details() -> str:
+def file_details() -> Response:
     filename = str(request.args.get("filename"))
     path = (config.get_files_directory() / filename).resolve()
     if config.get_files_directory() not in path.parents:
         abort(400)
-    sliced_model_file = read_cached_sliced_model_file(path)
-    return jsonify(
+    fingerprint = FileFingerprint.from_path(path)
+    etag = _get_etag(filename, fingerprint)
+    last_modified = datetime.datetime.fromtimestamp(
+        fingerprint.mtime_ns / 1e9, tz=datetime.timezone.utc
+    )
+    if _is_not_modified(etag, last_modified):
+        return _with_validators(Response(status=304), etag, last_modified=last_modified)
+    sliced_model_file = read_cached_sliced_model_file(path, fingerprint)
+    response = jsonify(
         {
             "filename": sliced_model_file.filename,
             "path": filename,
@@ -182,8 +532,10 @@ def file_details() -> str:
             "layer_height_mm": round(sliced_model_file.layer_height_mm, 4),
             "resolution": list(sliced_model_file.resolution),
             "print_time_secs": sliced_model_file.print_time_secs,
+            "preview_version": get_preview_version(path, fingerprint),
         }
     )
+    return _with_validators(response, etag, last_modified=last_modified)
 
 
 @api.route("/upload_file", methods=["POST"])
@@ -194,7 +546,37 @@ def upload_file() -> str:
     if get_file_extension(file.filename) not in get_supported_extensions():
         abort(400)
     filename = secure_filename(file.filename)
-    file.save(str(config.get_files_directory() / filename))
+    path = config.get_files_directory() / filename
+    replaced_fingerprint = (
+        FileFingerprint.from_path(path) if os.path.isfile(path) else None
+    )
+    # the upload is written next to the file it replaces and then moved into
+    # place, so a file which is being read through a memory mapping never gets
+    # truncated while it's mapped
+    (fd, temporary_path) = tempfile.mkstemp(
+        dir=config.get_files_directory(),
+        prefix=TEMPORARY_UPLOAD_PREFIX,
+        suffix=TEMPORARY_UPLOAD_SUFFIX,
+    )
+    try:
+        with os.fdopen(fd, "wb") as temporary_file:
+            file.save(temporary_file)
+        try:
+            os.chmod(temporary_path, UPLOADED_FILE_MODE)
+        except PermissionError:
+            # vfat refuses to change permissions of files the process doesn't
+            # own, which is all of them when it's mounted without a uid, and it
+            # wouldn't keep them anyway
+            pass
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+    if replaced_fingerprint is not None:
+        # only now that the old file is gone can what we cached about it be
+        # dropped. doing so any earlier would leave a window for it to be
+        # cached all over again before being replaced.
+        invalidate_cached_file(path, replaced_fingerprint)
     os.sync()
     return jsonify({"success": True})
 
@@ -209,28 +591,124 @@ def delete_file() -> str:
     # seem to properly mock Path.is_file as of pyfakefs 4.4.0
     if not os.path.isfile(path):
         abort(400)
+    fingerprint = FileFingerprint.from_path(path)
     os.remove(path)
+    invalidate_cached_file(path, fingerprint)
+    cache_work_queue.remove([str(path.relative_to(config.get_files_directory()))])
     return jsonify({"success": True})
 
 
+def _get_preview_thumbnail_size_arg() -> Optional[int]:
+    # thumbnails are requested by the largest dimension they'll be shown at
+    size = _get_non_negative_int_arg("size")
+    if size == 0:
+        abort(400)
+    return get_preview_thumbnail_size(size) if size is not None else None
+
+
 @api.route("/file_preview", methods=["GET"])
 def file_preview() -> Response:
     filename = str(request.args.get("filename"))
     path = (config.get_files_directory() / filename).resolve()
     if config.get_files_directory() not in path.parents:
         abort(400)
+    thumbnail_size = _get_preview_thumbnail_size_arg()
+
+    fingerprint = FileFingerprint.from_path(path)
+    version = get_preview_version(path, fingerprint)
+    etag = version if thumbnail_size is None else f"{version}-{thumbnail_size}"
+    if _is_not_modified(etag):
+        response = Response(status=304)
+    else:
+        # previews are plain png files on disk, so they get streamed straight
+        # from there by the wsgi server instead of being read into memory first
+        response = send_file(
+            get_cached_preview_path(path, fingerprint, thumbnail_size),
+            mimetype="image/png",
+            as_attachment=True,
+            download_name=f"{filename}.png",
+            conditional=False,
+            etag=False,
+        )
+    if request.args.get("v") == version:
+        # the preview behind a versioned url never changes, since a different
+        # file gets a different version
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = PREVIEW_MAX_AGE_SECS
+        response.cache_control.immutable = True
+        return response
+    return _with_validators(response, etag)
+
+
+def _generate_file_preview_lines(
+    files: List[Tuple[str, pathlib.Path]], thumbnail_size: Optional[int]
+) -> Iterator[str]:
+    existing_files: Dict[str, Tuple[str, FileFingerprint]] = {}
+    for (filename, path) in files:
+        try:
+            existing_files[str(path)] = (filename, FileFingerprint.from_path(path))
+        except FileNotFoundError:
+            yield json.dumps({"path": filename, "error": "File not found"}) + "\n"
+    for (path, future) in get_cached_preview_paths(
+        [(path, fingerprint) for (path, (_, fingerprint)) in existing_files.items()],
+        thumbnail_size,
+    ):
+        (filename, fingerprint) = existing_files[path]
+        try:
+            with open(future.result(), "rb") as file:
+                data = base64.b64encode(file.read()).decode("ascii")
+        except Exception as exception:
+            # a single broken file shouldn't keep the other previews from
+            # being sent
+            logging.getLogger(__name__).exception(f"Failed to render {path}")
+            yield json.dumps({"path": filename, "error": repr(exception)}) + "\n"
+            continue
+        line = {
+            "path": filename,
+            "preview_version": get_preview_version(path, fingerprint),
+            "data": data,
+        }
+        yield json.dumps(line) + "\n"
 
-    preview_bytes = read_cached_preview(path)
 
-    response = make_response(preview_bytes)
-    response.headers.set("Content-Type", "image/png")
-    response.headers.set(
-        "Content-Disposition", "attachment", filename=f"{filename}.png"
+@api.route("/file_previews", methods=["GET"])
+def file_previews() -> Response:
+    # previews of many files at once, such as for showing thumbnails of a whole
+    # directory. each preview is sent as a line of json with the base64 of its
+    # png as soon as it's available, so the ones which are cached already don't
+    # wait for the rest to be rendered.
+    filenames = request.args.getlist("filename")
+    if not filenames or len(filenames) > MAX_BATCH_PREVIEWS:
+        abort(400)
+    thumbnail_size = _get_preview_thumbnail_size_arg()
+    files: List[Tuple[str, pathlib.Path]] = []
+    for filename in dict.fromkeys(filenames):
+        path = (config.get_files_directory() / filename).resolve()
+        if config.get_files_directory() not in path.parents:
+            abort(400)
+        files.append((filename, path))
+
+    response = Response(
+        _generate_file_preview_lines(files, thumbnail_size),
+        mimetype="application/x-ndjson",
     )
-
+    response.headers.set("Cache-Control", "no-cache")
     return response
 
 
+@api.route("/cache/status", methods=["GET"])
+def cache_status() -> str:
+    return jsonify(
+        {
+            "bootstrap": cache_work_queue.get_status(),
+            "memory": {
+                "sliced_model_files": sliced_model_file_memory_cache.get_stats(),
+            },
+        }
+    )
+
+
 class PrinterCommand(Enum):
     START_PRINT = "start_print"
     PAUSE_PRINT = "pause_print"
@@ -242,17 +720,17 @@ class PrinterCommand(Enum):
 @api.route("/printer/command/<command>", methods=["POST"])
 def printer_command(command: str) -> str:
     printer_command = PrinterCommand(command)
-    with ChiTuPrinter() as printer:
-        if printer_command == PrinterCommand.START_PRINT:
-            # TODO: validate filename before sending it to the printer
-            filename = str(request.args.get("filename"))
-            printer.start_printing(filename)
-        elif printer_command == PrinterCommand.PAUSE_PRINT:
-            printer.pause_printing()
-        elif printer_command == PrinterCommand.RESUME_PRINT:
-            printer.resume_printing()
-        elif printer_command == PrinterCommand.CANCEL_PRINT:
-            printer.stop_printing()
-        elif printer_command == PrinterCommand.REBOOT:
-            printer.reboot()
-        return jsonify({"success": True})
+    if printer_command == PrinterCommand.START_PRINT:
+        # TODO: validate filename before sending it to the printer
+        filename = str(request.args.get("filename"))
+        printer_connection.run(lambda printer: printer.start_printing(filename))
+    elif printer_command == PrinterCommand.PAUSE_PRINT:
+        printer_connection.run(lambda printer: printer.pause_printing())
+    elif printer_command == PrinterCommand.RESUME_PRINT:
+        printer_connection.run(lambda printer: printer.resume_printing())
+    elif printer_command == PrinterCommand.CANCEL_PRINT:
+        printer_connection.run(lambda printer: printer.stop_printing())
+    elif printer_command == PrinterCommand.REBOOT:
+        printer_connection.run(lambda printer: printer.reboot())
+    print_status_poller.invalidate()
+    return jsonify({"success": True})
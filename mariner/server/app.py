@@ -6,8 +6,6 @@ from flask import Flask
 from flask_wtf.csrf import CSRFProtect
 from whitenoise import WhiteNoise
 
-from mariner import config
-
 
 def get_frontend_assets_path() -> str:
     potential_paths: Sequence[Path] = [
@@ -37,9 +35,6 @@ app.wsgi_app.add_files(frontend_dist_directory)
 app.config.from_mapping(
     {
         "DEBUG": True,
-        "CACHE_TYPE": "filesystem",
-        "CACHE_DIR": config.get_cache_directory(),
-        "CACHE_DEFAULT_TIMEOUT": 300,
         "SECRET_KEY": os.urandom(16),
     }
 )
@@ -0,0 +1,366 @@
+import sqlite3
+import time
+from enum import Enum
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from mariner.server.sqlite_store import DATABASE_PATH, SQLiteStore
+
+
+class BootstrapState(Enum):
+    IDLE = "IDLE"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+
+
+class JobState(Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+
+CACHE_WORK_QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_runs (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    started_at REAL NOT NULL,
+    skipped_count INTEGER NOT NULL,
+    heartbeat_at REAL
+);
+CREATE TABLE IF NOT EXISTS cache_jobs (
+    path TEXT PRIMARY KEY,
+    priority INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    parse_time_secs REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS cache_jobs_by_priority
+    ON cache_jobs (state, priority DESC, position);
+CREATE TABLE IF NOT EXISTS cache_preview_requests (
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (path, size)
+);
+"""
+
+# files pushed by request handlers jump ahead of the ones queued by the
+# bootstrapper when it started
+BOOSTED_PRIORITY = 1
+
+# workers let the server know they're alive every so often, from a thread of
+# their own so they keep doing so while parsing files which take a long time. if
+# they stop, request handlers go back to parsing files themselves instead of
+# queueing them up for workers which might never pick them up
+HEARTBEAT_INTERVAL_SECS = 5.0
+HEARTBEAT_TIMEOUT_SECS = 3 * HEARTBEAT_INTERVAL_SECS
+
+# files are leased to the worker which claimed them for this long. if it hasn't
+# finished with them by then, it's assumed to have died (or to be stuck) and
+# they get queued up again, so they don't stay in the running state forever.
+# this is well above how long even the largest files take to be parsed.
+JOB_LEASE_SECS = 10 * 60
+
+# how many of the slowest and failed files get reported
+MAX_REPORTED_FILES = 10
+
+
+class CacheWorkQueue(SQLiteStore):
+    # queue of files to be parsed and cached by the cache bootstrapper's workers.
+    # it's shared between the server and the workers through sqlite, so request
+    # handlers can push the files they need to the front of the queue. it also
+    # keeps track of how long each file took and of the ones which failed, which
+    # is what gets reported as the bootstrapper's progress.
+    SCHEMA: str = CACHE_WORK_QUEUE_SCHEMA
+
+    _last_heartbeat_at: float
+
+    def __init__(self, database_path: str) -> None:
+        super().__init__(database_path)
+        self._last_heartbeat_at = 0.0
+
+    def start_run(self, paths: Sequence[str], skipped_count: int) -> None:
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute("DELETE FROM cache_jobs")
+                connection.execute("DELETE FROM cache_preview_requests")
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache_runs "
+                    + "(id, started_at, skipped_count, heartbeat_at) "
+                    + "VALUES (1, ?, ?, NULL)",
+                    (time.time(), skipped_count),
+                )
+                connection.executemany(
+                    "INSERT OR REPLACE INTO cache_jobs "
+                    + "(path, priority, position, state) VALUES (?, 0, ?, ?)",
+                    (
+                        (path, position, JobState.PENDING.value)
+                        for (position, path) in enumerate(paths)
+                    ),
+                )
+
+    def push(
+        self,
+        paths: Sequence[str],
+        priority: int = BOOSTED_PRIORITY,
+        retry_failed: bool = False,
+        preview_size: Optional[int] = None,
+    ) -> Set[str]:
+        # queues up the given files, or bumps their priority if they're queued
+        # already. files which already failed to be cached aren't queued again
+        # unless retry_failed is set (such as when they changed on disk), and
+        # get returned instead. workers always render the full size preview of
+        # the files they cache, and preview_size asks them to render a thumbnail
+        # of that size as well.
+        requeued_states = [JobState.DONE.value]
+        if retry_failed:
+            requeued_states.append(JobState.FAILED.value)
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                self._requeue_expired_jobs(connection)
+                connection.executemany(
+                    "INSERT INTO cache_jobs (path, priority, position, state) "
+                    + "VALUES (?, ?, (SELECT COALESCE(MAX(position), -1) + 1 "
+                    + "FROM cache_jobs), ?) "
+                    + "ON CONFLICT (path) DO UPDATE SET "
+                    + "priority = MAX(priority, excluded.priority), "
+                    + "state = CASE WHEN state IN (?, ?) THEN excluded.state "
+                    + "ELSE state END",
+                    (
+                        (
+                            path,
+                            priority,
+                            JobState.PENDING.value,
+                            requeued_states[0],
+                            requeued_states[-1],
+                        )
+                        for path in paths
+                    ),
+                )
+                if preview_size is not None:
+                    connection.executemany(
+                        "INSERT OR IGNORE INTO cache_preview_requests (path, size) "
+                        + "VALUES (?, ?)",
+                        ((path, preview_size) for path in paths),
+                    )
+                return {
+                    path
+                    for path in paths
+                    if connection.execute(
+                        "SELECT state FROM cache_jobs WHERE path = ?", (path,)
+                    ).fetchone()
+                    == (JobState.FAILED.value,)
+                }
+
+    def remove(self, paths: Sequence[str]) -> None:
+        # drops files which don't exist anymore, whatever state they're in
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.executemany(
+                    "DELETE FROM cache_jobs WHERE path = ?",
+                    ((path,) for path in paths),
+                )
+                connection.executemany(
+                    "DELETE FROM cache_preview_requests WHERE path = ?",
+                    ((path,) for path in paths),
+                )
+
+    def claim(self) -> Optional[str]:
+        # takes the file with the highest priority off the queue, if there's any
+        with self._lock:
+            connection = self._get_connection()
+            self._beat(connection)
+            if (
+                connection.execute(
+                    "SELECT 1 FROM cache_jobs WHERE state = ? "
+                    + "OR (state = ? AND started_at < ?) LIMIT 1",
+                    (
+                        JobState.PENDING.value,
+                        JobState.RUNNING.value,
+                        time.time() - JOB_LEASE_SECS,
+                    ),
+                ).fetchone()
+                is None
+            ):
+                return None
+            with connection:
+                # other workers might be claiming files at the same time, so we
+                # take the write lock before picking one
+                connection.execute("BEGIN IMMEDIATE")
+                self._requeue_expired_jobs(connection)
+                row = connection.execute(
+                    "SELECT path FROM cache_jobs WHERE state = ? "
+                    + "ORDER BY priority DESC, position LIMIT 1",
+                    (JobState.PENDING.value,),
+                ).fetchone()
+                if row is None:
+                    return None
+                connection.execute(
+                    "UPDATE cache_jobs SET state = ?, started_at = ? WHERE path = ?",
+                    (JobState.RUNNING.value, time.time(), row[0]),
+                )
+                return row[0]
+
+    def take_preview_sizes(self, path: str) -> List[int]:
+        # the thumbnail sizes requested for the given file so far, which the
+        # worker that claimed it is now responsible for
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                rows = connection.execute(
+                    "SELECT size FROM cache_preview_requests WHERE path = ? "
+                    + "ORDER BY size",
+                    (path,),
+                ).fetchall()
+                connection.execute(
+                    "DELETE FROM cache_preview_requests WHERE path = ?", (path,)
+                )
+        return [size for (size,) in rows]
+
+    def finish(
+        self, path: str, parse_time_secs: float, error: Optional[str] = None
+    ) -> None:
+        state = JobState.DONE if error is None else JobState.FAILED
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                if error is not None:
+                    connection.execute(
+                        "DELETE FROM cache_preview_requests WHERE path = ?", (path,)
+                    )
+                elif connection.execute(
+                    "SELECT 1 FROM cache_preview_requests WHERE path = ? LIMIT 1",
+                    (path,),
+                ).fetchone():
+                    # thumbnails were asked for after the worker took the sizes
+                    # it was going to render, so the file goes back in the queue
+                    state = JobState.PENDING
+                connection.execute(
+                    "UPDATE cache_jobs SET state = ?, finished_at = ?, "
+                    + "parse_time_secs = ?, error = ? WHERE path = ?",
+                    (state.value, time.time(), parse_time_secs, error, path),
+                )
+
+    def get_job_states(
+        self, paths: Sequence[str]
+    ) -> Dict[str, Tuple[JobState, Optional[str]]]:
+        # the state of each of the given files which are in the queue, along with
+        # the error they failed with if they did
+        with self._lock:
+            connection = self._get_connection()
+            rows = [
+                connection.execute(
+                    "SELECT path, state, error FROM cache_jobs WHERE path = ?",
+                    (path,),
+                ).fetchone()
+                for path in paths
+            ]
+        return {
+            path: (JobState(state), error)
+            for (path, state, error) in (row for row in rows if row is not None)
+        }
+
+    def beat(self) -> None:
+        with self._lock:
+            self._beat(self._get_connection())
+
+    def has_live_workers(self) -> bool:
+        with self._lock:
+            row = (
+                self._get_connection()
+                .execute("SELECT heartbeat_at FROM cache_runs")
+                .fetchone()
+            )
+        return (
+            row is not None
+            and row[0] is not None
+            and time.time() - row[0] < HEARTBEAT_TIMEOUT_SECS
+        )
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                # so files whose worker died aren't reported as being parsed
+                self._requeue_expired_jobs(connection)
+            run = connection.execute(
+                "SELECT started_at, skipped_count FROM cache_runs"
+            ).fetchone()
+            count_by_state: Dict[str, int] = dict(
+                connection.execute(
+                    "SELECT state, COUNT(*) FROM cache_jobs GROUP BY state"
+                ).fetchall()
+            )
+            (finished_at,) = connection.execute(
+                "SELECT MAX(finished_at) FROM cache_jobs"
+            ).fetchone()
+            current_files = connection.execute(
+                "SELECT path FROM cache_jobs WHERE state = ? ORDER BY started_at",
+                (JobState.RUNNING.value,),
+            ).fetchall()
+            slowest_files = connection.execute(
+                "SELECT path, parse_time_secs FROM cache_jobs "
+                + "WHERE parse_time_secs IS NOT NULL "
+                + "ORDER BY parse_time_secs DESC LIMIT ?",
+                (MAX_REPORTED_FILES,),
+            ).fetchall()
+            failed_files = connection.execute(
+                "SELECT path, error FROM cache_jobs WHERE state = ? "
+                + "ORDER BY position LIMIT ?",
+                (JobState.FAILED.value, MAX_REPORTED_FILES),
+            ).fetchall()
+
+        pending_count = count_by_state.get(
+            JobState.PENDING.value, 0
+        ) + count_by_state.get(JobState.RUNNING.value, 0)
+        if run is None:
+            state = BootstrapState.IDLE
+        elif pending_count > 0:
+            state = BootstrapState.RUNNING
+        else:
+            state = BootstrapState.DONE
+        return {
+            "state": state.value,
+            "started_at": run[0] if run is not None else None,
+            "finished_at": (
+                (finished_at or run[0]) if state == BootstrapState.DONE else None
+            ),
+            "total_files": sum(count_by_state.values()),
+            "done_files": count_by_state.get(JobState.DONE.value, 0),
+            "failed_files": count_by_state.get(JobState.FAILED.value, 0),
+            "skipped_files": run[1] if run is not None else 0,
+            "current_files": [path for (path,) in current_files],
+            "slowest_files": [
+                {"path": path, "parse_time_secs": round(parse_time_secs, 3)}
+                for (path, parse_time_secs) in slowest_files
+            ],
+            "errors": [
+                {"path": path, "error": error} for (path, error) in failed_files
+            ],
+        }
+
+    def _requeue_expired_jobs(self, connection: sqlite3.Connection) -> None:
+        connection.execute(
+            "UPDATE cache_jobs SET state = ?, started_at = NULL "
+            + "WHERE state = ? AND started_at < ?",
+            (
+                JobState.PENDING.value,
+                JobState.RUNNING.value,
+                time.time() - JOB_LEASE_SECS,
+            ),
+        )
+
+    def _beat(self, connection: sqlite3.Connection) -> None:
+        now = time.time()
+        if now - self._last_heartbeat_at < HEARTBEAT_INTERVAL_SECS:
+            return
+        with connection:
+            connection.execute("UPDATE cache_runs SET heartbeat_at = ?", (now,))
+        self._last_heartbeat_at = now
+
+
+cache_work_queue: CacheWorkQueue = CacheWorkQueue(DATABASE_PATH)
@@ -0,0 +1,316 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional, Union
+
+from mariner.file_formats.utils import get_file_extension, get_supported_extensions
+from mariner.server.metadata_index import FileFingerprint
+
+
+# how often the files directory is walked looking for changes when inotify isn't
+# available
+POLL_INTERVAL_SECS = 10.0
+
+# inotify reports every step of a file being copied or moved around, so we wait
+# for things to settle down for a bit before looking at what changed
+SETTLE_TIME_SECS = 1.0
+
+# see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK: int = os.O_NONBLOCK
+IN_CLOEXEC: int = os.O_CLOEXEC
+
+# files being written to only show up once they're closed, so we don't end up
+# parsing half-uploaded files
+WATCH_MASK: int = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+INOTIFY_EVENT = struct.Struct("iIII")
+MAX_EVENTS_READ_SIZE = 64 * 1024
+
+
+@dataclass(frozen=True)
+class FileChanges:
+    # paths relative to the watched directory
+    changed: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.changed) or bool(self.deleted)
+
+
+def scan_directory(
+    root: Union[str, os.PathLike],
+    relative_directory: str = "",
+    recursive: bool = True,
+) -> Dict[str, FileFingerprint]:
+    # fingerprints of the sliced files in the given directory, by their path
+    # relative to root. scandir hands us the stat results of each entry, so this
+    # takes a single pass over each directory.
+    files: Dict[str, FileFingerprint] = {}
+    try:
+        entries = list(os.scandir(os.path.join(root, relative_directory)))
+    except (FileNotFoundError, NotADirectoryError):
+        return files
+    supported_extensions = get_supported_extensions()
+    for entry in entries:
+        relative_path = os.path.join(relative_directory, entry.name)
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    files.update(scan_directory(root, relative_path))
+            elif (
+                get_file_extension(entry.name) in supported_extensions
+                and entry.is_file()
+            ):
+                files[relative_path] = FileFingerprint.from_stat(entry.stat())
+        except FileNotFoundError:
+            # it was deleted while we were looking at it
+            continue
+    return files
+
+
+def _is_in_directory(path: str, relative_directory: str, recursive: bool) -> bool:
+    parent = os.path.dirname(path)
+    if not recursive:
+        return parent == relative_directory
+    return (
+        relative_directory == ""
+        or parent == relative_directory
+        or parent.startswith(relative_directory + os.sep)
+    )
+
+
+class FileWatcher(ABC):
+    # keeps track of the sliced files in a directory and reports the ones which
+    # were added, changed or deleted since the last time we looked
+    _root: str
+    _files: Dict[str, FileFingerprint]
+
+    def __init__(
+        self, root: Union[str, os.PathLike], files: Mapping[str, FileFingerprint]
+    ) -> None:
+        self._root = os.fspath(root)
+        self._files = dict(files)
+
+    @property
+    def files(self) -> Mapping[str, FileFingerprint]:
+        # every file we know of as of the last time we looked
+        return self._files
+
+    @abstractmethod
+    def wait_for_changes(self, timeout_secs: Optional[float] = None) -> FileChanges:
+        # blocks until something changes, or until the timeout expires in which
+        # case no changes are returned
+        ...
+
+    def close(self) -> None:
+        pass
+
+    def _rescan(self, relative_directory: str, recursive: bool) -> FileChanges:
+        scanned_files = scan_directory(self._root, relative_directory, recursive)
+        known_files = {
+            path: fingerprint
+            for (path, fingerprint) in self._files.items()
+            if _is_in_directory(path, relative_directory, recursive)
+        }
+        changes = FileChanges(
+            changed=sorted(
+                path
+                for (path, fingerprint) in scanned_files.items()
+                if known_files.get(path) != fingerprint
+            ),
+            deleted=sorted(path for path in known_files if path not in scanned_files),
+        )
+        for path in changes.deleted:
+            del self._files[path]
+        self._files.update(scanned_files)
+        return changes
+
+
+class PollingFileWatcher(FileWatcher):
+    # walks the whole directory every so often. it works everywhere, but changes
+    # take a while to be noticed.
+    _poll_interval_secs: float
+
+    def __init__(
+        self,
+        root: Union[str, os.PathLike],
+        files: Mapping[str, FileFingerprint],
+        poll_interval_secs: float = POLL_INTERVAL_SECS,
+    ) -> None:
+        super().__init__(root, files)
+        self._poll_interval_secs = poll_interval_secs
+
+    def wait_for_changes(self, timeout_secs: Optional[float] = None) -> FileChanges:
+        deadline = None if timeout_secs is None else time.monotonic() + timeout_secs
+        while True:
+            sleep_secs = self._poll_interval_secs
+            if deadline is not None:
+                sleep_secs = max(0.0, min(sleep_secs, deadline - time.monotonic()))
+            time.sleep(sleep_secs)
+            changes = self._rescan("", recursive=True)
+            if changes or (deadline is not None and time.monotonic() >= deadline):
+                return changes
+
+
+class InotifyFileWatcher(FileWatcher):
+    # gets told by the kernel which directories changed, so only those get
+    # scanned again, and only when something actually happened
+    _libc: ctypes.CDLL
+    _fd: int
+    _directory_by_watch: Dict[int, str]
+
+    def __init__(
+        self,
+        root: Union[str, os.PathLike],
+        files: Mapping[str, FileFingerprint],
+        libc: ctypes.CDLL,
+    ) -> None:
+        super().__init__(root, files)
+        self._libc = libc
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._directory_by_watch = {}
+        try:
+            self._watch_tree("")
+        except OSError:
+            self.close()
+            raise
+
+    def wait_for_changes(self, timeout_secs: Optional[float] = None) -> FileChanges:
+        deadline = None if timeout_secs is None else time.monotonic() + timeout_secs
+        # directories which need to be scanned again, and whether their
+        # subdirectories need to be scanned as well
+        dirty_directories: Dict[str, bool] = {}
+        while True:
+            if dirty_directories:
+                wait_secs: Optional[float] = SETTLE_TIME_SECS
+            elif deadline is not None:
+                wait_secs = max(0.0, deadline - time.monotonic())
+            else:
+                wait_secs = None
+            (readable, _, _) = select.select([self._fd], [], [], wait_secs)
+            if readable:
+                self._read_events(dirty_directories)
+                continue
+            if dirty_directories:
+                changes = self._rescan_directories(dirty_directories)
+                dirty_directories.clear()
+                if changes:
+                    return changes
+            if deadline is not None and time.monotonic() >= deadline:
+                return FileChanges()
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _read_events(self, dirty_directories: Dict[str, bool]) -> None:
+        try:
+            data = os.read(self._fd, MAX_EVENTS_READ_SIZE)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            (watch, mask, _cookie, name_length) = INOTIFY_EVENT.unpack_from(
+                data, offset
+            )
+            offset += INOTIFY_EVENT.size + name_length
+            if mask & IN_Q_OVERFLOW:
+                # the kernel dropped events, so we can't tell what changed
+                dirty_directories[""] = True
+                continue
+            directory = self._directory_by_watch.get(watch)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                # the directory is gone
+                del self._directory_by_watch[watch]
+                continue
+            if mask & IN_CREATE and not mask & IN_ISDIR:
+                # files we care about get reported again once they're written
+                continue
+            # subdirectories which were created, moved or deleted might have any
+            # number of files in them
+            dirty_directories[directory] = dirty_directories.get(
+                directory, False
+            ) or bool(mask & IN_ISDIR)
+
+    def _rescan_directories(self, dirty_directories: Dict[str, bool]) -> FileChanges:
+        if dirty_directories.get("", False):
+            dirty_directories = {"": True}
+        changed: List[str] = []
+        deleted: List[str] = []
+        for (directory, recursive) in dirty_directories.items():
+            if recursive:
+                self._watch_tree(directory)
+            changes = self._rescan(directory, recursive)
+            changed += changes.changed
+            deleted += changes.deleted
+        return FileChanges(changed=sorted(changed), deleted=sorted(deleted))
+
+    def _watch_tree(self, relative_directory: str) -> None:
+        top = os.path.join(self._root, relative_directory)
+        for (directory, _, _) in os.walk(top):
+            self._watch(os.path.relpath(directory, self._root))
+
+    def _watch(self, relative_directory: str) -> None:
+        if relative_directory == os.curdir:
+            relative_directory = ""
+        watch = self._libc.inotify_add_watch(
+            self._fd,
+            os.fsencode(os.path.join(self._root, relative_directory)),
+            WATCH_MASK,
+        )
+        if watch < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOENT:
+                # it was deleted before we got to it
+                return
+            raise OSError(error, os.strerror(error))
+        self._directory_by_watch[watch] = relative_directory
+
+
+def _load_libc() -> Optional[ctypes.CDLL]:
+    library_name = ctypes.util.find_library("c")
+    if library_name is None:
+        return None
+    try:
+        libc = ctypes.CDLL(library_name, use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+def create_file_watcher(
+    root: Union[str, os.PathLike], files: Mapping[str, FileFingerprint]
+) -> FileWatcher:
+    libc = _load_libc()
+    if libc is not None:
+        try:
+            return InotifyFileWatcher(root, files, libc)
+        except OSError:
+            # such as when we run out of inotify watches
+            logging.getLogger(__name__).exception(
+                "Failed to watch files with inotify, falling back to polling"
+            )
+    return PollingFileWatcher(root, files)
@@ -0,0 +1,92 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+
+TKey = TypeVar("TKey", bound=Hashable)
+TValue = TypeVar("TValue")
+
+
+class MemoryCache(Generic[TKey, TValue]):
+    # least recently used cache bounded both by its number of entries and by the
+    # approximate number of bytes they take. it sits in front of the persistent
+    # caches, so the entries which are looked up all the time (such as the file
+    # being printed) don't need to be read from disk again on every request.
+    _max_entries: int
+    _max_bytes: int
+    _get_size: Callable[[TValue], int]
+    _entries: "OrderedDict[TKey, TValue]"
+    _size_by_key: Dict[TKey, int]
+    _total_bytes: int
+    _hits: int
+    _misses: int
+    _lock: threading.Lock
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        get_size: Callable[[TValue], int],
+    ) -> None:
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._get_size = get_size
+        self._entries = OrderedDict()
+        self._size_by_key = {}
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: TKey) -> Optional[TValue]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key: TKey, value: TValue) -> None:
+        size = self._get_size(value)
+        with self._lock:
+            self._remove(key)
+            if size > self._max_bytes:
+                # it would evict everything else and still not fit
+                return
+            self._entries[key] = value
+            self._size_by_key[key] = size
+            self._total_bytes += size
+            while (
+                len(self._entries) > self._max_entries
+                or self._total_bytes > self._max_bytes
+            ):
+                (oldest_key, _) = self._entries.popitem(last=False)
+                self._total_bytes -= self._size_by_key.pop(oldest_key)
+
+    def remove(self, key: TKey) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size_by_key.clear()
+            self._total_bytes = 0
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_entries": self._max_entries,
+                "max_bytes": self._max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+    def _remove(self, key: TKey) -> None:
+        if key in self._entries:
+            del self._entries[key]
+            self._total_bytes -= self._size_by_key.pop(key)
@@ -0,0 +1,281 @@
+import os
+import pathlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from mariner.file_formats import SlicedModelFile
+from mariner.file_formats.layer_table import LazyLayerTable
+from mariner.file_formats.utils import get_file_format
+from mariner.server.sqlite_store import DATABASE_PATH, SQLiteStore
+
+
+@dataclass(frozen=True)
+class FileFingerprint:
+    # cheap to gather and changes whenever a file is re-uploaded or re-sliced
+    # under the same name, so it's used to tell whether what we have stored about
+    # a sliced file is still up to date. inode numbers are left out: vfat makes
+    # them up as files get looked up, so they change on every remount and
+    # whenever the kernel drops a file from its inode cache.
+    size: int
+    mtime_ns: int
+
+    @classmethod
+    def from_stat(cls, stat_result: os.stat_result) -> "FileFingerprint":
+        return cls(
+            size=stat_result.st_size,
+            mtime_ns=stat_result.st_mtime_ns,
+        )
+
+    @classmethod
+    def from_path(cls, path: Union[str, os.PathLike]) -> "FileFingerprint":
+        return cls.from_stat(os.stat(path))
+
+
+# sqlite limits how many parameters a single statement can have
+MAX_PATHS_PER_QUERY = 500
+
+# layer heights are stored as floats, so they're compared with some tolerance
+LAYER_HEIGHT_TOLERANCE_MM = 0.0001
+
+# files used to be indexed in a sliced_files table, along with their inode
+# numbers. the index is just a cache, so that table simply gets dropped and the
+# files get indexed again.
+SLICED_FILES_SCHEMA = """
+DROP TABLE IF EXISTS sliced_files;
+CREATE TABLE IF NOT EXISTS indexed_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    bed_size_x_mm REAL NOT NULL,
+    bed_size_y_mm REAL NOT NULL,
+    bed_size_z_mm REAL NOT NULL,
+    height_mm REAL NOT NULL,
+    layer_height_mm REAL NOT NULL,
+    layer_count INTEGER NOT NULL,
+    resolution_x INTEGER NOT NULL,
+    resolution_y INTEGER NOT NULL,
+    print_time_secs INTEGER NOT NULL,
+    slicer_version TEXT NOT NULL,
+    printer_name TEXT NOT NULL
+);
+"""
+
+COLUMNS: Sequence[str] = [
+    "path",
+    "size",
+    "mtime_ns",
+    "filename",
+    "bed_size_x_mm",
+    "bed_size_y_mm",
+    "bed_size_z_mm",
+    "height_mm",
+    "layer_height_mm",
+    "layer_count",
+    "resolution_x",
+    "resolution_y",
+    "print_time_secs",
+    "slicer_version",
+    "printer_name",
+]
+
+_Row = Tuple[
+    str,
+    int,
+    int,
+    str,
+    float,
+    float,
+    float,
+    float,
+    float,
+    int,
+    int,
+    int,
+    int,
+    str,
+    str,
+]
+
+
+class MetadataIndex(SQLiteStore):
+    # keeps one row with the parsed metadata of each sliced file, along with the
+    # fingerprint of the file it was parsed from. rows whose fingerprint doesn't
+    # match the file anymore are treated as missing. the layer table isn't stored:
+    # sliced model files coming from the index read it lazily from the file.
+    SCHEMA: str = SLICED_FILES_SCHEMA
+
+    def get(self, path: str, fingerprint: FileFingerprint) -> Optional[SlicedModelFile]:
+        return self.get_many([(path, fingerprint)]).get(path)
+
+    def get_many(
+        self, paths_and_fingerprints: Sequence[Tuple[str, FileFingerprint]]
+    ) -> Dict[str, SlicedModelFile]:
+        fingerprint_by_path = dict(paths_and_fingerprints)
+        paths = list(fingerprint_by_path.keys())
+        rows: List[_Row] = []
+        with self._lock:
+            connection = self._get_connection()
+            for start in range(0, len(paths), MAX_PATHS_PER_QUERY):
+                end = start + MAX_PATHS_PER_QUERY
+                chunk = paths[start:end]
+                placeholders = ", ".join("?" * len(chunk))
+                rows += connection.execute(
+                    f"SELECT {', '.join(COLUMNS)} FROM indexed_files "
+                    + f"WHERE path IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+        return {
+            row[0]: _to_sliced_model_file(row)
+            for row in rows
+            if FileFingerprint(size=row[1], mtime_ns=row[2])
+            == fingerprint_by_path[row[0]]
+        }
+
+    def put(
+        self,
+        path: str,
+        fingerprint: FileFingerprint,
+        sliced_model_file: SlicedModelFile,
+    ) -> None:
+        row: _Row = (
+            path,
+            fingerprint.size,
+            fingerprint.mtime_ns,
+            sliced_model_file.filename,
+            *sliced_model_file.bed_size_mm,
+            sliced_model_file.height_mm,
+            sliced_model_file.layer_height_mm,
+            sliced_model_file.layer_count,
+            *sliced_model_file.resolution,
+            sliced_model_file.print_time_secs,
+            sliced_model_file.slicer_version,
+            sliced_model_file.printer_name,
+        )
+        with self._lock:
+            connection = self._get_connection()
+            connection.execute(
+                f"INSERT OR REPLACE INTO indexed_files ({', '.join(COLUMNS)}) "
+                + f"VALUES ({', '.join('?' * len(COLUMNS))})",
+                row,
+            )
+            connection.commit()
+
+    def search(
+        self,
+        directory: str,
+        *,
+        name: Optional[str] = None,
+        printer_name: Optional[str] = None,
+        slicer_version: Optional[str] = None,
+        layer_height_mm: Optional[float] = None,
+        min_print_time_secs: Optional[int] = None,
+        max_print_time_secs: Optional[int] = None,
+        limit: int,
+        offset: int = 0,
+    ) -> Tuple[List[Tuple[str, SlicedModelFile]], int]:
+        # finds the indexed files anywhere under the given directory which match
+        # all of the given criteria. names and printer names match on substrings,
+        # regardless of case. returns a page of the matching files, ordered by
+        # path, along with how many of them there are in total.
+        conditions = ["path LIKE ? ESCAPE '\\'"]
+        parameters: List[Union[str, int, float]] = [
+            _escape_like_pattern(os.path.join(directory, "")) + "%"
+        ]
+        if name is not None:
+            conditions.append("filename LIKE ? ESCAPE '\\'")
+            parameters.append(f"%{_escape_like_pattern(name)}%")
+        if printer_name is not None:
+            conditions.append("printer_name LIKE ? ESCAPE '\\'")
+            parameters.append(f"%{_escape_like_pattern(printer_name)}%")
+        if slicer_version is not None:
+            conditions.append("slicer_version = ?")
+            parameters.append(slicer_version)
+        if layer_height_mm is not None:
+            conditions.append("ABS(layer_height_mm - ?) < ?")
+            parameters += [layer_height_mm, LAYER_HEIGHT_TOLERANCE_MM]
+        if min_print_time_secs is not None:
+            conditions.append("print_time_secs >= ?")
+            parameters.append(min_print_time_secs)
+        if max_print_time_secs is not None:
+            conditions.append("print_time_secs <= ?")
+            parameters.append(max_print_time_secs)
+        where_clause = " AND ".join(conditions)
+
+        with self._lock:
+            connection = self._get_connection()
+            (total_count,) = connection.execute(
+                f"SELECT COUNT(*) FROM indexed_files WHERE {where_clause}",
+                parameters,
+            ).fetchone()
+            rows: List[_Row] = connection.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM indexed_files "
+                + f"WHERE {where_clause} ORDER BY path LIMIT ? OFFSET ?",
+                parameters + [limit, offset],
+            ).fetchall()
+        return ([(row[0], _to_sliced_model_file(row)) for row in rows], total_count)
+
+    def get_fingerprints(self) -> Dict[str, FileFingerprint]:
+        # fingerprints of every indexed file, which is all it takes to tell which
+        # files changed since they were indexed
+        with self._lock:
+            rows = (
+                self._get_connection()
+                .execute("SELECT path, size, mtime_ns FROM indexed_files")
+                .fetchall()
+            )
+        return {
+            path: FileFingerprint(size=size, mtime_ns=mtime_ns)
+            for (path, size, mtime_ns) in rows
+        }
+
+    def remove(self, paths: Sequence[str]) -> None:
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.executemany(
+                    "DELETE FROM indexed_files WHERE path = ?",
+                    ((path,) for path in paths),
+                )
+
+
+def _escape_like_pattern(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _to_sliced_model_file(row: _Row) -> SlicedModelFile:
+    (
+        path,
+        _size,
+        _mtime_ns,
+        filename,
+        bed_size_x_mm,
+        bed_size_y_mm,
+        bed_size_z_mm,
+        height_mm,
+        layer_height_mm,
+        layer_count,
+        resolution_x,
+        resolution_y,
+        print_time_secs,
+        slicer_version,
+        printer_name,
+    ) = row
+    file_format = get_file_format(path)
+    return file_format(
+        filename=filename,
+        bed_size_mm=(bed_size_x_mm, bed_size_y_mm, bed_size_z_mm),
+        height_mm=height_mm,
+        layer_height_mm=layer_height_mm,
+        layer_count=layer_count,
+        resolution=(resolution_x, resolution_y),
+        print_time_secs=print_time_secs,
+        end_byte_offset_by_layer=LazyLayerTable(
+            pathlib.Path(path), layer_count, file_format
+        ),
+        slicer_version=slicer_version,
+        printer_name=printer_name,
+    )
+
+
+metadata_index: MetadataIndex = MetadataIndex(DATABASE_PATH)
@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from mariner import config
+from mariner.exceptions import UnexpectedPrinterResponse
+from mariner.printer import ChiTuPrinter, PrintStatus
+from mariner.server.printer_connection import PrinterConnection, printer_connection
+from mariner.server.utils import retry
+
+
+@dataclass(frozen=True)
+class PrintStatusSnapshot:
+    selected_file: str
+    print_status: PrintStatus
+    # time.monotonic() of when the printer was polled
+    polled_at: float
+
+    def get_age_secs(self) -> float:
+        return max(time.monotonic() - self.polled_at, 0.0)
+
+
+def _get_selected_file_and_print_status(
+    printer: ChiTuPrinter,
+) -> Tuple[str, PrintStatus]:
+    # the printer sends periodic "ok" responses over serial (see issue #180). those
+    # get set aside by ChiTuPrinter while reading responses, but we still retry at
+    # most 3 times here in case a response gets garbled or cut short
+    selected_file = retry(
+        printer.get_selected_file,
+        UnexpectedPrinterResponse,
+        num_retries=3,
+    )
+    print_status = retry(
+        printer.get_print_status,
+        UnexpectedPrinterResponse,
+        num_retries=3,
+    )
+    return (selected_file, print_status)
+
+
+class PrintStatusPoller:
+    # polls the printer for its status on a background thread and keeps the last
+    # reading around, so status requests don't need to talk to the printer and
+    # the serial traffic doesn't grow with the number of clients watching it.
+    _connection: PrinterConnection
+    _interval_secs: float
+    _snapshot: Optional[PrintStatusSnapshot]
+    _refresh_lock: threading.Lock
+    _thread_lock: threading.Lock
+    _thread: Optional[threading.Thread]
+    _stop_event: threading.Event
+    _snapshot_updated: threading.Condition
+
+    def __init__(self, connection: PrinterConnection, interval_secs: float) -> None:
+        self._connection = connection
+        self._interval_secs = interval_secs
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._snapshot_updated = threading.Condition()
+
+    def start(self) -> None:
+        with self._thread_lock:
+            if self._thread is not None:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._poll,
+                name="print-status-poller",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._thread_lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stop_event.set()
+            thread.join()
+            self._thread = None
+
+    def invalidate(self) -> None:
+        # should be called after commands which change the printer's state, so
+        # the next request doesn't get a snapshot from before the command
+        self._snapshot = None
+
+    def refresh(self) -> PrintStatusSnapshot:
+        with self._refresh_lock:
+            return self._refresh()
+
+    def get_snapshot(self) -> PrintStatusSnapshot:
+        self.start()
+        snapshot = self._snapshot
+        if snapshot is not None and not self._is_stale(snapshot):
+            return snapshot
+        # we don't have a recent snapshot (e.g. the poller hasn't been able to reach
+        # the printer for a while), so we poll the printer right away instead of
+        # serving a stale status. errors get propagated to the caller in this case.
+        with self._refresh_lock:
+            # another request might have refreshed it while we were waiting
+            snapshot = self._snapshot
+            if snapshot is not None and not self._is_stale(snapshot):
+                return snapshot
+            return self._refresh()
+
+    def wait_for_next_snapshot(
+        self, snapshot: PrintStatusSnapshot, timeout_secs: float
+    ) -> PrintStatusSnapshot:
+        # blocks until the printer has been polled again after the given snapshot
+        # was taken, or until the timeout expires
+        self.start()
+        with self._snapshot_updated:
+            self._snapshot_updated.wait_for(
+                lambda: self._snapshot is not None and self._snapshot is not snapshot,
+                timeout=timeout_secs,
+            )
+        return self.get_snapshot()
+
+    def _is_stale(self, snapshot: PrintStatusSnapshot) -> bool:
+        return snapshot.get_age_secs() > 3 * self._interval_secs
+
+    def _refresh(self) -> PrintStatusSnapshot:
+        (selected_file, print_status) = self._connection.run(
+            _get_selected_file_and_print_status
+        )
+        snapshot = PrintStatusSnapshot(
+            selected_file=selected_file,
+            print_status=print_status,
+            polled_at=time.monotonic(),
+        )
+        with self._snapshot_updated:
+            self._snapshot = snapshot
+            self._snapshot_updated.notify_all()
+        return snapshot
+
+    def _poll(self) -> None:
+        while not self._stop_event.wait(self._interval_secs):
+            try:
+                self.refresh()
+            except Exception:
+                logging.getLogger(__name__).exception("Failed to poll the print status")
+
+
+print_status_poller: PrintStatusPoller = PrintStatusPoller(
+    printer_connection,
+    config.get_printer_status_poll_interval_secs(),
+)
@@ -0,0 +1,114 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Optional, Tuple, TypeVar
+
+from mariner.printer import ChiTuPrinter
+
+
+TReturn = TypeVar("TReturn")
+
+# pyre-ignore[33]: commands can return anything
+_Command = Tuple[Callable[[ChiTuPrinter], Any], "Future[Any]"]
+
+
+class PrinterConnection:
+    # owns the printer's serial port for the lifetime of the process. instead of
+    # opening and closing the port on every request, all commands go through a
+    # queue and get executed one after the other by a single thread, so responses
+    # from concurrent requests never get interleaved with each other.
+    _printer_factory: Callable[[], ChiTuPrinter]
+    _printer: Optional[ChiTuPrinter]
+    _queue: "queue.Queue[Optional[_Command]]"
+    _thread: Optional[threading.Thread]
+    _lock: threading.Lock
+
+    def __init__(
+        self, printer_factory: Callable[[], ChiTuPrinter] = ChiTuPrinter
+    ) -> None:
+        self._printer_factory = printer_factory
+        self._printer = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._process_commands,
+                name="printer-connection",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._queue.put(None)
+            thread.join()
+            self._thread = None
+
+    def run(self, command: Callable[[ChiTuPrinter], TReturn]) -> TReturn:
+        # runs the given command on the printer thread, once all commands queued
+        # before it are done. the command gets exclusive access to the printer
+        # while it runs, so it can safely send a sequence of requests.
+        self.start()
+        future: "Future[TReturn]" = Future()
+        self._queue.put((command, future))
+        return future.result()
+
+    def _get_printer(self) -> ChiTuPrinter:
+        if self._printer is None:
+            printer = self._printer_factory()
+            printer.open()
+            self._printer = printer
+        return self._printer
+
+    def _close_printer(self) -> None:
+        printer = self._printer
+        self._printer = None
+        if printer is not None:
+            try:
+                printer.close()
+            except OSError:
+                pass
+
+    def _process_commands(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            (command, future) = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(command(self._get_printer()))
+            except OSError as exception:
+                # serial errors are OSErrors as well. the port is likely in a bad
+                # state (e.g. it was unplugged), so we reopen it on the next command
+                self._close_printer()
+                future.set_exception(exception)
+            except Exception as exception:
+                future.set_exception(exception)
+            self._log_unsolicited_lines()
+        self._close_printer()
+
+    def _log_unsolicited_lines(self) -> None:
+        # the lines the printer sent on its own while the command ran get skipped
+        # over by the command itself, but they can tell what the printer was up to
+        # when debugging it
+        printer = self._printer
+        if printer is None:
+            return
+        for line in printer.pop_unsolicited_lines():
+            logging.getLogger(__name__).debug(
+                f"Unsolicited line from the printer: {line.rstrip()}"
+            )
+
+
+printer_connection: PrinterConnection = PrinterConnection()
@@ -0,0 +1,89 @@
+import fcntl
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+
+from mariner import config
+
+
+TReturn = TypeVar("TReturn")
+
+# keys are spread over a fixed number of lock files, so we don't leave a lock file
+# behind for every file that ever got parsed
+NUM_LOCK_FILES = 64
+
+
+class _Call:
+    done: threading.Event
+    # pyre-ignore[4]: the result of any computation
+    result: Any
+    exception: Optional[BaseException]
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class SingleFlight:
+    # makes sure only one computation for a given key runs at a time. threads in
+    # this process asking for a key which is already being computed wait for that
+    # computation and share its result. other processes (such as the cache
+    # bootstrapper's workers) are kept out through a file lock, so computations
+    # should check whether the result was stored by someone else before doing the
+    # actual work.
+    _lock_directory: str
+    _lock: threading.Lock
+    _calls: Dict[str, _Call]
+
+    def __init__(self, lock_directory: str) -> None:
+        self._lock_directory = lock_directory
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def run(self, key: str, compute: Callable[[], TReturn]) -> TReturn:
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+
+        if not is_leader:
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result
+
+        try:
+            with self._lock_file(key):
+                call.result = compute()
+            return call.result
+        except BaseException as exception:
+            call.exception = exception
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    @contextmanager
+    def _lock_file(self, key: str) -> Iterator[None]:
+        digest = hashlib.sha1(key.encode("utf-8")).digest()
+        lock_number = int.from_bytes(digest[:4], "little") % NUM_LOCK_FILES
+        os.makedirs(self._lock_directory, exist_ok=True)
+        with open(
+            os.path.join(self._lock_directory, f"{lock_number}.lock"), "w"
+        ) as file:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+single_flight: SingleFlight = SingleFlight(
+    os.path.join(config.get_cache_directory(), "locks")
+)
@@ -0,0 +1,55 @@
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+from mariner import config
+
+
+# the metadata index and the cache bootstrapper's progress are kept in the same
+# database, in the cache directory
+DATABASE_PATH: str = os.path.join(config.get_cache_directory(), "metadata.sqlite3")
+
+
+class SQLiteStore:
+    # base class for state kept in sqlite, which needs to be shared between the
+    # server and the cache bootstrapper processes. subclasses set SCHEMA to the
+    # statements creating their tables and go through _get_connection while
+    # holding _lock.
+    SCHEMA: str = ""
+
+    _database_path: str
+    _lock: threading.Lock
+    _connection: Optional[sqlite3.Connection]
+    _connection_pid: Optional[int]
+
+    def __init__(self, database_path: str) -> None:
+        self._database_path = database_path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    def _get_connection(self) -> sqlite3.Connection:
+        # connections can't be shared with forked processes (such as the cache
+        # bootstrapper), so each process opens its own
+        if self._connection is None or self._connection_pid != os.getpid():
+            if self._database_path != ":memory:":
+                os.makedirs(os.path.dirname(self._database_path), exist_ok=True)
+            connection = sqlite3.connect(
+                self._database_path, timeout=30.0, check_same_thread=False
+            )
+            if self._database_path != ":memory:":
+                # lets readers go on while another process writes to the database
+                connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(self.SCHEMA)
+            connection.commit()
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+            self._connection = None
+            self._connection_pid = None
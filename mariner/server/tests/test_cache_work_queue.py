@@ -0,0 +1,188 @@
+import time
+from unittest import TestCase
+from unittest.mock import ANY, patch
+
+from pyexpect import expect
+
+from mariner.server.cache_work_queue import (
+    CacheWorkQueue,
+    HEARTBEAT_TIMEOUT_SECS,
+    JOB_LEASE_SECS,
+    JobState,
+)
+
+
+class CacheWorkQueueTest(TestCase):
+    def setUp(self) -> None:
+        self.cache_work_queue = CacheWorkQueue(":memory:")
+
+    def tearDown(self) -> None:
+        self.cache_work_queue.close()
+
+    def test_idle(self) -> None:
+        expect(self.cache_work_queue.claim()).to_be_none()
+        expect(self.cache_work_queue.get_status()).to_equal(
+            {
+                "state": "IDLE",
+                "started_at": None,
+                "finished_at": None,
+                "total_files": 0,
+                "done_files": 0,
+                "failed_files": 0,
+                "skipped_files": 0,
+                "current_files": [],
+                "slowest_files": [],
+                "errors": [],
+            }
+        )
+
+    def test_run(self) -> None:
+        self.cache_work_queue.start_run(["a.ctb", "b.ctb", "c.ctb"], 1)
+        expect(self.cache_work_queue.claim()).to_equal("a.ctb")
+        expect(self.cache_work_queue.claim()).to_equal("b.ctb")
+        self.cache_work_queue.finish("b.ctb", 0.25)
+        self.cache_work_queue.finish("a.ctb", 2.0, "ValueError()")
+        expect(self.cache_work_queue.claim()).to_equal("c.ctb")
+
+        status = self.cache_work_queue.get_status()
+        expect(status["state"]).to_equal("RUNNING")
+        expect(status["total_files"]).to_equal(3)
+        expect(status["done_files"]).to_equal(1)
+        expect(status["failed_files"]).to_equal(1)
+        expect(status["skipped_files"]).to_equal(1)
+        expect(status["current_files"]).to_equal(["c.ctb"])
+        expect(status["slowest_files"]).to_equal(
+            [
+                {"path": "a.ctb", "parse_time_secs": 2.0},
+                {"path": "b.ctb", "parse_time_secs": 0.25},
+            ]
+        )
+        expect(status["errors"]).to_equal([{"path": "a.ctb", "error": "ValueError()"}])
+
+        self.cache_work_queue.finish("c.ctb", 0.5)
+        expect(self.cache_work_queue.claim()).to_be_none()
+        status = self.cache_work_queue.get_status()
+        expect(status["state"]).to_equal("DONE")
+        expect(status["finished_at"]).to_equal(ANY)
+
+    def test_pushed_files_come_first(self) -> None:
+        self.cache_work_queue.start_run(["a.ctb", "b.ctb"], 0)
+        expect(self.cache_work_queue.push(["c.ctb", "b.ctb"])).to_equal(set())
+        expect(self.cache_work_queue.claim()).to_equal("b.ctb")
+        expect(self.cache_work_queue.claim()).to_equal("c.ctb")
+        expect(self.cache_work_queue.claim()).to_equal("a.ctb")
+        expect(self.cache_work_queue.claim()).to_be_none()
+
+    def test_pushing_done_and_failed_files(self) -> None:
+        self.cache_work_queue.start_run(["a.ctb", "b.ctb"], 0)
+        self.cache_work_queue.claim()
+        self.cache_work_queue.finish("a.ctb", 1.0)
+        self.cache_work_queue.claim()
+        self.cache_work_queue.finish("b.ctb", 1.0, "ValueError()")
+
+        # files which were cached already changed since, so they're queued again,
+        # but files which failed would just fail again
+        expect(self.cache_work_queue.push(["a.ctb", "b.ctb"])).to_equal({"b.ctb"})
+        expect(self.cache_work_queue.claim()).to_equal("a.ctb")
+        expect(self.cache_work_queue.claim()).to_be_none()
+
+    def test_retrying_failed_files(self) -> None:
+        self.cache_work_queue.start_run(["a.ctb"], 0)
+        self.cache_work_queue.claim()
+        self.cache_work_queue.finish("a.ctb", 1.0, "ValueError()")
+
+        expect(self.cache_work_queue.push(["a.ctb"], retry_failed=True)).to_equal(set())
+        expect(self.cache_work_queue.claim()).to_equal("a.ctb")
+
+    def test_preview_requests(self) -> None:
+        self.cache_work_queue.start_run(["a.ctb", "b.ctb"], 0)
+        self.cache_work_queue.push(["b.ctb"], preview_size=64)
+        self.cache_work_queue.push(["b.ctb"], preview_size=128)
+        expect(self.cache_work_queue.claim()).to_equal("b.ctb")
+        expect(self.cache_work_queue.take_preview_sizes("b.ctb")).to_equal([64, 128])
+        expect(self.cache_work_queue.take_preview_sizes("b.ctb")).to_equal([])
+
+        # thumbnails asked for while the file is being cached get it queued again
+        self.cache_work_queue.push(["b.ctb"], preview_size=256)
+        self.cache_work_queue.finish("b.ctb", 1.0)
+        expect(
+            self.cache_work_queue.get_job_states(["a.ctb", "b.ctb", "c.ctb"])
+        ).to_equal(
+            {"a.ctb": (JobState.PENDING, None), "b.ctb": (JobState.PENDING, None)}
+        )
+        expect(self.cache_work_queue.claim()).to_equal("b.ctb")
+        expect(self.cache_work_queue.take_preview_sizes("b.ctb")).to_equal([256])
+        self.cache_work_queue.finish("b.ctb", 1.0, "ValueError()")
+        expect(self.cache_work_queue.get_job_states(["b.ctb"])).to_equal(
+            {"b.ctb": (JobState.FAILED, "ValueError()")}
+        )
+
+    def test_remove(self) -> None:
+        self.cache_work_queue.start_run(["a.ctb", "b.ctb"], 0)
+        self.cache_work_queue.remove(["a.ctb"])
+        expect(self.cache_work_queue.claim()).to_equal("b.ctb")
+        expect(self.cache_work_queue.claim()).to_be_none()
+        expect(self.cache_work_queue.get_status()["total_files"]).to_equal(1)
+
+    def test_new_run_resets_queue(self) -> None:
+        self.cache_work_queue.start_run(["a.ctb"], 0)
+        self.cache_work_queue.claim()
+        self.cache_work_queue.finish("a.ctb", 1.0)
+        self.cache_work_queue.start_run(["b.ctb"], 1)
+
+        status = self.cache_work_queue.get_status()
+        expect(status["state"]).to_equal("RUNNING")
+        expect(status["total_files"]).to_equal(1)
+        expect(status["done_files"]).to_equal(0)
+        expect(status["slowest_files"]).to_equal([])
+
+    def test_expired_jobs_are_queued_again(self) -> None:
+        self.cache_work_queue.start_run(["a.ctb", "b.ctb"], 0)
+        expect(self.cache_work_queue.claim()).to_equal("a.ctb")
+        expect(self.cache_work_queue.claim()).to_equal("b.ctb")
+        expect(self.cache_work_queue.claim()).to_be_none()
+
+        # the worker which claimed them died without finishing them
+        with patch(
+            "mariner.server.cache_work_queue.time.time",
+            return_value=time.time() + JOB_LEASE_SECS + 1,
+        ):
+            status = self.cache_work_queue.get_status()
+            expect(status["state"]).to_equal("RUNNING")
+            expect(status["current_files"]).to_equal([])
+            expect(self.cache_work_queue.claim()).to_equal("a.ctb")
+            expect(self.cache_work_queue.get_status()["current_files"]).to_equal(
+                ["a.ctb"]
+            )
+            expect(self.cache_work_queue.claim()).to_equal("b.ctb")
+            expect(self.cache_work_queue.claim()).to_be_none()
+
+    def test_pushing_expired_jobs(self) -> None:
+        self.cache_work_queue.start_run(["a.ctb", "b.ctb"], 0)
+        self.cache_work_queue.claim()
+        with patch(
+            "mariner.server.cache_work_queue.time.time",
+            return_value=time.time() + JOB_LEASE_SECS + 1,
+        ):
+            expect(self.cache_work_queue.push(["a.ctb"])).to_equal(set())
+            expect(self.cache_work_queue.claim()).to_equal("a.ctb")
+
+    def test_heartbeat(self) -> None:
+        expect(self.cache_work_queue.has_live_workers()).to_equal(False)
+        self.cache_work_queue.start_run([], 0)
+        expect(self.cache_work_queue.has_live_workers()).to_equal(False)
+
+        # workers let us know they're alive whenever they look for work
+        self.cache_work_queue.claim()
+        expect(self.cache_work_queue.has_live_workers()).to_equal(True)
+
+        with patch(
+            "mariner.server.cache_work_queue.time.time",
+            return_value=time.time() + HEARTBEAT_TIMEOUT_SECS + 1,
+        ):
+            expect(self.cache_work_queue.has_live_workers()).to_equal(False)
+
+            # workers also let us know they're alive every so often while they're
+            # busy with a file
+            self.cache_work_queue.beat()
+            expect(self.cache_work_queue.has_live_workers()).to_equal(True)
@@ -0,0 +1,114 @@
+import os
+import pathlib
+import tempfile
+from unittest import TestCase, skipIf
+
+from pyexpect import expect
+
+from mariner.server.file_watcher import (
+    _load_libc,
+    FileChanges,
+    FileWatcher,
+    InotifyFileWatcher,
+    PollingFileWatcher,
+    scan_directory,
+)
+from mariner.server.metadata_index import FileFingerprint
+
+
+class ScanDirectoryTest(TestCase):
+    def test_scan_directory(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = pathlib.Path(directory)
+            (root / "stairs.ctb").write_bytes(b"ctb")
+            (root / "notes.txt").write_text("not a sliced file")
+            (root / "prints").mkdir()
+            (root / "prints" / "pyramid.CBDDLP").write_bytes(b"cbddlp")
+
+            expect(scan_directory(root)).to_equal(
+                {
+                    "stairs.ctb": FileFingerprint.from_path(root / "stairs.ctb"),
+                    os.path.join("prints", "pyramid.CBDDLP"): (
+                        FileFingerprint.from_path(root / "prints" / "pyramid.CBDDLP")
+                    ),
+                }
+            )
+            expect(list(scan_directory(root, recursive=False).keys())).to_equal(
+                ["stairs.ctb"]
+            )
+            expect(scan_directory(root / "missing")).to_equal({})
+
+
+class FileWatcherTestMixin:
+    # pyre-ignore[13]: set by subclasses
+    root: pathlib.Path
+
+    def create_file_watcher(self) -> FileWatcher:
+        raise NotImplementedError
+
+    def test_file_changes(self) -> None:
+        (self.root / "deleted.ctb").write_bytes(b"ctb")
+        (self.root / "changed.ctb").write_bytes(b"ctb")
+        file_watcher = self.create_file_watcher()
+        try:
+            expect(file_watcher.wait_for_changes(timeout_secs=0.1)).to_equal(
+                FileChanges()
+            )
+
+            (self.root / "deleted.ctb").unlink()
+            (self.root / "changed.ctb").write_bytes(b"changed ctb")
+            (self.root / "new.ctb").write_bytes(b"ctb")
+            (self.root / "notes.txt").write_text("not a sliced file")
+            expect(file_watcher.wait_for_changes(timeout_secs=5.0)).to_equal(
+                FileChanges(changed=["changed.ctb", "new.ctb"], deleted=["deleted.ctb"])
+            )
+        finally:
+            file_watcher.close()
+
+    def test_subdirectories(self) -> None:
+        file_watcher = self.create_file_watcher()
+        try:
+            (self.root / "prints").mkdir()
+            (self.root / "prints" / "stairs.ctb").write_bytes(b"ctb")
+            expect(file_watcher.wait_for_changes(timeout_secs=5.0)).to_equal(
+                FileChanges(changed=[os.path.join("prints", "stairs.ctb")])
+            )
+
+            (self.root / "prints").rename(self.root / "old_prints")
+            expect(file_watcher.wait_for_changes(timeout_secs=5.0)).to_equal(
+                FileChanges(
+                    changed=[os.path.join("old_prints", "stairs.ctb")],
+                    deleted=[os.path.join("prints", "stairs.ctb")],
+                )
+            )
+        finally:
+            file_watcher.close()
+
+
+class PollingFileWatcherTest(FileWatcherTestMixin, TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.directory.name)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def create_file_watcher(self) -> FileWatcher:
+        return PollingFileWatcher(
+            self.root, scan_directory(self.root), poll_interval_secs=0.05
+        )
+
+
+@skipIf(_load_libc() is None, "inotify is not available")
+class InotifyFileWatcherTest(FileWatcherTestMixin, TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.directory.name)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def create_file_watcher(self) -> FileWatcher:
+        libc = _load_libc()
+        assert libc is not None
+        return InotifyFileWatcher(self.root, scan_directory(self.root), libc)
@@ -0,0 +1,65 @@
+from unittest import TestCase
+
+from pyexpect import expect
+
+from mariner.server.memory_cache import MemoryCache
+
+
+class MemoryCacheTest(TestCase):
+    def test_get_and_put(self) -> None:
+        cache: MemoryCache[str, bytes] = MemoryCache(
+            max_entries=2, max_bytes=100, get_size=len
+        )
+        expect(cache.get("a")).to_be_none()
+        cache.put("a", b"aaa")
+        expect(cache.get("a")).to_equal(b"aaa")
+        expect(cache.get_stats()).to_equal(
+            {
+                "entries": 1,
+                "bytes": 3,
+                "max_entries": 2,
+                "max_bytes": 100,
+                "hits": 1,
+                "misses": 1,
+            }
+        )
+
+    def test_evicts_least_recently_used_entries_by_count(self) -> None:
+        cache: MemoryCache[str, bytes] = MemoryCache(
+            max_entries=2, max_bytes=100, get_size=len
+        )
+        cache.put("a", b"a")
+        cache.put("b", b"b")
+        cache.get("a")
+        cache.put("c", b"c")
+        expect(cache.get("a")).to_equal(b"a")
+        expect(cache.get("b")).to_be_none()
+        expect(cache.get("c")).to_equal(b"c")
+
+    def test_evicts_least_recently_used_entries_by_size(self) -> None:
+        cache: MemoryCache[str, bytes] = MemoryCache(
+            max_entries=10, max_bytes=10, get_size=len
+        )
+        cache.put("a", b"aaaa")
+        cache.put("b", b"bbbb")
+        cache.put("c", b"cccc")
+        expect(cache.get("a")).to_be_none()
+        expect(cache.get_stats()["bytes"]).to_equal(8)
+
+        # entries which can't possibly fit aren't cached at all
+        cache.put("d", b"d" * 11)
+        expect(cache.get("d")).to_be_none()
+        expect(cache.get("b")).to_equal(b"bbbb")
+
+    def test_replacing_an_entry(self) -> None:
+        cache: MemoryCache[str, bytes] = MemoryCache(
+            max_entries=10, max_bytes=10, get_size=len
+        )
+        cache.put("a", b"aaaa")
+        cache.put("a", b"aa")
+        expect(cache.get("a")).to_equal(b"aa")
+        expect(cache.get_stats()["bytes"]).to_equal(2)
+
+        cache.remove("a")
+        expect(cache.get("a")).to_be_none()
+        expect(cache.get_stats()["bytes"]).to_equal(0)
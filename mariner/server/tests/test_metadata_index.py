@@ -0,0 +1,161 @@
+import dataclasses
+import os
+import pathlib
+import sqlite3
+import tempfile
+from typing import Any, List
+from unittest import TestCase
+
+from pyexpect import expect
+
+from mariner.file_formats.ctb import CTBFile
+from mariner.file_formats.layer_table import LazyLayerTable
+from mariner.server.metadata_index import FileFingerprint, MetadataIndex
+
+
+class MetadataIndexTest(TestCase):
+    def setUp(self) -> None:
+        self.path = str(
+            pathlib.Path(__file__).parent.parent.parent
+            / "file_formats"
+            / "tests"
+            / "stairs.ctb"
+        )
+        self.fingerprint = FileFingerprint.from_path(self.path)
+        self.sliced_model_file = CTBFile.read(pathlib.Path(self.path))
+        self.metadata_index = MetadataIndex(":memory:")
+
+    def tearDown(self) -> None:
+        self.metadata_index.close()
+
+    def test_missing_file(self) -> None:
+        expect(self.metadata_index.get(self.path, self.fingerprint)).to_be_none()
+
+    def test_put_and_get(self) -> None:
+        self.metadata_index.put(self.path, self.fingerprint, self.sliced_model_file)
+        sliced_model_file = self.metadata_index.get(self.path, self.fingerprint)
+
+        expect(sliced_model_file).is_instance_of(CTBFile)
+        # layer tables are compared separately below
+        expect(
+            dataclasses.replace(sliced_model_file, end_byte_offset_by_layer=[])
+        ).to_equal(
+            dataclasses.replace(self.sliced_model_file, end_byte_offset_by_layer=[])
+        )
+        expect(sliced_model_file.end_byte_offset_by_layer).is_instance_of(
+            LazyLayerTable
+        )
+        expect(list(sliced_model_file.end_byte_offset_by_layer)).to_equal(
+            list(self.sliced_model_file.end_byte_offset_by_layer)
+        )
+
+    def test_changed_fingerprint(self) -> None:
+        self.metadata_index.put(self.path, self.fingerprint, self.sliced_model_file)
+        changed_fingerprint = FileFingerprint(
+            size=self.fingerprint.size + 1,
+            mtime_ns=self.fingerprint.mtime_ns,
+        )
+        expect(self.metadata_index.get(self.path, changed_fingerprint)).to_be_none()
+
+        # indexing the changed file replaces the old row
+        self.metadata_index.put(self.path, changed_fingerprint, self.sliced_model_file)
+        expect(self.metadata_index.get(self.path, changed_fingerprint)).not_to_be_none()
+        expect(self.metadata_index.get(self.path, self.fingerprint)).to_be_none()
+
+    def test_old_index_is_dropped(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            database_path = os.path.join(directory, "metadata.sqlite3")
+            connection = sqlite3.connect(database_path)
+            connection.execute(
+                "CREATE TABLE sliced_files (path TEXT PRIMARY KEY, inode INTEGER)"
+            )
+            connection.commit()
+            connection.close()
+
+            metadata_index = MetadataIndex(database_path)
+            try:
+                metadata_index.put(self.path, self.fingerprint, self.sliced_model_file)
+                expect(metadata_index.get_fingerprints()).to_equal(
+                    {self.path: self.fingerprint}
+                )
+            finally:
+                metadata_index.close()
+            connection = sqlite3.connect(database_path)
+            expect(
+                connection.execute(
+                    "SELECT name FROM sqlite_master WHERE name = 'sliced_files'"
+                ).fetchall()
+            ).to_equal([])
+            connection.close()
+
+    def test_get_many(self) -> None:
+        self.metadata_index.put(self.path, self.fingerprint, self.sliced_model_file)
+        sliced_model_files = self.metadata_index.get_many(
+            [
+                (self.path, self.fingerprint),
+                ("/mnt/usb_share/missing.ctb", self.fingerprint),
+            ]
+        )
+        expect(list(sliced_model_files.keys())).to_equal([self.path])
+
+    def test_get_fingerprints(self) -> None:
+        expect(self.metadata_index.get_fingerprints()).to_equal({})
+        self.metadata_index.put(self.path, self.fingerprint, self.sliced_model_file)
+        expect(self.metadata_index.get_fingerprints()).to_equal(
+            {self.path: self.fingerprint}
+        )
+
+    def test_remove(self) -> None:
+        self.metadata_index.put(self.path, self.fingerprint, self.sliced_model_file)
+        self.metadata_index.remove([self.path, "/mnt/usb_share/missing.ctb"])
+        expect(self.metadata_index.get(self.path, self.fingerprint)).to_be_none()
+        expect(self.metadata_index.get_fingerprints()).to_equal({})
+
+    def test_search(self) -> None:
+        for path in [
+            "/mnt/usb_share/stairs.ctb",
+            "/mnt/usb_share/prints/Big_Stairs.ctb",
+            "/mnt/usb_share/prints/pyramid.ctb",
+            "/mnt/other/stairs.ctb",
+        ]:
+            self.metadata_index.put(
+                path,
+                self.fingerprint,
+                dataclasses.replace(
+                    self.sliced_model_file, filename=pathlib.Path(path).name
+                ),
+            )
+
+        def search_paths(**kwargs: Any) -> List[str]:
+            (results, total_count) = self.metadata_index.search(
+                "/mnt/usb_share", limit=10, **kwargs
+            )
+            expect(total_count).to_equal(len(results))
+            return [path for (path, _) in results]
+
+        expect(search_paths(name="stairs")).to_equal(
+            ["/mnt/usb_share/prints/Big_Stairs.ctb", "/mnt/usb_share/stairs.ctb"]
+        )
+        # underscores are matched literally rather than as wildcards
+        expect(search_paths(name="g_s")).to_equal(
+            ["/mnt/usb_share/prints/Big_Stairs.ctb"]
+        )
+        expect(search_paths(name="g%s")).to_equal([])
+        expect(len(search_paths(printer_name="mars pro"))).to_equal(3)
+        expect(search_paths(printer_name="photon")).to_equal([])
+        expect(len(search_paths(slicer_version="1.6.5.1"))).to_equal(3)
+        expect(len(search_paths(layer_height_mm=0.05))).to_equal(3)
+        expect(search_paths(layer_height_mm=0.1)).to_equal([])
+        expect(
+            len(search_paths(min_print_time_secs=5621, max_print_time_secs=5621))
+        ).to_equal(3)
+        expect(search_paths(min_print_time_secs=5622)).to_equal([])
+
+        (results, total_count) = self.metadata_index.search(
+            "/mnt/usb_share", limit=1, offset=1
+        )
+        expect(total_count).to_equal(3)
+        expect([path for (path, _) in results]).to_equal(
+            ["/mnt/usb_share/prints/pyramid.ctb"]
+        )
+        expect(results[0][1]).is_instance_of(CTBFile)
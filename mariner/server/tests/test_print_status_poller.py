@@ -0,0 +1,91 @@
+import threading
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from pyexpect import expect
+
+from mariner.exceptions import UnexpectedPrinterResponse
+from mariner.printer import ChiTuPrinter, PrinterState, PrintStatus
+from mariner.server.print_status_poller import PrintStatusPoller
+from mariner.server.printer_connection import PrinterConnection
+
+
+class PrintStatusPollerTest(TestCase):
+    def setUp(self) -> None:
+        self.sleep_patcher = patch("mariner.server.utils.time.sleep")
+        self.sleep_patcher.start()
+        self.printer_mock = Mock(spec=ChiTuPrinter)
+        self.printer_mock.pop_unsolicited_lines.return_value = []
+        self.printer_mock.get_selected_file.return_value = "foobar.ctb"
+        self.printer_mock.get_print_status.return_value = PrintStatus(
+            state=PrinterState.PRINTING,
+            current_byte=256537,
+            total_bytes=832745,
+        )
+        self.connection = PrinterConnection(lambda: self.printer_mock)
+        self.poller = PrintStatusPoller(self.connection, 60.0)
+
+    def tearDown(self) -> None:
+        self.poller.stop()
+        self.connection.stop()
+        self.sleep_patcher.stop()
+
+    def test_first_snapshot_polls_the_printer(self) -> None:
+        snapshot = self.poller.get_snapshot()
+        expect(snapshot.selected_file).to_equal("foobar.ctb")
+        expect(snapshot.print_status.state).to_equal(PrinterState.PRINTING)
+        expect(snapshot.get_age_secs()).less(60.0)
+
+    def test_snapshot_is_reused(self) -> None:
+        first_snapshot = self.poller.get_snapshot()
+        expect(self.poller.get_snapshot()).to_be(first_snapshot)
+        self.printer_mock.get_print_status.assert_called_once_with()
+
+    def test_stale_snapshot_is_refreshed(self) -> None:
+        first_snapshot = self.poller.get_snapshot()
+        with patch(
+            "mariner.server.print_status_poller.time.monotonic",
+            return_value=first_snapshot.polled_at + 181.0,
+        ):
+            second_snapshot = self.poller.get_snapshot()
+        expect(second_snapshot).not_to_be(first_snapshot)
+        expect(self.printer_mock.get_print_status.call_count).to_equal(2)
+
+    def test_invalidate(self) -> None:
+        first_snapshot = self.poller.get_snapshot()
+        self.poller.invalidate()
+        expect(self.poller.get_snapshot()).not_to_be(first_snapshot)
+
+    def test_wait_for_next_snapshot(self) -> None:
+        first_snapshot = self.poller.get_snapshot()
+        expect(self.poller.wait_for_next_snapshot(first_snapshot, 0.01)).to_be(
+            first_snapshot
+        )
+
+        refresher = threading.Timer(0.01, self.poller.refresh)
+        refresher.start()
+        next_snapshot = self.poller.wait_for_next_snapshot(first_snapshot, 5.0)
+        refresher.join()
+        expect(next_snapshot).not_to_be(first_snapshot)
+
+    def test_retries_unexpected_responses(self) -> None:
+        self.printer_mock.get_selected_file.side_effect = [
+            UnexpectedPrinterResponse("ok\r\n"),
+            "foobar.ctb",
+        ]
+        expect(self.poller.get_snapshot().selected_file).to_equal("foobar.ctb")
+
+    def test_background_polling(self) -> None:
+        polled = threading.Event()
+
+        def _get_print_status() -> PrintStatus:
+            polled.set()
+            return PrintStatus(state=PrinterState.IDLE)
+
+        self.printer_mock.get_print_status.side_effect = _get_print_status
+        poller = PrintStatusPoller(self.connection, 0.01)
+        try:
+            poller.start()
+            expect(polled.wait(timeout=5.0)).to_equal(True)
+        finally:
+            poller.stop()
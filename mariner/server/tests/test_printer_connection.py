@@ -0,0 +1,103 @@
+import threading
+from typing import List
+from unittest import TestCase
+from unittest.mock import Mock
+
+from pyexpect import expect
+
+from mariner.exceptions import UnexpectedPrinterResponse
+from mariner.printer import ChiTuPrinter
+from mariner.server.printer_connection import PrinterConnection
+
+
+class PrinterConnectionTest(TestCase):
+    def setUp(self) -> None:
+        self.printers: List[Mock] = []
+
+        def _create_printer() -> ChiTuPrinter:
+            printer = Mock(spec=ChiTuPrinter)
+            printer.pop_unsolicited_lines.return_value = []
+            self.printers.append(printer)
+            return printer
+
+        self.connection = PrinterConnection(_create_printer)
+
+    def tearDown(self) -> None:
+        self.connection.stop()
+
+    def test_port_is_opened_once_and_closed_on_stop(self) -> None:
+        for _ in range(0, 3):
+            self.connection.run(lambda printer: printer.get_selected_file())
+
+        expect(len(self.printers)).to_equal(1)
+        self.printers[0].open.assert_called_once_with()
+        expect(self.printers[0].get_selected_file.call_count).to_equal(3)
+        self.printers[0].close.assert_not_called()
+
+        self.connection.stop()
+        self.printers[0].close.assert_called_once_with()
+
+    def test_returns_command_result(self) -> None:
+        result = self.connection.run(lambda printer: 42)
+        expect(result).to_equal(42)
+
+    def test_logs_unsolicited_lines(self) -> None:
+        def _get_selected_file(printer: ChiTuPrinter) -> str:
+            # pyre-ignore[16]: the printer is a mock
+            printer.pop_unsolicited_lines.return_value = ["ok N:0\r\n"]
+            return "foo.ctb"
+
+        with self.assertLogs("mariner.server.printer_connection", "DEBUG") as logs:
+            expect(self.connection.run(_get_selected_file)).to_equal("foo.ctb")
+        expect(logs.output).to_equal(
+            [
+                "DEBUG:mariner.server.printer_connection:"
+                + "Unsolicited line from the printer: ok N:0"
+            ]
+        )
+
+    def test_propagates_printer_errors_without_reopening(self) -> None:
+        def _fail(printer: ChiTuPrinter) -> None:
+            raise UnexpectedPrinterResponse("foo")
+
+        with self.assertRaises(UnexpectedPrinterResponse):
+            self.connection.run(_fail)
+        self.connection.run(lambda printer: printer.get_selected_file())
+
+        expect(len(self.printers)).to_equal(1)
+        self.printers[0].close.assert_not_called()
+
+    def test_reopens_port_after_serial_errors(self) -> None:
+        def _fail(printer: ChiTuPrinter) -> None:
+            raise OSError("device disconnected")
+
+        with self.assertRaises(OSError):
+            self.connection.run(_fail)
+        self.printers[0].close.assert_called_once_with()
+
+        self.connection.run(lambda printer: printer.get_selected_file())
+        expect(len(self.printers)).to_equal(2)
+        self.printers[1].open.assert_called_once_with()
+
+    def test_commands_from_multiple_threads_do_not_overlap(self) -> None:
+        running = []
+        overlaps = []
+
+        def _command(printer: ChiTuPrinter) -> None:
+            if running:
+                overlaps.append(True)
+            running.append(True)
+            printer.get_print_status()
+            running.pop()
+
+        threads = [
+            threading.Thread(target=lambda: self.connection.run(_command))
+            for _ in range(0, 10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        expect(overlaps).to_equal([])
+        expect(self.printers[0].get_print_status.call_count).to_equal(10)
@@ -0,0 +1,104 @@
+import fcntl
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from unittest import TestCase
+
+from pyexpect import expect
+
+from mariner.server.single_flight import NUM_LOCK_FILES, SingleFlight
+
+
+class _WaitCountingEvent(threading.Event):
+    def __init__(self) -> None:
+        super().__init__()
+        self.waiters = threading.Semaphore(0)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        self.waiters.release()
+        return super().wait(timeout)
+
+
+class SingleFlightTest(TestCase):
+    def setUp(self) -> None:
+        self.lock_directory = tempfile.TemporaryDirectory()
+        self.single_flight = SingleFlight(self.lock_directory.name)
+
+    def tearDown(self) -> None:
+        self.lock_directory.cleanup()
+
+    def test_concurrent_calls_share_one_computation(self) -> None:
+        num_calls = 0
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute() -> int:
+            nonlocal num_calls
+            num_calls += 1
+            started.set()
+            release.wait()
+            return 42
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            leader = executor.submit(self.single_flight.run, "key", compute)
+            started.wait()
+            done_event = _WaitCountingEvent()
+            self.single_flight._calls["key"].done = done_event
+            followers = [
+                executor.submit(self.single_flight.run, "key", compute)
+                for _ in range(3)
+            ]
+            for _ in range(3):
+                done_event.waiters.acquire()
+            release.set()
+            results = [future.result() for future in [leader, *followers]]
+
+        expect(results).to_equal([42, 42, 42, 42])
+        expect(num_calls).to_equal(1)
+        expect(self.single_flight._calls).to_equal({})
+
+    def test_waiting_calls_get_the_exception(self) -> None:
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute() -> int:
+            started.set()
+            release.wait()
+            raise ValueError("broken file")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(self.single_flight.run, "key", compute)
+            started.wait()
+            done_event = _WaitCountingEvent()
+            self.single_flight._calls["key"].done = done_event
+            follower = executor.submit(self.single_flight.run, "key", lambda: 1)
+            done_event.waiters.acquire()
+            release.set()
+            with self.assertRaises(ValueError):
+                leader.result()
+            with self.assertRaises(ValueError):
+                follower.result()
+
+    def test_computations_wait_for_other_processes(self) -> None:
+        # flock locks are held per open file, so holding all of the lock files
+        # from here is the same as another process holding them
+        lock_files = []
+        for lock_number in range(NUM_LOCK_FILES):
+            lock_file = open(
+                os.path.join(self.lock_directory.name, f"{lock_number}.lock"), "w"
+            )
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            lock_files.append(lock_file)
+
+        computed = threading.Event()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(
+                self.single_flight.run, "key", lambda: computed.set()
+            )
+            expect(computed.wait(0.1)).to_equal(False)
+            for lock_file in lock_files:
+                lock_file.close()
+            future.result()
+        expect(computed.is_set()).to_equal(True)
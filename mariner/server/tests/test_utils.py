@@ -1,7 +1,34 @@
+import os
+import pathlib
+import threading
+import time
+from typing import List
 from unittest import TestCase
 from unittest.mock import patch
 
-from mariner.server.utils import retry
+import png
+from pyexpect import expect
+from pyfakefs.fake_filesystem_unittest import TestCase as FakeFilesystemTestCase
+
+from mariner import config
+from mariner.file_formats.ctb import CTBFile
+from mariner.server import _cache_file
+from mariner.server.cache_work_queue import CacheWorkQueue
+from mariner.server.metadata_index import FileFingerprint, MetadataIndex
+from mariner.server.utils import (
+    CacheWorkerError,
+    collect_cache_garbage,
+    get_cached_preview_path,
+    get_cached_preview_paths,
+    get_indexed_fingerprints,
+    get_preview_thumbnail_size,
+    get_preview_version,
+    invalidate_cached_file,
+    read_cached_sliced_model_file,
+    remove_indexed_files,
+    retry,
+    sliced_model_file_memory_cache,
+)
 
 
 class RetryTest(TestCase):
@@ -63,3 +90,337 @@ class RetryTest(TestCase):
         )
         self.assertEquals(self.num_attempts, 2)
         self.assertEquals(ret, 42)
+
+
+class CachedReadsTest(FakeFilesystemTestCase):
+    def setUp(self) -> None:
+        path = pathlib.Path(__file__).parent.parent.parent / "file_formats" / "tests"
+        with open(path / "stairs.ctb", "rb") as file:
+            self.ctb_file_contents = file.read()
+        self.setUpPyfakefs()
+        self.previews_directory = os.path.join(config.get_cache_directory(), "previews")
+        self.fs.create_file(
+            "/mnt/usb_share/stairs.ctb", contents=self.ctb_file_contents
+        )
+        self.metadata_index = MetadataIndex(":memory:")
+        self.metadata_index_patcher = patch(
+            "mariner.server.utils.metadata_index", self.metadata_index
+        )
+        self.metadata_index_patcher.start()
+        sliced_model_file_memory_cache.clear()
+        self.cache_work_queue = CacheWorkQueue(":memory:")
+        self.cache_work_queue_patcher = patch(
+            "mariner.server.utils.cache_work_queue", self.cache_work_queue
+        )
+        self.cache_work_queue_patcher.start()
+
+    def tearDown(self) -> None:
+        self.cache_work_queue_patcher.stop()
+        self.cache_work_queue.close()
+        self.metadata_index_patcher.stop()
+        self.metadata_index.close()
+
+    def test_fingerprint(self) -> None:
+        fingerprint = FileFingerprint.from_path("/mnt/usb_share/stairs.ctb")
+        stat_result = os.stat("/mnt/usb_share/stairs.ctb")
+        expect(fingerprint.size).to_equal(len(self.ctb_file_contents))
+        expect(fingerprint.mtime_ns).to_equal(stat_result.st_mtime_ns)
+
+    def test_changed_files_are_read_again(self) -> None:
+        with patch.object(CTBFile, "read", side_effect=CTBFile.read) as read_mock:
+            read_cached_sliced_model_file("/mnt/usb_share/stairs.ctb")
+            read_cached_sliced_model_file("/mnt/usb_share/stairs.ctb")
+            expect(read_mock.call_count).to_equal(1)
+
+            # re-uploading a file under the same name changes its fingerprint
+            self.fs.remove("/mnt/usb_share/stairs.ctb")
+            self.fs.create_file(
+                "/mnt/usb_share/stairs.ctb", contents=self.ctb_file_contents + b"\0"
+            )
+            read_cached_sliced_model_file("/mnt/usb_share/stairs.ctb")
+            expect(read_mock.call_count).to_equal(2)
+
+    def test_files_whose_inode_changed_are_still_cached(self) -> None:
+        # vfat makes up inode numbers, which change on every remount
+        stat_result = os.stat("/mnt/usb_share/stairs.ctb")
+        self.fs.remove("/mnt/usb_share/stairs.ctb")
+        self.fs.create_file(
+            "/mnt/usb_share/stairs.ctb", contents=self.ctb_file_contents
+        )
+        os.utime(
+            "/mnt/usb_share/stairs.ctb",
+            ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns),
+        )
+        remounted_stat_result = os.stat("/mnt/usb_share/stairs.ctb")
+        expect(remounted_stat_result.st_ino).not_to_equal(stat_result.st_ino)
+
+        fingerprint = FileFingerprint.from_stat(stat_result)
+        remounted_fingerprint = FileFingerprint.from_stat(remounted_stat_result)
+        expect(remounted_fingerprint).to_equal(fingerprint)
+        expect(
+            get_preview_version("/mnt/usb_share/stairs.ctb", remounted_fingerprint)
+        ).to_equal(get_preview_version("/mnt/usb_share/stairs.ctb", fingerprint))
+        with patch.object(CTBFile, "read", side_effect=CTBFile.read) as read_mock:
+            read_cached_sliced_model_file("/mnt/usb_share/stairs.ctb", fingerprint)
+            sliced_model_file_memory_cache.clear()
+            read_cached_sliced_model_file(
+                "/mnt/usb_share/stairs.ctb", remounted_fingerprint
+            )
+            expect(read_mock.call_count).to_equal(1)
+
+    def test_indexed_fingerprints(self) -> None:
+        expect(get_indexed_fingerprints()).to_equal({})
+
+        read_cached_sliced_model_file("/mnt/usb_share/stairs.ctb")
+        expect(get_indexed_fingerprints()).to_equal(
+            {
+                "/mnt/usb_share/stairs.ctb": FileFingerprint.from_path(
+                    "/mnt/usb_share/stairs.ctb"
+                )
+            }
+        )
+
+        remove_indexed_files(["/mnt/usb_share/stairs.ctb"])
+        expect(get_indexed_fingerprints()).to_equal({})
+
+    def test_changed_previews_are_read_again(self) -> None:
+        with patch.object(
+            CTBFile, "read_preview", side_effect=CTBFile.read_preview
+        ) as read_preview_mock:
+            preview_path = get_cached_preview_path("/mnt/usb_share/stairs.ctb")
+            expect(get_cached_preview_path("/mnt/usb_share/stairs.ctb")).to_equal(
+                preview_path
+            )
+            expect(read_preview_mock.call_count).to_equal(1)
+            with open(preview_path, "rb") as file:
+                expect(file.read()).to_start_with(b"\x89PNG")
+
+            fingerprint = FileFingerprint.from_path("/mnt/usb_share/stairs.ctb")
+            changed_fingerprint = FileFingerprint(
+                size=fingerprint.size,
+                mtime_ns=fingerprint.mtime_ns + 1,
+            )
+            expect(
+                get_cached_preview_path(
+                    "/mnt/usb_share/stairs.ctb", changed_fingerprint
+                )
+            ).not_to_equal(preview_path)
+            expect(read_preview_mock.call_count).to_equal(2)
+
+    def test_preview_version(self) -> None:
+        fingerprint = FileFingerprint.from_path("/mnt/usb_share/stairs.ctb")
+        version = get_preview_version("/mnt/usb_share/stairs.ctb", fingerprint)
+        expect(get_cached_preview_path("/mnt/usb_share/stairs.ctb")).to_equal(
+            os.path.join(self.previews_directory, f"{version}.png")
+        )
+        # the version only depends on the path and the fingerprint of the file
+        expect(get_preview_version("/mnt/usb_share/stairs.ctb", fingerprint)).to_equal(
+            version
+        )
+        expect(
+            get_preview_version("/mnt/usb_share/other.ctb", fingerprint)
+        ).not_to_equal(version)
+
+    def test_preview_thumbnail_size(self) -> None:
+        expect(get_preview_thumbnail_size(1)).to_equal(64)
+        expect(get_preview_thumbnail_size(128)).to_equal(128)
+        expect(get_preview_thumbnail_size(129)).to_equal(256)
+        expect(get_preview_thumbnail_size(513)).to_be_none()
+
+    def test_preview_thumbnails(self) -> None:
+        with patch.object(
+            CTBFile, "read_preview", side_effect=CTBFile.read_preview
+        ) as read_preview_mock:
+            # the low-res preview is 200x125, so it's enough for small thumbnails
+            preview_path = get_cached_preview_path(
+                "/mnt/usb_share/stairs.ctb", size=128
+            )
+            read_preview_mock.assert_called_once_with(
+                pathlib.Path("/mnt/usb_share/stairs.ctb"), low_res=True
+            )
+            reader = png.Reader(filename=preview_path)
+            expect(reader.read()[:2]).to_equal((128, 80))
+
+            # but larger ones are scaled down from the high-res one
+            read_preview_mock.reset_mock()
+            preview_path = get_cached_preview_path(
+                "/mnt/usb_share/stairs.ctb", size=256
+            )
+            expect(read_preview_mock.call_count).to_equal(2)
+            read_preview_mock.assert_called_with(
+                pathlib.Path("/mnt/usb_share/stairs.ctb")
+            )
+            reader = png.Reader(filename=preview_path)
+            expect(reader.read()[:2]).to_equal((256, 192))
+
+            # each size gets rendered once
+            get_cached_preview_path("/mnt/usb_share/stairs.ctb", size=128)
+            get_cached_preview_path("/mnt/usb_share/stairs.ctb", size=256)
+            expect(read_preview_mock.call_count).to_equal(2)
+
+    def test_batched_previews(self) -> None:
+        for filename in ["new.ctb", "broken.ctb"]:
+            self.fs.create_file(
+                f"/mnt/usb_share/{filename}",
+                contents=self.ctb_file_contents if filename == "new.ctb" else b"",
+            )
+        cached_path = get_cached_preview_path("/mnt/usb_share/stairs.ctb", size=64)
+
+        results = list(
+            get_cached_preview_paths(
+                [
+                    (path, FileFingerprint.from_path(path))
+                    for path in [
+                        "/mnt/usb_share/new.ctb",
+                        "/mnt/usb_share/broken.ctb",
+                        "/mnt/usb_share/stairs.ctb",
+                    ]
+                ],
+                size=64,
+            )
+        )
+        # previews which were cached already come first
+        expect(results[0][0]).to_equal("/mnt/usb_share/stairs.ctb")
+        expect(results[0][1].result()).to_equal(cached_path)
+        futures = dict(results[1:])
+        expect(sorted(futures.keys())).to_equal(
+            ["/mnt/usb_share/broken.ctb", "/mnt/usb_share/new.ctb"]
+        )
+        expect(futures["/mnt/usb_share/new.ctb"].result()).to_equal(
+            get_cached_preview_path("/mnt/usb_share/new.ctb", size=64)
+        )
+        expect(futures["/mnt/usb_share/broken.ctb"].exception()).not_to_be_none()
+
+    def test_batched_previews_are_rendered_by_cache_workers(self) -> None:
+        for filename in ["new.ctb", "broken.ctb"]:
+            self.fs.create_file(
+                f"/mnt/usb_share/{filename}",
+                contents=self.ctb_file_contents if filename == "new.ctb" else b"",
+            )
+        cached_path = get_cached_preview_path("/mnt/usb_share/stairs.ctb", size=64)
+        rendering_threads: List[str] = []
+        read_preview = CTBFile.read_preview
+
+        def _read_preview(path: pathlib.Path, low_res: bool = False) -> png.Image:
+            rendering_threads.append(threading.current_thread().name)
+            return read_preview(path, low_res)
+
+        stopped = threading.Event()
+
+        def _work() -> None:
+            while not stopped.is_set():
+                relative_path = self.cache_work_queue.claim()
+                if relative_path is None:
+                    time.sleep(0.01)
+                else:
+                    _cache_file(relative_path)
+
+        self.cache_work_queue.start_run([], 0)
+        self.cache_work_queue.beat()
+        worker = threading.Thread(target=_work, name="cache-worker-0")
+        with patch(
+            "mariner.server.cache_work_queue", self.cache_work_queue
+        ), patch.object(
+            CTBFile, "read_preview", side_effect=_read_preview
+        ), self.assertLogs(
+            "mariner.server"
+        ):
+            worker.start()
+            try:
+                results = list(
+                    get_cached_preview_paths(
+                        [
+                            (path, FileFingerprint.from_path(path))
+                            for path in [
+                                "/mnt/usb_share/new.ctb",
+                                "/mnt/usb_share/broken.ctb",
+                                "/mnt/usb_share/stairs.ctb",
+                            ]
+                        ],
+                        size=64,
+                    )
+                )
+            finally:
+                stopped.set()
+                worker.join()
+
+        expect(results[0][0]).to_equal("/mnt/usb_share/stairs.ctb")
+        expect(results[0][1].result()).to_equal(cached_path)
+        futures = dict(results[1:])
+        expect(futures["/mnt/usb_share/new.ctb"].result()).to_equal(
+            get_cached_preview_path("/mnt/usb_share/new.ctb", size=64)
+        )
+        expect(futures["/mnt/usb_share/broken.ctb"].exception()).is_instance_of(
+            CacheWorkerError
+        )
+        # the previews were rendered by the worker, not by the request
+        expect(set(rendering_threads)).to_equal({"cache-worker-0"})
+        expect(self.cache_work_queue.get_status()["done_files"]).to_equal(1)
+
+    def test_invalidate_cached_file(self) -> None:
+        fingerprint = FileFingerprint.from_path("/mnt/usb_share/stairs.ctb")
+        with patch.object(
+            CTBFile, "read_preview", side_effect=CTBFile.read_preview
+        ) as read_preview_mock:
+            read_cached_sliced_model_file("/mnt/usb_share/stairs.ctb")
+            get_cached_preview_path("/mnt/usb_share/stairs.ctb")
+            get_cached_preview_path("/mnt/usb_share/stairs.ctb", size=64)
+
+            invalidate_cached_file("/mnt/usb_share/stairs.ctb", fingerprint)
+            expect(get_indexed_fingerprints()).to_equal({})
+            expect(sliced_model_file_memory_cache.get_stats()["entries"]).to_equal(0)
+            expect(os.listdir(self.previews_directory)).to_equal([])
+
+            get_cached_preview_path("/mnt/usb_share/stairs.ctb")
+            expect(read_preview_mock.call_count).to_equal(3)
+
+    def test_collect_cache_garbage(self) -> None:
+        self.fs.create_file(
+            "/mnt/usb_share/deleted.ctb", contents=self.ctb_file_contents + b"\0"
+        )
+        fingerprint = FileFingerprint.from_path("/mnt/usb_share/stairs.ctb")
+        with patch.object(
+            CTBFile, "read_preview", side_effect=CTBFile.read_preview
+        ) as read_preview_mock:
+            for filename in ["/mnt/usb_share/stairs.ctb", "/mnt/usb_share/deleted.ctb"]:
+                read_cached_sliced_model_file(filename)
+                get_cached_preview_path(filename)
+            expect(len(os.listdir(self.previews_directory))).to_equal(2)
+
+            self.fs.remove("/mnt/usb_share/deleted.ctb")
+            files = {"/mnt/usb_share/stairs.ctb": fingerprint}
+            expect(collect_cache_garbage(files)).to_equal(1)
+            expect(len(os.listdir(self.previews_directory))).to_equal(1)
+            expect(get_indexed_fingerprints()).to_equal(files)
+
+            # previews of files which still exist are kept around
+            get_cached_preview_path("/mnt/usb_share/stairs.ctb")
+            expect(read_preview_mock.call_count).to_equal(2)
+
+            # unless the cache grew past its size limit
+            with patch("mariner.config.get_cache_max_size_mb", return_value=0):
+                expect(collect_cache_garbage(files)).to_equal(1)
+            expect(os.listdir(self.previews_directory)).to_equal([])
+
+            # previews being rendered are only collected once they're stale
+            temporary_path = os.path.join(self.previews_directory, "rendering.tmp")
+            self.fs.create_file(temporary_path)
+            expect(collect_cache_garbage(files)).to_equal(0)
+            os.utime(temporary_path, (0, 0))
+            expect(collect_cache_garbage(files)).to_equal(1)
+            expect(os.listdir(self.previews_directory)).to_equal([])
+
+    def test_collect_stale_temporary_uploads(self) -> None:
+        fingerprint = FileFingerprint.from_path("/mnt/usb_share/stairs.ctb")
+        files = {"/mnt/usb_share/stairs.ctb": fingerprint}
+        self.fs.create_file("/mnt/usb_share/.uploading.tmp")
+        self.fs.create_file("/mnt/usb_share/.crashed.tmp")
+        self.fs.create_file("/mnt/usb_share/not_an_upload.tmp")
+        os.utime("/mnt/usb_share/.crashed.tmp", (0, 0))
+        os.utime("/mnt/usb_share/not_an_upload.tmp", (0, 0))
+
+        # uploads left behind aren't previews, so they don't get counted
+        expect(collect_cache_garbage(files)).to_equal(0)
+        expect(os.path.exists("/mnt/usb_share/.crashed.tmp")).to_equal(False)
+        expect(os.path.exists("/mnt/usb_share/.uploading.tmp")).to_equal(True)
+        expect(os.path.exists("/mnt/usb_share/not_an_upload.tmp")).to_equal(True)
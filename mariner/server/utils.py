@@ -1,37 +1,465 @@
-import io
+import hashlib
 import os
+import pathlib
+import tempfile
 import time
-from typing import Callable, Type, TypeVar
+from concurrent.futures import Future
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
 import png
-from flask_caching import Cache
 
 from mariner import config
 from mariner.file_formats import SlicedModelFile
+from mariner.file_formats.preview import downscale_image, write_image
 from mariner.file_formats.utils import get_file_format
-from mariner.server.app import app
+from mariner.server.cache_work_queue import JobState, cache_work_queue
+from mariner.server.memory_cache import MemoryCache
+from mariner.server.metadata_index import FileFingerprint, metadata_index
+from mariner.server.single_flight import single_flight
 
 
-cache = Cache(app)
+def _get_approximate_sliced_model_file_size(sliced_model_file: SlicedModelFile) -> int:
+    # the layer table takes 4 bytes per layer once it's loaded, while everything
+    # else takes roughly the same amount of memory for every file
+    return 1024 + 4 * sliced_model_file.layer_count
 
 
-@cache.memoize(timeout=0)
-def read_cached_sliced_model_file(filename: str) -> SlicedModelFile:
+sliced_model_file_memory_cache: MemoryCache[
+    Tuple[str, FileFingerprint], SlicedModelFile
+] = MemoryCache(
+    max_entries=1024,
+    max_bytes=16 * 1024 * 1024,
+    get_size=_get_approximate_sliced_model_file_size,
+)
+# previews which didn't make it to their final place within this long are left
+# behind by processes which died while rendering them
+STALE_TEMPORARY_PREVIEW_SECS = 60 * 60
+# uploads get written to a hidden temporary file next to their final place
+# first, and the same goes for those which never made it there
+TEMPORARY_UPLOAD_PREFIX = "."
+TEMPORARY_UPLOAD_SUFFIX = ".tmp"
+STALE_TEMPORARY_UPLOAD_SECS = 60 * 60
+
+# sizes previews can be scaled down to. requested sizes get rounded up to one of
+# these, so there's only ever a handful of renditions of each preview around
+PREVIEW_THUMBNAIL_SIZES: Sequence[int] = (64, 128, 256, 512)
+
+# how often requests waiting for the cache workers to render previews check
+# whether they're done, and how long they wait before rendering the remaining
+# ones themselves (such as when the workers are stuck on some huge file)
+PREVIEW_POLL_INTERVAL_SECS: float = 0.1
+MAX_PREVIEW_WAIT_SECS: float = 60.0
+
+
+# cache keys are made out of the path and the fingerprint of the file, so a given
+# key always refers to the same contents
+def _get_cache_key(kind: str, path: str, fingerprint: FileFingerprint) -> str:
+    return f"{kind}:{path}:{fingerprint.size}:{fingerprint.mtime_ns}"
+
+
+def _get_previews_directory() -> str:
+    return os.path.join(config.get_cache_directory(), "previews")
+
+
+def get_preview_version(
+    filename: Union[str, os.PathLike], fingerprint: FileFingerprint
+) -> str:
+    # previews are addressed by the fingerprint of the file they come from, so the
+    # preview with a given version never changes
+    return hashlib.sha1(
+        _get_cache_key("preview", str(filename), fingerprint).encode("utf-8")
+    ).hexdigest()
+
+
+def get_preview_thumbnail_size(size: int) -> Optional[int]:
+    # the smallest thumbnail size which is at least as large as the given one, or
+    # None if only the full size preview will do
+    return next(
+        (
+            thumbnail_size
+            for thumbnail_size in PREVIEW_THUMBNAIL_SIZES
+            if thumbnail_size >= size
+        ),
+        None,
+    )
+
+
+def _get_preview_path(
+    filename: Union[str, os.PathLike],
+    fingerprint: FileFingerprint,
+    size: Optional[int] = None,
+) -> str:
+    version = get_preview_version(filename, fingerprint)
+    name = f"{version}.png" if size is None else f"{version}-{size}.png"
+    return os.path.join(_get_previews_directory(), name)
+
+
+def _get_preview_paths(
+    filename: Union[str, os.PathLike], fingerprint: FileFingerprint
+) -> List[str]:
+    # every rendition of the preview, whether it was rendered or not
+    return [
+        _get_preview_path(filename, fingerprint, size)
+        for size in [None, *PREVIEW_THUMBNAIL_SIZES]
+    ]
+
+
+def _read_preview_image(path: str, size: Optional[int]) -> png.Image:
+    file_format = get_file_format(path)
+    if size is None:
+        return file_format.read_preview(pathlib.Path(path))
+    # the low-res preview is much cheaper to decode, so it's used whenever it
+    # doesn't need to be scaled up to the requested size
+    preview_image = file_format.read_preview(pathlib.Path(path), low_res=True)
+    if max(preview_image.info["width"], preview_image.info["height"]) < size:
+        preview_image = file_format.read_preview(pathlib.Path(path))
+    return downscale_image(preview_image, size)
+
+
+def _render_preview(path: str, preview_path: str, size: Optional[int]) -> None:
+    # another thread or process might have rendered the preview while we were
+    # waiting for our turn
+    if os.path.exists(preview_path):
+        return
+    preview_image = _read_preview_image(path, size)
+    # previews are written somewhere else first and then moved into place, so a
+    # half-written preview never gets served
+    os.makedirs(_get_previews_directory(), exist_ok=True)
+    (fd, temporary_path) = tempfile.mkstemp(
+        dir=_get_previews_directory(), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as file:
+            write_image(preview_image, file)
+        os.replace(temporary_path, preview_path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def _read_and_index_sliced_model_file(
+    path: str, fingerprint: FileFingerprint
+) -> SlicedModelFile:
+    # another thread or process might have indexed the file while we were waiting
+    # for our turn to parse it
+    sliced_model_file = metadata_index.get(path, fingerprint)
+    if sliced_model_file is None:
+        file_format = get_file_format(path)
+        sliced_model_file = file_format.read(pathlib.Path(path))
+        metadata_index.put(path, fingerprint, sliced_model_file)
+    return sliced_model_file
+
+
+# the fingerprint can be passed in when the caller already has it at hand (e.g.
+# from a scandir entry), otherwise the file gets stat'ed here
+def read_cached_sliced_model_file(
+    filename: Union[str, os.PathLike],
+    fingerprint: Optional[FileFingerprint] = None,
+) -> SlicedModelFile:
     assert os.path.isabs(filename)
-    file_format = get_file_format(filename)
-    return file_format.read(config.get_files_directory() / filename)
+    if fingerprint is None:
+        fingerprint = FileFingerprint.from_path(filename)
+    return read_cached_sliced_model_files([(filename, fingerprint)])[0]
 
 
-@cache.memoize(timeout=0)
-def read_cached_preview(filename: str) -> bytes:
+def read_indexed_sliced_model_files(
+    files: Sequence[Tuple[Union[str, os.PathLike], FileFingerprint]]
+) -> Dict[str, SlicedModelFile]:
+    # returns the given files which are cached already, by path, without parsing
+    # any of them. files are looked up in memory first, and the remaining ones are
+    # looked up in the metadata index all at once.
+    sliced_model_files: Dict[str, SlicedModelFile] = {}
+    missing_paths_and_fingerprints: List[Tuple[str, FileFingerprint]] = []
+    for (filename, fingerprint) in files:
+        path = str(filename)
+        sliced_model_file = sliced_model_file_memory_cache.get((path, fingerprint))
+        if sliced_model_file is not None:
+            sliced_model_files[path] = sliced_model_file
+        else:
+            missing_paths_and_fingerprints.append((path, fingerprint))
+    if missing_paths_and_fingerprints:
+        indexed_sliced_model_files = metadata_index.get_many(
+            missing_paths_and_fingerprints
+        )
+        for (path, fingerprint) in missing_paths_and_fingerprints:
+            sliced_model_file = indexed_sliced_model_files.get(path)
+            if sliced_model_file is not None:
+                sliced_model_file_memory_cache.put(
+                    (path, fingerprint), sliced_model_file
+                )
+                sliced_model_files[path] = sliced_model_file
+    return sliced_model_files
+
+
+def read_cached_sliced_model_files(
+    files: Sequence[Tuple[Union[str, os.PathLike], FileFingerprint]]
+) -> List[SlicedModelFile]:
+    # only the files which aren't cached yet or changed since they were cached
+    # get parsed
+    sliced_model_files = read_indexed_sliced_model_files(files)
+    for (filename, fingerprint) in files:
+        path = str(filename)
+        if path not in sliced_model_files:
+            sliced_model_file = single_flight.run(
+                _get_cache_key("sliced_model_file", path, fingerprint),
+                lambda: _read_and_index_sliced_model_file(path, fingerprint),
+            )
+            sliced_model_file_memory_cache.put((path, fingerprint), sliced_model_file)
+            sliced_model_files[path] = sliced_model_file
+    return [sliced_model_files[str(filename)] for (filename, _) in files]
+
+
+def get_cached_preview_path(
+    filename: Union[str, os.PathLike],
+    fingerprint: Optional[FileFingerprint] = None,
+    size: Optional[int] = None,
+) -> str:
+    # returns the path of the preview's png file, rendering it first if needed.
+    # the size must be one of PREVIEW_THUMBNAIL_SIZES, or None for the full size
+    # preview.
     assert os.path.isabs(filename)
-    bytes = io.BytesIO()
-    file_format = get_file_format(filename)
-    preview_image: png.Image = file_format.read_preview(
-        config.get_files_directory() / filename
+    assert size is None or size in PREVIEW_THUMBNAIL_SIZES
+    if fingerprint is None:
+        fingerprint = FileFingerprint.from_path(filename)
+    preview_path = _get_preview_path(filename, fingerprint, size)
+    if not os.path.exists(preview_path):
+        single_flight.run(
+            _get_cache_key(f"preview:{size}", str(filename), fingerprint),
+            lambda: _render_preview(str(filename), preview_path, size),
+        )
+    return preview_path
+
+
+class CacheWorkerError(Exception):
+    # an error one of the cache workers ran into, of which only its repr is left
+    def __repr__(self) -> str:
+        return str(self.args[0])
+
+
+def _get_finished_future(
+    result: Optional[str] = None, exception: Optional[Exception] = None
+) -> "Future[str]":
+    future: "Future[str]" = Future()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+
+def get_cached_preview_paths(
+    files: Sequence[Tuple[Union[str, os.PathLike], FileFingerprint]],
+    size: Optional[int] = None,
+) -> Iterator[Tuple[str, "Future[str]"]]:
+    # same as get_cached_preview_path, but for many files at once. yields each
+    # file along with a finished future for the path of its preview, in the order
+    # they become available: previews which are cached already come first. the
+    # remaining ones get pushed to the front of the cache workers' queue, so they
+    # get rendered in parallel without taking up the server's own cpu time, and
+    # are yielded as each of them lands. rendering errors are set on the futures,
+    # so they don't keep the other previews from being returned.
+    files_directory = config.get_files_directory()
+    cached_paths: List[Tuple[str, str]] = []
+    uncached_files: Dict[str, Tuple[str, FileFingerprint, str]] = {}
+    for (filename, fingerprint) in files:
+        path = str(filename)
+        preview_path = _get_preview_path(path, fingerprint, size)
+        if os.path.exists(preview_path):
+            cached_paths.append((path, preview_path))
+        else:
+            relative_path = os.path.relpath(path, files_directory)
+            uncached_files[relative_path] = (path, fingerprint, preview_path)
+
+    is_queued = bool(uncached_files) and cache_work_queue.has_live_workers()
+    if is_queued:
+        cache_work_queue.push(list(uncached_files.keys()), preview_size=size)
+    for (path, preview_path) in cached_paths:
+        yield (path, _get_finished_future(preview_path))
+
+    # files which workers are done with but whose preview is still missing (such
+    # as when it got evicted from the cache right away) are left for later
+    unrendered_files: List[Tuple[str, FileFingerprint]] = []
+    deadline = time.monotonic() + MAX_PREVIEW_WAIT_SECS
+    while is_queued and uncached_files:
+        job_states = cache_work_queue.get_job_states(list(uncached_files.keys()))
+        for (relative_path, (path, fingerprint, preview_path)) in list(
+            uncached_files.items()
+        ):
+            (state, error) = job_states.get(relative_path, (None, None))
+            if os.path.exists(preview_path):
+                future = _get_finished_future(preview_path)
+            elif state == JobState.FAILED:
+                future = _get_finished_future(exception=CacheWorkerError(error))
+            elif state is None or state == JobState.DONE:
+                unrendered_files.append((path, fingerprint))
+                del uncached_files[relative_path]
+                continue
+            else:
+                continue
+            del uncached_files[relative_path]
+            yield (path, future)
+        if uncached_files:
+            time.sleep(PREVIEW_POLL_INTERVAL_SECS)
+            # if the workers died, we're better off rendering what's left ourselves
+            is_queued = (
+                time.monotonic() < deadline and cache_work_queue.has_live_workers()
+            )
+
+    unrendered_files += [
+        (path, fingerprint) for (path, fingerprint, _) in uncached_files.values()
+    ]
+    for (path, fingerprint) in unrendered_files:
+        try:
+            future = _get_finished_future(
+                get_cached_preview_path(path, fingerprint, size)
+            )
+        except Exception as exception:
+            future = _get_finished_future(exception=exception)
+        yield (path, future)
+
+
+def get_indexed_fingerprints() -> Dict[str, FileFingerprint]:
+    # the fingerprint each indexed file had when it was parsed, by path
+    return metadata_index.get_fingerprints()
+
+
+def search_indexed_sliced_model_files(
+    directory: Union[str, os.PathLike],
+    *,
+    name: Optional[str] = None,
+    printer_name: Optional[str] = None,
+    slicer_version: Optional[str] = None,
+    layer_height_mm: Optional[float] = None,
+    min_print_time_secs: Optional[int] = None,
+    max_print_time_secs: Optional[int] = None,
+    limit: int,
+    offset: int = 0,
+) -> Tuple[List[Tuple[str, SlicedModelFile]], int]:
+    # only files which were indexed already can be found, but the cache
+    # bootstrapper makes sure that's all of them shortly after they show up
+    return metadata_index.search(
+        str(directory),
+        name=name,
+        printer_name=printer_name,
+        slicer_version=slicer_version,
+        layer_height_mm=layer_height_mm,
+        min_print_time_secs=min_print_time_secs,
+        max_print_time_secs=max_print_time_secs,
+        limit=limit,
+        offset=offset,
     )
-    preview_image.write(bytes)
-    return bytes.getvalue()
+
+
+def remove_indexed_files(filenames: Sequence[Union[str, os.PathLike]]) -> None:
+    metadata_index.remove([str(filename) for filename in filenames])
+
+
+def invalidate_cached_file(
+    filename: Union[str, os.PathLike], fingerprint: FileFingerprint
+) -> None:
+    # forgets everything cached about the given version of a file, such as when
+    # it's about to be deleted or overwritten
+    path = str(filename)
+    metadata_index.remove([path])
+    sliced_model_file_memory_cache.remove((path, fingerprint))
+    for preview_path in _get_preview_paths(path, fingerprint):
+        try:
+            os.remove(preview_path)
+        except FileNotFoundError:
+            pass
+
+
+def is_temporary_upload(filename: str) -> bool:
+    return filename.startswith(TEMPORARY_UPLOAD_PREFIX) and filename.endswith(
+        TEMPORARY_UPLOAD_SUFFIX
+    )
+
+
+def _remove_stale_temporary_uploads() -> None:
+    try:
+        entries = list(os.scandir(config.get_files_directory()))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if not is_temporary_upload(entry.name):
+            continue
+        try:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            if time.time() - entry.stat().st_mtime > STALE_TEMPORARY_UPLOAD_SECS:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            # the upload just finished, or someone else got to it first
+            continue
+
+
+def collect_cache_garbage(files: Mapping[str, FileFingerprint]) -> int:
+    # takes the fingerprints of every file that currently exists, by path, and
+    # drops whatever is cached about files which were deleted or changed since
+    # they were cached. if previews still take more than the configured limit,
+    # the oldest ones get evicted as well. returns how many previews got deleted.
+    _remove_stale_temporary_uploads()
+    remove_indexed_files(
+        [path for path in metadata_index.get_fingerprints() if path not in files]
+    )
+
+    live_preview_names = {
+        os.path.basename(preview_path)
+        for (path, fingerprint) in files.items()
+        for preview_path in _get_preview_paths(path, fingerprint)
+    }
+    try:
+        entries = list(os.scandir(_get_previews_directory()))
+    except FileNotFoundError:
+        return 0
+
+    garbage: List[str] = []
+    live_entries: List[Tuple[float, int, str]] = []
+    for entry in entries:
+        if not entry.is_file():
+            continue
+        try:
+            stat_result = entry.stat()
+        except FileNotFoundError:
+            continue
+        if entry.name.endswith(".tmp"):
+            # previews which are still being rendered are left alone
+            if time.time() - stat_result.st_mtime > STALE_TEMPORARY_PREVIEW_SECS:
+                garbage.append(entry.path)
+            continue
+        if entry.name not in live_preview_names:
+            garbage.append(entry.path)
+            continue
+        live_entries.append((stat_result.st_mtime, stat_result.st_size, entry.path))
+
+    # the previews which were cached the longest ago go first
+    max_size_bytes = config.get_cache_max_size_mb() * 1024 * 1024
+    total_size_bytes = sum(size for (_, size, _) in live_entries)
+    for (_, size, path) in sorted(live_entries):
+        if total_size_bytes <= max_size_bytes:
+            break
+        garbage.append(path)
+        total_size_bytes -= size
+
+    for path in garbage:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # someone else got to it first
+            pass
+    return len(garbage)
 
 
 TReturn = TypeVar("TReturn")
@@ -1,16 +1,50 @@
+import importlib
+import os
 import pathlib
+import shutil
+import tempfile
+import time
+from typing import List
 from unittest import TestCase
-from unittest.mock import call, patch, MagicMock
+from unittest.mock import call, patch, ANY, MagicMock, Mock
 
-from mariner.server import CacheBootstrapper
+from mariner.file_formats.ctb import CTBFile
+from mariner.server import CacheBootstrapper, _apply_file_changes
+from mariner.server.cache_work_queue import CacheWorkQueue, HEARTBEAT_TIMEOUT_SECS
+from mariner.server.file_watcher import FileChanges
+from mariner.server.metadata_index import FileFingerprint, MetadataIndex
 
 
 class CacheBootstrapperTest(TestCase):
+    def setUp(self) -> None:
+        self.metadata_index = MetadataIndex(":memory:")
+        self.metadata_index_patcher = patch(
+            "mariner.server.utils.metadata_index", self.metadata_index
+        )
+        self.metadata_index_patcher.start()
+        self.cache_work_queue = CacheWorkQueue(":memory:")
+        self.cache_work_queue_patcher = patch(
+            "mariner.server.cache_work_queue", self.cache_work_queue
+        )
+        self.cache_work_queue_patcher.start()
+        # garbage collection would go through the actual cache directory
+        self.collect_cache_garbage_patcher = patch(
+            "mariner.server.collect_cache_garbage", return_value=0
+        )
+        self.collect_cache_garbage_patcher.start()
+
+    def tearDown(self) -> None:
+        self.collect_cache_garbage_patcher.stop()
+        self.cache_work_queue_patcher.stop()
+        self.cache_work_queue.close()
+        self.metadata_index_patcher.stop()
+        self.metadata_index.close()
+
     @patch("mariner.server.read_cached_sliced_model_file")
-    @patch("mariner.server.read_cached_preview")
+    @patch("mariner.server.get_cached_preview_path")
     def test_ctb_metadata_cache(
         self,
-        read_cached_preview_mock: MagicMock,
+        get_cached_preview_path_mock: MagicMock,
         read_cached_sliced_model_file_mock: MagicMock,
     ) -> None:
         files_directory = (
@@ -18,22 +52,245 @@ class CacheBootstrapperTest(TestCase):
         )
 
         with patch("mariner.config.get_files_directory", return_value=files_directory):
-            CacheBootstrapper().run()
+            CacheBootstrapper(num_processes=1, keep_running=False).run()
 
         read_cached_sliced_model_file_mock.assert_has_calls(
             [
-                call(files_directory / "stairs.fdg"),
-                call(files_directory / "pyramid.cbddlp"),
-                call(files_directory / "stairs.ctb"),
+                call(files_directory / "stairs.fdg", ANY),
+                call(files_directory / "pyramid.cbddlp", ANY),
+                call(files_directory / "stairs.ctb", ANY),
             ],
             any_order=True,
         )
 
-        read_cached_preview_mock.assert_has_calls(
+        get_cached_preview_path_mock.assert_has_calls(
             [
-                call(files_directory / "stairs.fdg"),
-                call(files_directory / "pyramid.cbddlp"),
-                call(files_directory / "stairs.ctb"),
+                call(files_directory / "stairs.fdg", ANY),
+                call(files_directory / "pyramid.cbddlp", ANY),
+                call(files_directory / "stairs.ctb", ANY),
             ],
             any_order=True,
         )
+
+    @patch("mariner.server.read_cached_sliced_model_file")
+    @patch("mariner.server.get_cached_preview_path")
+    def test_most_recently_modified_files_come_first(
+        self,
+        get_cached_preview_path_mock: MagicMock,
+        read_cached_sliced_model_file_mock: MagicMock,
+    ) -> None:
+        ctb_path = (
+            pathlib.Path(__file__).parent.parent
+            / "file_formats"
+            / "tests"
+            / "stairs.ctb"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            files_directory = pathlib.Path(directory)
+            for (i, filename) in enumerate(["old.ctb", "newest.ctb", "new.ctb"]):
+                shutil.copy(ctb_path, files_directory / filename)
+                os.utime(files_directory / filename, (0, [0, 2, 1][i] * 1000))
+            (files_directory / "notes.txt").write_text("not a sliced file")
+
+            with patch(
+                "mariner.config.get_files_directory", return_value=files_directory
+            ):
+                CacheBootstrapper(num_processes=1, keep_running=False).run()
+
+        read_cached_sliced_model_file_mock.assert_has_calls(
+            [
+                call(files_directory / "newest.ctb", ANY),
+                call(files_directory / "new.ctb", ANY),
+                call(files_directory / "old.ctb", ANY),
+            ],
+        )
+        self.assertEqual(read_cached_sliced_model_file_mock.call_count, 3)
+
+        status = self.cache_work_queue.get_status()
+        self.assertEqual(status["state"], "DONE")
+        self.assertEqual(status["total_files"], 3)
+        self.assertEqual(status["done_files"], 3)
+        self.assertEqual(status["failed_files"], 0)
+
+    @patch("mariner.server.get_cached_preview_path")
+    @patch(
+        "mariner.server.read_cached_sliced_model_file",
+        side_effect=Exception("broken file"),
+    )
+    def test_failed_files_are_reported(
+        self,
+        read_cached_sliced_model_file_mock: MagicMock,
+        get_cached_preview_path_mock: MagicMock,
+    ) -> None:
+        ctb_path = (
+            pathlib.Path(__file__).parent.parent
+            / "file_formats"
+            / "tests"
+            / "stairs.ctb"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            files_directory = pathlib.Path(directory)
+            shutil.copy(ctb_path, files_directory / "broken.ctb")
+            with patch(
+                "mariner.config.get_files_directory", return_value=files_directory
+            ), self.assertLogs("mariner.server"):
+                CacheBootstrapper(num_processes=1, keep_running=False).run()
+
+        get_cached_preview_path_mock.assert_not_called()
+        status = self.cache_work_queue.get_status()
+        self.assertEqual(status["failed_files"], 1)
+        self.assertEqual(
+            status["errors"],
+            [{"path": "broken.ctb", "error": "Exception('broken file')"}],
+        )
+
+    @patch("mariner.server.read_cached_sliced_model_file")
+    @patch("mariner.server.get_cached_preview_path")
+    def test_only_changed_files_are_queued(
+        self,
+        get_cached_preview_path_mock: MagicMock,
+        read_cached_sliced_model_file_mock: MagicMock,
+    ) -> None:
+        ctb_path = (
+            pathlib.Path(__file__).parent.parent
+            / "file_formats"
+            / "tests"
+            / "stairs.ctb"
+        )
+        sliced_model_file = CTBFile.read(ctb_path)
+        with tempfile.TemporaryDirectory() as directory:
+            files_directory = pathlib.Path(directory)
+            for filename in ["indexed.ctb", "changed.ctb", "new.ctb"]:
+                shutil.copy(ctb_path, files_directory / filename)
+            self.metadata_index.put(
+                str(files_directory / "indexed.ctb"),
+                FileFingerprint.from_path(files_directory / "indexed.ctb"),
+                sliced_model_file,
+            )
+            self.metadata_index.put(
+                str(files_directory / "changed.ctb"),
+                FileFingerprint(size=0, mtime_ns=0),
+                sliced_model_file,
+            )
+            self.metadata_index.put(
+                str(files_directory / "deleted.ctb"),
+                FileFingerprint(size=0, mtime_ns=0),
+                sliced_model_file,
+            )
+
+            with patch(
+                "mariner.config.get_files_directory", return_value=files_directory
+            ):
+                CacheBootstrapper(num_processes=1, keep_running=False).run()
+
+            read_cached_sliced_model_file_mock.assert_has_calls(
+                [
+                    call(files_directory / "changed.ctb", ANY),
+                    call(files_directory / "new.ctb", ANY),
+                ],
+                any_order=True,
+            )
+            self.assertEqual(read_cached_sliced_model_file_mock.call_count, 2)
+            self.assertEqual(
+                set(self.metadata_index.get_fingerprints().keys()),
+                {
+                    str(files_directory / "indexed.ctb"),
+                    str(files_directory / "changed.ctb"),
+                },
+            )
+
+        status = self.cache_work_queue.get_status()
+        self.assertEqual(status["total_files"], 2)
+        self.assertEqual(status["skipped_files"], 1)
+
+    @patch("mariner.server.HEARTBEAT_INTERVAL_SECS", 0.01)
+    @patch("mariner.server.get_cached_preview_path")
+    @patch("mariner.server.read_cached_sliced_model_file")
+    def test_workers_stay_live_while_caching_large_files(
+        self,
+        read_cached_sliced_model_file_mock: MagicMock,
+        get_cached_preview_path_mock: MagicMock,
+    ) -> None:
+        now = [time.time()]
+        is_live_while_caching: List[bool] = []
+
+        def _cache_slowly(path: pathlib.Path, fingerprint: FileFingerprint) -> None:
+            # the file takes longer than the heartbeat timeout to be parsed
+            now[0] += HEARTBEAT_TIMEOUT_SECS + 1
+            deadline = time.monotonic() + 5.0
+            while (
+                not self.cache_work_queue.has_live_workers()
+                and time.monotonic() < deadline
+            ):
+                time.sleep(0.01)
+            is_live_while_caching.append(self.cache_work_queue.has_live_workers())
+
+        read_cached_sliced_model_file_mock.side_effect = _cache_slowly
+        ctb_path = (
+            pathlib.Path(__file__).parent.parent
+            / "file_formats"
+            / "tests"
+            / "stairs.ctb"
+        )
+        # the queue's module is shadowed by the queue itself in mariner.server
+        cache_work_queue_module = importlib.import_module(
+            "mariner.server.cache_work_queue"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            files_directory = pathlib.Path(directory)
+            shutil.copy(ctb_path, files_directory / "large.ctb")
+            with patch(
+                "mariner.config.get_files_directory", return_value=files_directory
+            ), patch.object(cache_work_queue_module, "time", Mock(time=lambda: now[0])):
+                CacheBootstrapper(num_processes=1, keep_running=False).run()
+
+        self.assertEqual(is_live_while_caching, [True])
+
+    @patch("mariner.server.multiprocessing.Process")
+    def test_dead_workers_are_restarted(self, process_mock: MagicMock) -> None:
+        (alive_worker, dead_worker, new_worker) = (
+            MagicMock(),
+            MagicMock(),
+            MagicMock(),
+        )
+        alive_worker.is_alive.return_value = True
+        dead_worker.is_alive.return_value = False
+        dead_worker.name = "cache-worker-1"
+        dead_worker.exitcode = -9
+        process_mock.return_value = new_worker
+        workers = [alive_worker, dead_worker]
+
+        with self.assertLogs("mariner.server", "WARNING"):
+            CacheBootstrapper(num_processes=2)._restart_dead_workers(workers)
+
+        self.assertEqual(workers, [alive_worker, new_worker])
+        process_mock.assert_called_once_with(
+            target=ANY, args=(True,), name="cache-worker-1", daemon=True
+        )
+        new_worker.start.assert_called_once_with()
+
+    def test_apply_file_changes(self) -> None:
+        files_directory = pathlib.Path("/mnt/usb_share")
+        self.cache_work_queue.start_run(["broken.ctb", "deleted.ctb"], 0)
+        self.cache_work_queue.claim()
+        self.cache_work_queue.finish("broken.ctb", 1.0, "ValueError()")
+        self.metadata_index.put(
+            str(files_directory / "deleted.ctb"),
+            FileFingerprint(size=0, mtime_ns=0),
+            CTBFile.read(
+                pathlib.Path(__file__).parent.parent
+                / "file_formats"
+                / "tests"
+                / "stairs.ctb"
+            ),
+        )
+
+        with patch("mariner.config.get_files_directory", return_value=files_directory):
+            _apply_file_changes(
+                FileChanges(changed=["broken.ctb", "new.ctb"], deleted=["deleted.ctb"])
+            )
+
+        self.assertEqual(self.metadata_index.get_fingerprints(), {})
+        self.assertEqual(self.cache_work_queue.claim(), "broken.ctb")
+        self.assertEqual(self.cache_work_queue.claim(), "new.ctb")
+        self.assertIsNone(self.cache_work_queue.claim())
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 from pyexpect import expect
@@ -17,11 +18,15 @@ class ConfigurationTest(TestCase):
         expect(config.get_printer_display_name()).to_equal(None)
         expect(config.get_printer_serial_port()).to_equal("/dev/serial0")
         expect(config.get_printer_baudrate()).to_equal(115200)
+        expect(config.get_printer_status_poll_interval_secs()).to_equal(2.0)
 
         expect(config.get_http_host()).to_equal("0.0.0.0")
         expect(config.get_http_port()).to_equal(5050)
+        expect(config.get_http_threads()).to_equal(16)
 
         expect(config.get_cache_directory()).to_equal("/tmp/mariner/")
+        expect(config.get_cache_bootstrapper_processes()).to_equal(os.cpu_count() or 1)
+        expect(config.get_cache_max_size_mb()).to_equal(256)
 
     def test_can_customize_files_directory(self) -> None:
         self.fs.create_file(
@@ -40,11 +45,13 @@ files_directory = "/var/mariner"
 display_name = "Elegoo Mars"
 serial_port = "/dev/ttyUSB0"
 baudrate = 9600
+status_poll_interval_secs = 0.5
             """,
         )
         expect(config.get_printer_display_name()).to_equal("Elegoo Mars")
         expect(config.get_printer_serial_port()).to_equal("/dev/ttyUSB0")
         expect(config.get_printer_baudrate()).to_equal(9600)
+        expect(config.get_printer_status_poll_interval_secs()).to_equal(0.5)
 
     def test_can_customize_http_settings(self) -> None:
         self.fs.create_file(
@@ -53,10 +60,12 @@ baudrate = 9600
 [http]
 host = "127.0.0.1"
 port = 80
+threads = 8
             """,
         )
         expect(config.get_http_host()).to_equal("127.0.0.1")
         expect(config.get_http_port()).to_equal(80)
+        expect(config.get_http_threads()).to_equal(8)
 
     def test_can_customize_cache_settings(self) -> None:
         self.fs.create_file(
@@ -64,6 +73,10 @@ port = 80
             contents="""
 [cache]
 directory = "/dev/shm/mariner/"
+bootstrapper_processes = 2
+max_size_mb = 64
             """,
         )
         expect(config.get_cache_directory()).to_equal("/dev/shm/mariner/")
+        expect(config.get_cache_bootstrapper_processes()).to_equal(2)
+        expect(config.get_cache_max_size_mb()).to_equal(64)
@@ -6,7 +6,12 @@ import serial
 from pyexpect import expect
 
 from mariner.exceptions import UnexpectedPrinterResponse
-from mariner.printer import ChiTuPrinter, PrinterState
+from mariner.printer import (
+    ChiTuPrinter,
+    MAX_RESPONSE_LINES,
+    PrinterState,
+    RESPONSE_DEADLINE_SECS,
+)
 
 
 class ChiTuPrinterTest(TestCase):
@@ -130,6 +135,67 @@ class ChiTuPrinterTest(TestCase):
         expect(print_status.current_byte).to_equal(5957675)
         expect(print_status.total_bytes).to_equal(11494803)
 
+    def test_get_print_status_skips_unsolicited_lines(self) -> None:
+        self.serial_port_mock.readline.side_effect = [
+            b"ok N:0\r\n",
+            b"ok B:0/0 X:0.000 Y:0.000 Z:0.100 F:256/256 D:76903/11494803/0 \r\n",
+        ]
+
+        self.printer.open()
+        print_status = self.printer.get_print_status()
+        self.printer.close()
+
+        expect(print_status.state).to_equal(PrinterState.PRINTING)
+        expect(print_status.current_byte).to_equal(76903)
+        expect(self.printer.pop_unsolicited_lines()).to_equal(["ok N:0\r\n"])
+        expect(self.printer.pop_unsolicited_lines()).to_equal([])
+
+    def test_response_is_returned_once_complete(self) -> None:
+        self.serial_port_mock.readline.side_effect = [
+            b"ok 'LittleBBC.ctb'\r\n",
+            b"ok N:0\r\n",
+        ]
+
+        self.printer.open()
+        selected_file = self.printer.get_selected_file()
+        self.printer.close()
+
+        # we shouldn't wait for any more data once we got the response
+        expect(selected_file).equals("LittleBBC.ctb")
+        expect(self.serial_port_mock.readline.call_count).to_equal(1)
+        self.serial_port_mock.read.assert_not_called()
+
+    def test_incomplete_response(self) -> None:
+        self.serial_port_mock.readline.side_effect = [b"ok B:0/0 X:0.0"]
+
+        self.printer.open()
+        with self.assertRaises(UnexpectedPrinterResponse):
+            self.printer.get_print_status()
+        self.printer.close()
+
+    def test_endless_response(self) -> None:
+        self.serial_port_mock.readline.return_value = b"echo: busy\r\n"
+
+        self.printer.open()
+        with self.assertRaises(UnexpectedPrinterResponse):
+            self.printer.get_selected_file()
+        self.printer.close()
+
+        expect(self.serial_port_mock.readline.call_count).to_equal(MAX_RESPONSE_LINES)
+
+    def test_response_past_deadline(self) -> None:
+        self.serial_port_mock.readline.return_value = b"echo: busy\r\n"
+
+        self.printer.open()
+        with patch(
+            "mariner.printer.time.monotonic",
+            side_effect=[0.0, 0.0, 0.0, RESPONSE_DEADLINE_SECS],
+        ), self.assertRaises(UnexpectedPrinterResponse):
+            self.printer.get_selected_file()
+        self.printer.close()
+
+        expect(self.serial_port_mock.readline.call_count).to_equal(2)
+
     def test_get_z_pos(self) -> None:
         self.serial_port_mock.readline.return_value = (
             b"ok C: X:0.000000 Y:0.000000 Z:155.000000 E:0.000000\r\n"
@@ -163,22 +229,22 @@ class ChiTuPrinterTest(TestCase):
         expect(selected_file).equals("subdir/LittleBBC.ctb")
 
     def test_select_file(self) -> None:
-        self.serial_port_mock.readline.return_value = (
-            # FIXME: this isn't right, readline would return only the first one
-            b"File opened:lattice.ctb Size:26058253\r\nFile selected\r\nok N:0\r\n"
-        )
+        self.serial_port_mock.readline.side_effect = [
+            b"File opened:lattice.ctb Size:26058253\r\n",
+            b"File selected\r\n",
+            b"ok N:0\r\n",
+        ]
         self.printer.open()
         self.printer.select_file("lattice.ctb")
         self.printer.close()
         self.serial_port_mock.write.assert_called_once_with(b"M23 /lattice.ctb\r\n")
 
     def test_select_nonexisting_file(self) -> None:
-        self.serial_port_mock.readline.return_value = (
-            # FIXME: this isn't right, readline would return only the first one
-            b"//############Error!cann't open file foobar.ctb!\r\n"
-            + b"open failed, File :foobar.ctb\r\n"
-            + b"ok N:0\r\n"
-        )
+        self.serial_port_mock.readline.side_effect = [
+            b"//############Error!cann't open file foobar.ctb!\r\n",
+            b"open failed, File :foobar.ctb\r\n",
+            b"ok N:0\r\n",
+        ]
         self.printer.open()
         with self.assertRaises(UnexpectedPrinterResponse):
             self.printer.select_file("foobar.ctb")
@@ -193,10 +259,10 @@ class ChiTuPrinterTest(TestCase):
         self.printer.close()
 
     def test_stop_printing_when_not_printing(self) -> None:
-        self.serial_port_mock.readline.return_value = (
-            # FIXME: this isn't right, readline would return only the first one
-            b"Error:It's not printing now!\r\nok N:0\r\n"
-        )
+        self.serial_port_mock.readline.side_effect = [
+            b"Error:It's not printing now!\r\n",
+            b"ok N:0\r\n",
+        ]
         self.printer.open()
         with self.assertRaises(UnexpectedPrinterResponse):
             self.printer.stop_printing()
@@ -206,6 +272,8 @@ class ChiTuPrinterTest(TestCase):
     def test_start_printing(self) -> None:
         self.serial_port_mock.readline.side_effect = [
             b"File opened:/benchy.ctb Size:11494803\r\n",
+            b"File selected\r\n",
+            b"ok N:0\r\n",
             b"ok N:0\r\n",
         ]
         self.printer.open()
@@ -221,6 +289,8 @@ class ChiTuPrinterTest(TestCase):
     def test_start_printing_from_subdirectory(self) -> None:
         self.serial_port_mock.readline.side_effect = [
             b"File opened:/more/model.ctb Size:11494803\r\n",
+            b"File selected\r\n",
+            b"ok N:0\r\n",
             b"ok N:0\r\n",
         ]
         self.printer.open()
@@ -236,7 +306,10 @@ class ChiTuPrinterTest(TestCase):
     def test_start_printing_with_invalid_response(self) -> None:
         self.serial_port_mock.readline.side_effect = [
             b"File opened:/benchy.ctb Size:11494803\r\n",
+            b"File selected\r\n",
+            b"ok N:0\r\n",
             b"foobar\r\n",
+            b"",
         ]
         self.printer.open()
         with self.assertRaises(UnexpectedPrinterResponse):
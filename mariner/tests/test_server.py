@@ -1,13 +1,16 @@
+import base64
 import hashlib
 import io
+import json
 import os
 import pathlib
+from typing import List
 from unittest.mock import patch, ANY, Mock
 
+import png
 from freezegun import freeze_time
 from pyexpect import expect
 from pyfakefs.fake_filesystem_unittest import TestCase
-from werkzeug.datastructures import FileStorage
 
 from mariner import config
 from mariner.exceptions import UnexpectedPrinterResponse
@@ -16,8 +19,13 @@ from mariner.printer import (
     PrinterState,
     PrintStatus,
 )
+from mariner.server.api import UPLOADED_FILE_MODE
 from mariner.server.app import app
-from mariner.server.utils import read_cached_sliced_model_file
+from mariner.server.cache_work_queue import CacheWorkQueue
+from mariner.server.metadata_index import FileFingerprint, MetadataIndex
+from mariner.server.utils import get_preview_version, sliced_model_file_memory_cache
+from mariner.server.print_status_poller import PrintStatusPoller
+from mariner.server.printer_connection import PrinterConnection
 
 
 class MarinerServerTest(TestCase):
@@ -51,23 +59,46 @@ class MarinerServerTest(TestCase):
         app.config["WTF_CSRF_ENABLED"] = False
 
         self.printer_mock = Mock(spec=ChiTuPrinter)
-        self.printer_patcher = patch("mariner.server.api.ChiTuPrinter")
-        printer_constructor_mock = self.printer_patcher.start()
-        printer_constructor_mock.return_value = self.printer_mock
-        self.printer_mock.__enter__ = Mock(return_value=self.printer_mock)
-        self.printer_mock.__exit__ = Mock(return_value=None)
+        self.printer_mock.pop_unsolicited_lines.return_value = []
+        self.printer_connection = PrinterConnection(lambda: self.printer_mock)
+        self.printer_patcher = patch(
+            "mariner.server.api.printer_connection", self.printer_connection
+        )
+        self.printer_patcher.start()
+        self.print_status_poller = PrintStatusPoller(self.printer_connection, 60.0)
+        self.print_status_poller_patcher = patch(
+            "mariner.server.api.print_status_poller", self.print_status_poller
+        )
+        self.print_status_poller_patcher.start()
 
-        # this is so we don't try caching the values returned by this function during
-        # tests. this is important because during tests this function returns a Mock,
-        # which pickle cannot serialize.
-        self._read_ctb_file_patcher = patch(
-            "mariner.server.api.read_cached_sliced_model_file",
-            side_effect=read_cached_sliced_model_file.__wrapped__,
+        # the metadata index is kept in memory during tests, since sqlite can't see
+        # the fake filesystem
+        self.metadata_index = MetadataIndex(":memory:")
+        self.metadata_index_patcher = patch(
+            "mariner.server.utils.metadata_index", self.metadata_index
+        )
+        self.metadata_index_patcher.start()
+        sliced_model_file_memory_cache.clear()
+        self.cache_work_queue = CacheWorkQueue(":memory:")
+        self.cache_work_queue_patcher = patch(
+            "mariner.server.api.cache_work_queue", self.cache_work_queue
+        )
+        self.cache_work_queue_patcher.start()
+        self.utils_cache_work_queue_patcher = patch(
+            "mariner.server.utils.cache_work_queue", self.cache_work_queue
         )
-        self._read_ctb_file_patcher.start()
+        self.utils_cache_work_queue_patcher.start()
 
     def tearDown(self) -> None:
+        self.utils_cache_work_queue_patcher.stop()
+        self.cache_work_queue_patcher.stop()
+        self.cache_work_queue.close()
+        self.metadata_index_patcher.stop()
+        self.metadata_index.close()
+        self.print_status_poller_patcher.stop()
+        self.print_status_poller.stop()
         self.printer_patcher.stop()
+        self.printer_connection.stop()
 
     def test_print_status_while_printing(self) -> None:
         self.printer_mock.get_selected_file.return_value = "foobar.ctb"
@@ -81,6 +112,7 @@ class MarinerServerTest(TestCase):
             {
                 "state": "PRINTING",
                 "selected_file": "foobar.ctb",
+                "status_age_secs": ANY,
                 "progress": 32.25,
                 "layer_count": 400,
                 "current_layer": 130,
@@ -89,6 +121,27 @@ class MarinerServerTest(TestCase):
             }
         )
 
+    def test_print_status_within_a_layer(self) -> None:
+        self.printer_mock.get_selected_file.return_value = "foobar.ctb"
+        self.printer_mock.get_print_status.return_value = PrintStatus(
+            state=PrinterState.PRINTING,
+            current_byte=256894,
+            total_bytes=832745,
+        )
+        response = self.client.get("/api/print_status")
+        expect(response.get_json()).to_equal(
+            {
+                "state": "PRINTING",
+                "selected_file": "foobar.ctb",
+                "status_age_secs": ANY,
+                "progress": 32.3,
+                "layer_count": 400,
+                "current_layer": 130,
+                "print_time_secs": 5621,
+                "time_left_secs": 3805,
+            }
+        )
+
     def test_print_status_when_paused(self) -> None:
         self.printer_mock.get_selected_file.return_value = "foobar.ctb"
         self.printer_mock.get_print_status.return_value = PrintStatus(
@@ -101,6 +154,7 @@ class MarinerServerTest(TestCase):
             {
                 "state": "PAUSED",
                 "selected_file": "foobar.ctb",
+                "status_age_secs": ANY,
                 "progress": 32.25,
                 "layer_count": 400,
                 "current_layer": 130,
@@ -121,6 +175,7 @@ class MarinerServerTest(TestCase):
             {
                 "state": "STARTING_PRINT",
                 "selected_file": "foobar.ctb",
+                "status_age_secs": ANY,
                 "progress": 0.0,
                 "layer_count": 400,
                 "current_layer": 1,
@@ -141,10 +196,54 @@ class MarinerServerTest(TestCase):
             {
                 "state": "IDLE",
                 "selected_file": "foobar.ctb",
+                "status_age_secs": ANY,
                 "progress": 0.0,
             }
         )
 
+    def test_print_status_is_served_from_snapshot(self) -> None:
+        self.printer_mock.get_selected_file.return_value = "foobar.ctb"
+        self.printer_mock.get_print_status.return_value = PrintStatus(
+            state=PrinterState.IDLE,
+            current_byte=0,
+            total_bytes=0,
+        )
+        for _ in range(0, 3):
+            response = self.client.get("/api/print_status")
+            expect(response.get_json()["state"]).to_equal("IDLE")
+        self.printer_mock.get_print_status.assert_called_once_with()
+
+        self.client.post("/api/printer/command/pause_print")
+        self.client.get("/api/print_status")
+        expect(self.printer_mock.get_print_status.call_count).to_equal(2)
+
+    def test_print_status_stream(self) -> None:
+        self.printer_mock.get_selected_file.return_value = "foobar.ctb"
+        self.printer_mock.get_print_status.return_value = PrintStatus(
+            state=PrinterState.PRINTING,
+            current_byte=256537,
+            total_bytes=832745,
+        )
+        response = self.client.get("/api/print_status/stream", buffered=False)
+        expect(response.mimetype).to_equal("text/event-stream")
+        event = next(response.response).decode()
+        response.close()
+
+        expect(event).to_start_with("data: ")
+        expect(event).to_end_with("\n\n")
+        expect(json.loads(event.replace("data: ", "", 1))).to_equal(
+            {
+                "state": "PRINTING",
+                "selected_file": "foobar.ctb",
+                "status_age_secs": ANY,
+                "progress": 32.25,
+                "layer_count": 400,
+                "current_layer": 130,
+                "print_time_secs": 5621,
+                "time_left_secs": 3808,
+            }
+        )
+
     def test_list_files(self) -> None:
         self.fs.create_dir("/mnt/usb_share/subdir/")
         with freeze_time("2020-03-15"):
@@ -165,6 +264,8 @@ class MarinerServerTest(TestCase):
                 "/mnt/usb_share/case.CtB",
                 contents=self.ctb_file_contents,
             )
+        # an upload which is still in progress
+        self.fs.create_file("/mnt/usb_share/.f8a9c2.tmp", contents="partial")
 
         response = self.client.get("/api/list_files")
         expect(response.get_json()).to_equal(
@@ -211,9 +312,35 @@ class MarinerServerTest(TestCase):
                         "can_be_printed": True,
                     },
                 ],
+                "total_files": 7,
+                "next_offset": None,
             }
         )
 
+    def test_list_files_queues_uncached_files(self) -> None:
+        self.cache_work_queue.start_run(["other.ctb"], skipped_count=0)
+        with patch.object(self.cache_work_queue, "has_live_workers", return_value=True):
+            response = self.client.get("/api/list_files")
+        expect(
+            [
+                file
+                for file in response.get_json()["files"]
+                if file["path"] == "foobar.ctb"
+            ]
+        ).to_equal(
+            [
+                {
+                    "filename": "foobar.ctb",
+                    "path": "foobar.ctb",
+                    "can_be_printed": True,
+                    "pending": True,
+                }
+            ]
+        )
+        # files needed by requests jump ahead of everything else
+        expect(self.cache_work_queue.claim()).to_equal("foobar.ctb")
+        expect(self.cache_work_queue.claim()).to_equal("other.ctb")
+
     def test_list_files_under_subdirectory(self) -> None:
         self.fs.create_dir("/mnt/usb_share/foo/bar/subdir/")
         self.fs.create_file(
@@ -241,9 +368,134 @@ class MarinerServerTest(TestCase):
                         "can_be_printed": True,
                     },
                 ],
+                "total_files": 2,
+                "next_offset": None,
             }
         )
 
+    def test_list_files_pagination(self) -> None:
+        self.fs.remove("/mnt/usb_share/._foobar.ctb")
+        self.fs.create_dir("/mnt/usb_share/subdir/")
+        for (i, filename) in enumerate(["a.ctb", "b.ctb", "c.ctb"]):
+            with freeze_time(f"2020-03-{15 + i}"):
+                self.fs.create_file(
+                    f"/mnt/usb_share/{filename}", contents=self.ctb_file_contents
+                )
+
+        response = self.client.get(
+            "/api/list_files?extensions=ctb&sort_by=name&limit=2"
+        )
+        expect(response.get_json()).to_equal(
+            {
+                "directories": [{"dirname": "subdir"}],
+                "files": [
+                    {
+                        "filename": "a.ctb",
+                        "path": "a.ctb",
+                        "print_time_secs": 5621,
+                        "can_be_printed": True,
+                    },
+                    {
+                        "filename": "b.ctb",
+                        "path": "b.ctb",
+                        "print_time_secs": 5621,
+                        "can_be_printed": True,
+                    },
+                ],
+                "total_files": 4,
+                "next_offset": 2,
+            }
+        )
+
+        # directories only come along with the first page
+        response = self.client.get(
+            "/api/list_files?extensions=ctb&sort_by=name&limit=2&offset=2"
+        )
+        expect(response.get_json()["directories"]).to_equal([])
+        expect([file["filename"] for file in response.get_json()["files"]]).to_equal(
+            ["c.ctb", "foobar.ctb"]
+        )
+        expect(response.get_json()["next_offset"]).to_equal(None)
+
+    def test_list_files_sorting(self) -> None:
+        self.fs.remove("/mnt/usb_share/._foobar.ctb")
+        self.fs.create_file(
+            "/mnt/usb_share/large.ctb", contents=self.ctb_file_contents + b"\0"
+        )
+        self.fs.create_file("/mnt/usb_share/notes.txt", contents="not sliced")
+
+        def list_filenames(query: str) -> List[str]:
+            response = self.client.get(f"/api/list_files?{query}")
+            expect(response.status_code).to_equal(200)
+            return [file["filename"] for file in response.get_json()["files"]]
+
+        expect(list_filenames("sort_by=name")).to_equal(
+            ["foobar.ctb", "large.ctb", "notes.txt"]
+        )
+        expect(list_filenames("sort_by=name&order=desc")).to_equal(
+            ["notes.txt", "large.ctb", "foobar.ctb"]
+        )
+        expect(list_filenames("sort_by=size")).to_equal(
+            ["large.ctb", "foobar.ctb", "notes.txt"]
+        )
+        # files without a print time go last
+        expect(list_filenames("sort_by=print_time&order=asc")).to_equal(
+            ["foobar.ctb", "large.ctb", "notes.txt"]
+        )
+        expect(list_filenames("extensions=.TXT")).to_equal(["notes.txt"])
+
+    def test_list_files_with_invalid_parameters(self) -> None:
+        for query in [
+            "sort_by=color",
+            "order=random",
+            "limit=-1",
+            "offset=abc",
+        ]:
+            response = self.client.get(f"/api/list_files?{query}")
+            expect(response.status_code).to_equal(400)
+
+    def test_search(self) -> None:
+        self.fs.create_dir("/mnt/usb_share/foo/")
+        self.fs.create_file(
+            "/mnt/usb_share/foo/stairs.ctb", contents=self.ctb_file_contents
+        )
+        # only files which were indexed already show up
+        response = self.client.get("/api/search?name=stairs")
+        expect(response.get_json()).to_equal(
+            {"files": [], "total_files": 0, "next_offset": None}
+        )
+
+        self.client.get("/api/list_files?path=foo")
+        self.client.get("/api/list_files")
+        response = self.client.get(
+            "/api/search?name=STAIRS&printer_name=mars&layer_height_mm=0.05"
+            + "&min_print_time_secs=5000&max_print_time_secs=6000"
+        )
+        expect(response.get_json()).to_equal(
+            {
+                "files": [
+                    {
+                        "filename": "stairs.ctb",
+                        "path": "foo/stairs.ctb",
+                        "print_time_secs": 5621,
+                        "layer_height_mm": 0.05,
+                        "printer_name": "ELEGOO MARS Pro",
+                        "slicer_version": "1.6.5.1",
+                        "can_be_printed": True,
+                    }
+                ],
+                "total_files": 1,
+                "next_offset": None,
+            }
+        )
+
+        response = self.client.get("/api/search?limit=1")
+        expect(response.get_json()["total_files"]).to_equal(2)
+        expect(response.get_json()["next_offset"]).to_equal(1)
+
+        response = self.client.get("/api/search?layer_height_mm=thin")
+        expect(response.status_code).to_equal(400)
+
     def test_list_files_from_invalid_directory(self) -> None:
         response = self.client.get("/api/list_files?path=../foo/")
         expect(response.status_code).to_equal(400)
@@ -291,6 +543,94 @@ class MarinerServerTest(TestCase):
         expect(response.get_json()).to_equal({"success": True})
         self.printer_mock.reboot.assert_called_once_with()
 
+    def test_print_status_is_conditional(self) -> None:
+        self.printer_mock.get_selected_file.return_value = "foobar.ctb"
+        self.printer_mock.get_print_status.return_value = PrintStatus(
+            state=PrinterState.IDLE
+        )
+        response = self.client.get("/api/print_status")
+        etag = response.headers["ETag"]
+        expect(etag).to_start_with('W/"')
+        expect(response.headers["Cache-Control"]).to_equal("no-cache")
+
+        # polling the printer again doesn't change anything if it's still idle
+        self.print_status_poller.invalidate()
+        response = self.client.get("/api/print_status", headers={"If-None-Match": etag})
+        expect(response.status_code).to_equal(304)
+        expect(response.data).to_equal(b"")
+
+        self.printer_mock.get_print_status.return_value = PrintStatus(
+            state=PrinterState.PRINTING,
+            current_byte=256537,
+            total_bytes=832745,
+        )
+        self.print_status_poller.invalidate()
+        response = self.client.get("/api/print_status", headers={"If-None-Match": etag})
+        expect(response.status_code).to_equal(200)
+        expect(response.get_json()["state"]).to_equal("PRINTING")
+
+    def test_list_files_is_conditional(self) -> None:
+        response = self.client.get("/api/list_files")
+        etag = response.headers["ETag"]
+
+        with patch(
+            "mariner.server.api.read_indexed_sliced_model_files"
+        ) as read_indexed_sliced_model_files_mock:
+            response = self.client.get(
+                "/api/list_files", headers={"If-None-Match": etag}
+            )
+        expect(response.status_code).to_equal(304)
+        # nothing gets looked up for directories which didn't change
+        read_indexed_sliced_model_files_mock.assert_not_called()
+
+        # the etag depends on how files are listed
+        response = self.client.get(
+            "/api/list_files?sort_by=name", headers={"If-None-Match": etag}
+        )
+        expect(response.status_code).to_equal(200)
+
+        self.fs.create_file("/mnt/usb_share/new.ctb", contents=self.ctb_file_contents)
+        response = self.client.get("/api/list_files", headers={"If-None-Match": etag})
+        expect(response.status_code).to_equal(200)
+        expect(response.headers["ETag"]).not_to_equal(etag)
+
+    def test_list_files_with_pending_files_has_no_etag(self) -> None:
+        self.cache_work_queue.start_run([], skipped_count=0)
+        with patch.object(self.cache_work_queue, "has_live_workers", return_value=True):
+            response = self.client.get("/api/list_files")
+        expect(response.status_code).to_equal(200)
+        expect("ETag" in response.headers).to_equal(False)
+
+    def test_file_details_is_conditional(self) -> None:
+        response = self.client.get("/api/file_details?filename=foobar.ctb")
+        etag = response.headers["ETag"]
+        last_modified = response.headers["Last-Modified"]
+
+        with patch(
+            "mariner.server.api.read_cached_sliced_model_file"
+        ) as read_cached_sliced_model_file_mock:
+            response = self.client.get(
+                "/api/file_details?filename=foobar.ctb",
+                headers={"If-None-Match": etag},
+            )
+            expect(response.status_code).to_equal(304)
+            response = self.client.get(
+                "/api/file_details?filename=foobar.ctb",
+                headers={"If-Modified-Since": last_modified},
+            )
+            expect(response.status_code).to_equal(304)
+        read_cached_sliced_model_file_mock.assert_not_called()
+
+        # re-uploading the file changes its fingerprint
+        self.fs.remove("/mnt/usb_share/foobar.ctb")
+        self.fs.create_file(
+            "/mnt/usb_share/foobar.ctb", contents=self.ctb_file_contents + b"\0"
+        )
+        response = self.client.get(
+            "/api/file_details?filename=foobar.ctb", headers={"If-None-Match": etag}
+        )
+        expect(response.status_code).to_equal(200)
+
     def test_file_details(self) -> None:
         response = self.client.get("/api/file_details?filename=foobar.ctb")
         expect(response.get_json()).to_equal(
@@ -303,6 +643,10 @@ class MarinerServerTest(TestCase):
                 "layer_height_mm": 0.05,
                 "resolution": [1440, 2560],
                 "print_time_secs": 5621,
+                "preview_version": get_preview_version(
+                    "/mnt/usb_share/foobar.ctb",
+                    FileFingerprint.from_path("/mnt/usb_share/foobar.ctb"),
+                ),
             }
         )
 
@@ -322,6 +666,7 @@ class MarinerServerTest(TestCase):
                 "layer_height_mm": 0.05,
                 "resolution": [1440, 2560],
                 "print_time_secs": 5621,
+                "preview_version": ANY,
             }
         )
 
@@ -333,7 +678,153 @@ class MarinerServerTest(TestCase):
         response = self.client.get("/api/file_preview?filename=foobar.ctb")
         expect(response.content_type).to_equal("image/png")
         expect(hashlib.md5(response.get_data()).hexdigest()).to_equal(
-            "ca98c806d42898ba70626e556f714928"
+            "7af0d3993a55b596a222b4aba430d8da"
+        )
+        expect(response.headers["Cache-Control"]).to_equal("no-cache")
+
+    def test_versioned_file_preview(self) -> None:
+        version = self.client.get("/api/file_details?filename=foobar.ctb").get_json()[
+            "preview_version"
+        ]
+        response = self.client.get(f"/api/file_preview?filename=foobar.ctb&v={version}")
+        expect(response.status_code).to_equal(200)
+        expect(hashlib.md5(response.get_data()).hexdigest()).to_equal(
+            "7af0d3993a55b596a222b4aba430d8da"
+        )
+        expect(response.headers["ETag"]).to_equal(f'"{version}"')
+        expect(response.cache_control.immutable).to_equal(True)
+        expect(response.cache_control.max_age).to_equal(365 * 24 * 60 * 60)
+
+        with patch("mariner.server.api.get_cached_preview_path") as get_path_mock:
+            response = self.client.get(
+                f"/api/file_preview?filename=foobar.ctb&v={version}",
+                headers={"If-None-Match": f'"{version}"'},
+            )
+        expect(response.status_code).to_equal(304)
+        get_path_mock.assert_not_called()
+
+        # urls for an older version of the file aren't cached for good
+        self.fs.remove("/mnt/usb_share/foobar.ctb")
+        self.fs.create_file(
+            "/mnt/usb_share/foobar.ctb", contents=self.ctb_file_contents + b"\0"
+        )
+        response = self.client.get(f"/api/file_preview?filename=foobar.ctb&v={version}")
+        expect(response.status_code).to_equal(200)
+        expect(response.headers["ETag"]).not_to_equal(f'"{version}"')
+        expect(response.cache_control.immutable).to_equal(False)
+
+    def test_file_preview_thumbnail(self) -> None:
+        response = self.client.get("/api/file_preview?filename=foobar.ctb&size=100")
+        expect(response.status_code).to_equal(200)
+        expect(response.content_type).to_equal("image/png")
+        (width, height, _, _) = png.Reader(bytes=response.get_data()).read()
+        expect((width, height)).to_equal((128, 80))
+
+        # thumbnails are told apart from the full size preview
+        full_size_etag = self.client.get(
+            "/api/file_preview?filename=foobar.ctb"
+        ).headers["ETag"]
+        expect(response.headers["ETag"]).not_to_equal(full_size_etag)
+
+        # sizes larger than any thumbnail get the full size preview
+        response = self.client.get("/api/file_preview?filename=foobar.ctb&size=4096")
+        expect(hashlib.md5(response.get_data()).hexdigest()).to_equal(
+            "7af0d3993a55b596a222b4aba430d8da"
+        )
+
+    def test_file_preview_with_invalid_size(self) -> None:
+        for size in ["0", "-1", "large"]:
+            response = self.client.get(
+                f"/api/file_preview?filename=foobar.ctb&size={size}"
+            )
+            expect(response.status_code).to_equal(400)
+
+    def test_file_previews(self) -> None:
+        self.fs.create_file(
+            "/mnt/usb_share/functional/stairs.ctb", contents=self.ctb_file_contents
+        )
+        # one of the previews is cached already
+        thumbnail = self.client.get(
+            "/api/file_preview?filename=foobar.ctb&size=128"
+        ).get_data()
+
+        response = self.client.get(
+            "/api/file_previews?filename=foobar.ctb&filename=functional/stairs.ctb"
+            + "&filename=missing.ctb&size=128"
+        )
+        expect(response.status_code).to_equal(200)
+        expect(response.content_type).to_equal("application/x-ndjson")
+        lines = [json.loads(line) for line in response.get_data().splitlines()]
+        expect(lines).to_equal(
+            [
+                {"path": "missing.ctb", "error": "File not found"},
+                {"path": "foobar.ctb", "preview_version": ANY, "data": ANY},
+                {"path": "functional/stairs.ctb", "preview_version": ANY, "data": ANY},
+            ]
+        )
+        expect(base64.b64decode(lines[1]["data"])).to_equal(thumbnail)
+        expect(base64.b64decode(lines[2]["data"])).to_equal(thumbnail)
+        expect(lines[1]["preview_version"]).to_equal(
+            self.client.get("/api/file_details?filename=foobar.ctb").get_json()[
+                "preview_version"
+            ]
+        )
+
+    def test_file_previews_with_a_broken_file(self) -> None:
+        self.fs.create_file("/mnt/usb_share/broken.ctb", contents=b"broken")
+        with self.assertLogs("mariner.server.api"):
+            response = self.client.get(
+                "/api/file_previews?filename=broken.ctb&filename=foobar.ctb"
+            )
+        lines = [json.loads(line) for line in response.get_data().splitlines()]
+        expect(sorted(line["path"] for line in lines)).to_equal(
+            ["broken.ctb", "foobar.ctb"]
+        )
+        for line in lines:
+            expect("error" in line).to_equal(line["path"] == "broken.ctb")
+
+    def test_file_previews_with_invalid_params(self) -> None:
+        for query in [
+            "",
+            "filename=../../etc/passwd",
+            "filename=foobar.ctb&size=0",
+            "&".join(["filename=foobar.ctb"] * 101),
+        ]:
+            response = self.client.get(f"/api/file_previews?{query}")
+            expect(response.status_code).to_equal(400)
+
+    def test_cache_status(self) -> None:
+        stats = self.client.get("/api/cache/status").get_json()["memory"][
+            "sliced_model_files"
+        ]
+        self.client.get("/api/file_details?filename=foobar.ctb")
+        self.client.get("/api/file_details?filename=foobar.ctb")
+        new_stats = self.client.get("/api/cache/status").get_json()["memory"][
+            "sliced_model_files"
+        ]
+        expect(new_stats["entries"]).to_equal(1)
+        expect(new_stats["hits"] - stats["hits"]).to_equal(1)
+        expect(new_stats["misses"] - stats["misses"]).to_equal(1)
+
+    def test_cache_bootstrap_status(self) -> None:
+        self.cache_work_queue.start_run(["a.ctb", "b.ctb"], skipped_count=3)
+        expect(self.cache_work_queue.claim()).to_equal("a.ctb")
+        self.cache_work_queue.finish("a.ctb", 1.5)
+        expect(self.cache_work_queue.claim()).to_equal("b.ctb")
+        response = self.client.get("/api/cache/status")
+        expect(response.get_json()["bootstrap"]).to_equal(
+            {
+                "state": "RUNNING",
+                "started_at": ANY,
+                "finished_at": None,
+                "total_files": 2,
+                "done_files": 1,
+                "failed_files": 0,
+                "skipped_files": 3,
+                "current_files": ["b.ctb"],
+                "slowest_files": [{"path": "a.ctb", "parse_time_secs": 1.5}],
+                "errors": [],
+            }
         )
 
     def test_file_preview_with_invalid_path(self) -> None:
@@ -354,35 +845,83 @@ class MarinerServerTest(TestCase):
         response = self.client.post("/api/upload_file", data=data)
         expect(response.status_code).to_equal(400)
 
+    def _get_uploaded_file_contents(self, filename: str) -> bytes:
+        with open(config.get_files_directory() / filename, "rb") as file:
+            return file.read()
+
     def test_upload_file(self) -> None:
         data = {"file": (io.BytesIO(b"abcdef"), "myfile.ctb")}
-        with patch.object(FileStorage, "save") as save_file_mock:
-            response = self.client.post("/api/upload_file", data=data)
+        response = self.client.post("/api/upload_file", data=data)
         expect(response.status_code).to_equal(200)
         expect(response.get_json()).to_equal({"success": True})
-        save_file_mock.assert_called_once_with(
-            str(config.get_files_directory() / "myfile.ctb")
-        )
+        expect(self._get_uploaded_file_contents("myfile.ctb")).to_equal(b"abcdef")
+        # the temporary file the upload was written to is gone
+        expect(
+            [
+                filename
+                for filename in os.listdir(config.get_files_directory())
+                if filename.endswith(".tmp")
+            ]
+        ).to_equal([])
+
+    def test_upload_file_replacing_existing_file(self) -> None:
+        self.client.get("/api/file_details?filename=foobar.ctb")
+        expect(self.metadata_index.get_fingerprints()).not_to_equal({})
+
+        inode = os.stat(config.get_files_directory() / "foobar.ctb").st_ino
+        data = {"file": (io.BytesIO(b"abcdef"), "foobar.ctb")}
+        response = self.client.post("/api/upload_file", data=data)
+        expect(response.status_code).to_equal(200)
+        expect(self.metadata_index.get_fingerprints()).to_equal({})
+        expect(self._get_uploaded_file_contents("foobar.ctb")).to_equal(b"abcdef")
+        # the old file is replaced instead of being truncated and written over
+        expect(
+            os.stat(config.get_files_directory() / "foobar.ctb").st_ino
+        ).not_to_equal(inode)
+
+    def test_upload_file_invalidates_cache_once_replaced(self) -> None:
+        contents_when_invalidated: List[bytes] = []
+        data = {"file": (io.BytesIO(b"abcdef"), "foobar.ctb")}
+        with patch(
+            "mariner.server.api.invalidate_cached_file",
+            side_effect=lambda path, fingerprint: contents_when_invalidated.append(
+                self._get_uploaded_file_contents("foobar.ctb")
+            ),
+        ):
+            response = self.client.post("/api/upload_file", data=data)
+        expect(response.status_code).to_equal(200)
+        expect(contents_when_invalidated).to_equal([b"abcdef"])
+
+    def test_upload_file_when_permissions_cannot_be_changed(self) -> None:
+        # such as on a vfat mount owned by a different user
+        chmod = os.chmod
+
+        def _chmod(path: str, mode: int) -> None:
+            # pyfakefs changes permissions of the files it creates as well
+            if mode == UPLOADED_FILE_MODE:
+                raise PermissionError()
+            chmod(path, mode)
+
+        data = {"file": (io.BytesIO(b"abcdef"), "myfile.ctb")}
+        with patch("mariner.server.api.os.chmod", side_effect=_chmod) as chmod_mock:
+            response = self.client.post("/api/upload_file", data=data)
+        chmod_mock.assert_any_call(ANY, UPLOADED_FILE_MODE)
+        expect(response.status_code).to_equal(200)
+        expect(self._get_uploaded_file_contents("myfile.ctb")).to_equal(b"abcdef")
 
     def test_upload_file_with_upper_case_extension(self) -> None:
         data = {"file": (io.BytesIO(b"abcdef"), "myfile.CtB")}
-        with patch.object(FileStorage, "save") as save_file_mock:
-            response = self.client.post("/api/upload_file", data=data)
+        response = self.client.post("/api/upload_file", data=data)
         expect(response.status_code).to_equal(200)
         expect(response.get_json()).to_equal({"success": True})
-        save_file_mock.assert_called_once_with(
-            str(config.get_files_directory() / "myfile.CtB")
-        )
+        expect(self._get_uploaded_file_contents("myfile.CtB")).to_equal(b"abcdef")
 
     def test_upload_file_with_sanitized_file(self) -> None:
         data = {"file": (io.BytesIO(b"abcdef"), "../../../etc/passwd.ctb")}
-        with patch.object(FileStorage, "save") as save_file_mock:
-            response = self.client.post("/api/upload_file", data=data)
+        response = self.client.post("/api/upload_file", data=data)
         expect(response.status_code).to_equal(200)
         expect(response.get_json()).to_equal({"success": True})
-        save_file_mock.assert_called_once_with(
-            str(config.get_files_directory() / "etc_passwd.ctb")
-        )
+        expect(self._get_uploaded_file_contents("etc_passwd.ctb")).to_equal(b"abcdef")
 
     def test_delete_file(self) -> None:
         expect(os.path.exists(config.get_files_directory() / "mariner.ctb")).to_equal(
@@ -402,6 +941,17 @@ class MarinerServerTest(TestCase):
             False
         )
 
+    def test_delete_file_invalidates_cached_metadata(self) -> None:
+        response = self.client.get("/api/file_details?filename=foobar.ctb")
+        expect(response.status_code).to_equal(200)
+        expect(list(self.metadata_index.get_fingerprints().keys())).to_equal(
+            ["/mnt/usb_share/foobar.ctb"]
+        )
+
+        response = self.client.post("/api/delete_file?filename=foobar.ctb")
+        expect(response.status_code).to_equal(200)
+        expect(self.metadata_index.get_fingerprints()).to_equal({})
+
     def test_delete_file_that_is_not_file(self) -> None:
         with patch("os.remove") as remove_mock:
             response = self.client.post("/api/delete_file?filename=mariner")